@@ -1,10 +1,16 @@
 # app/auth.py
+import logging
+
 from fastapi import APIRouter, Request, Form
 from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
+
+from .deps import LazyTemplates
+from . import tenants
+
+log = logging.getLogger(__name__)
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
+templates = LazyTemplates(directory="app/templates")
 
 
 @router.get("/login")
@@ -31,10 +37,13 @@ def login_post(request: Request,
     if username == ADMIN_USER and password == ADMIN_PASS:
         # Guardamos en la sesión que este usuario está autenticado
         request.session["admin"] = username
+        request.session["admin_tenant"] = tenants.current_tenant.get()
+        log.info("Login de admin")
         # Redirigimos al dashboard de admin
         return RedirectResponse(url="/admin", status_code=302)
     else:
         # Credenciales inválidas: devolvemos la página de login con mensaje de error
+        log.warning("Login fallido", extra={"client": request.client.host if request.client else ""})
         return templates.TemplateResponse(
             "login.html", 
             {"request": request, "error": "Usuario o contraseña inválidos."}
@@ -16,6 +16,18 @@ SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL") or f"sqlite:///{DEFAULT_SQLI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"check_same_thread": False}}
 
+# Pool de conexiones (Postgres / motores con servidor), por proceso: con N
+# workers de uvicorn el total es N * (DB_POOL_SIZE + DB_MAX_OVERFLOW), y
+# tiene que entrar en el max_connections del servidor
+DB_POOL_SIZE    = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))    # segundos esperando una conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # segundos; antes del corte por inactividad del proxy
+
 # Otros settings que puedas necesitar
 DEBUG = os.getenv("FLASK_DEBUG", "0") in ("1", "true", "True")
 SECRET_KEY = os.getenv("SECRET_KEY", "cámbiala_por_una_secreta_en_producción")
+
+# Mercado Pago
+MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN", "")
+BASE_URL = os.getenv("BASE_URL", "")
@@ -1,9 +1,28 @@
-from datetime import date
+import logging
+from datetime import date, datetime
 from sqlalchemy.orm import Session
 from . import models, schemas
 from typing import Optional, List, Dict
-from sqlalchemy import func, or_
-from .models import Student, Enrollment, Course
+from sqlalchemy import func, or_, select, update, delete, literal
+from .models import Student, Enrollment, Course, Checkout, JobState, PaymentLink
+from .services import audit, changefeed, pgbulk, propagation, rollups, versions
+
+log = logging.getLogger(__name__)
+
+# Tolerancia al comparar el monto cobrado con el del checkout
+AMOUNT_TOLERANCE = 0.01
+
+
+def dialect_insert(db: Session, model):
+    """
+    Devuelve un INSERT del dialecto activo (sqlite/postgresql), que soporta
+    ON CONFLICT DO NOTHING / DO UPDATE.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
 
 # -------- ESTUDIANTES --------
 def get_student(db: Session, student_id: int):
@@ -12,6 +31,13 @@ def get_student(db: Session, student_id: int):
 def list_students(db: Session):
     return db.query(models.Student).all()
 
+def iter_students(db: Session):
+    """
+    Alumnos (id, name, dni), traídos de a lotes con un cursor del servidor:
+    para listas largas sin armar un objeto por fila.
+    """
+    return pgbulk.stream_rows(db, select(Student.id, Student.name, Student.dni).order_by(Student.id))
+
 def create_student(db: Session, data: schemas.StudentCreate):
     s = models.Student(
         name=data.name,
@@ -20,6 +46,7 @@ def create_student(db: Session, data: schemas.StudentCreate):
         status=data.status
     )
     db.add(s)
+    versions.bump(db, "students")
     db.commit()
     db.refresh(s)
     return s
@@ -32,6 +59,7 @@ def update_student(db: Session, data: schemas.StudentUpdate):
         s.dni            = data.dni
         s.status         = data.status
         s.last_paid_date = data.last_paid_date  # <-- Consideramos la fecha de pago si se envía
+        versions.bump(db, "students")
         db.commit()
         db.refresh(s)
     return s
@@ -40,6 +68,9 @@ def delete_student(db: Session, student_id: int):
     s = get_student(db, student_id)
     if s:
         db.delete(s)
+        db.flush()
+        rollups.refresh_enrollment_counts(db)
+        versions.bump(db, "students", "enrollments", "payments", "checkouts")
         db.commit()
         return True
     return False
@@ -58,6 +89,7 @@ def create_course(db: Session, data: schemas.CourseCreate):
         monthly_fee=data.monthly_fee
     )
     db.add(c)
+    versions.bump(db, "courses")
     db.commit()
     db.refresh(c)
     return c
@@ -67,6 +99,7 @@ def update_course(db: Session, data: schemas.CourseUpdate):
     if c:
         c.title       = data.title
         c.monthly_fee = data.monthly_fee
+        versions.bump(db, "courses")
         db.commit()
         db.refresh(c)
     return c
@@ -75,6 +108,7 @@ def delete_course(db: Session, course_id: int):
     c = get_course(db, course_id)
     if c:
         db.delete(c)
+        versions.bump(db, "courses", "enrollments")
         db.commit()
         return True
     return False
@@ -87,6 +121,18 @@ def get_enrollment(db: Session, enrollment_id: int):
 def list_enrollments(db: Session):
     return db.query(models.Enrollment).all()
 
+def iter_enrollments(db: Session):
+    """
+    Inscripciones con el nombre del alumno y el título del taller en una
+    sola consulta (sin N+1), traídas de a lotes con un cursor del servidor.
+    """
+    return pgbulk.stream_rows(db, select(
+        Enrollment.id, Enrollment.status,
+        Student.name.label("student_name"), Course.title.label("course_title"),
+    ).join(Student, Student.id == Enrollment.student_id)
+     .join(Course, Course.id == Enrollment.course_id)
+     .order_by(Enrollment.id))
+
 def create_enrollment(db: Session, data: schemas.EnrollmentCreate):
     e = models.Enrollment(
         student_id=data.student_id,
@@ -94,6 +140,9 @@ def create_enrollment(db: Session, data: schemas.EnrollmentCreate):
         status=data.status
     )
     db.add(e)
+    db.flush()
+    rollups.refresh_enrollment_counts(db)
+    versions.bump(db, "enrollments")
     db.commit()
     db.refresh(e)
     return e
@@ -102,6 +151,9 @@ def delete_enrollment(db: Session, enrollment_id: int):
     e = get_enrollment(db, enrollment_id)
     if e:
         db.delete(e)
+        db.flush()
+        rollups.refresh_enrollment_counts(db)
+        versions.bump(db, "enrollments")
         db.commit()
         return True
     return False
@@ -119,15 +171,25 @@ def get_courses_for_student(db: Session, student_id: int):
 
 
 # -------- FACTURACIÓN (Due) --------
-def calculate_due_for_student(db: Session, student_id: int):
-    s = get_student(db, student_id)
-    if not s:
-        return 0.0, 0.0, 0.0
-    fees = [en.course.monthly_fee for en in s.enrollments]
-    subtotal = sum(fees)
-    today = date.today()
+def surcharge_for(day: date) -> float:
+    """
+    Recargo por pago fuera de término vigente en `day`.
+    """
     cutoff = date(2025, 6, 10)
-    surcharge = 2000.0 if today >= cutoff else 0.0
+    return 2000.0 if day >= cutoff else 0.0
+
+def calculate_due_for_student(db: Session, student_id: int):
+    # Cuota precalculada (services/propagation.py); si el alumno todavía no
+    # tiene fila, se suma como antes
+    dues = db.get(models.StudentDues, student_id)
+    if dues is not None:
+        subtotal = dues.subtotal
+    else:
+        s = get_student(db, student_id)
+        if not s:
+            return 0.0, 0.0, 0.0
+        subtotal = sum(en.course.monthly_fee for en in s.enrollments)
+    surcharge = surcharge_for(date.today())
     total = subtotal + surcharge
     return subtotal, surcharge, total
 
@@ -139,14 +201,17 @@ def calculate_next_month_due_for_student(db: Session, student_id: int):
 # -------- PAYMENTS (nuevo) --------
 def create_payment(db: Session, data: schemas.PaymentCreate):
     """
-    Crea un registro en la tabla 'payments' con un pago nuevo.
+    Crea un registro en la tabla 'payments' con un pago nuevo
+    (y lo suma a los agregados de recaudación).
     """
+    rollups.apply_payment(db, data.student_id, data.amount, data.paid_date)
     p = models.Payment(
         student_id = data.student_id,
         amount     = data.amount,
         paid_date  = data.paid_date
     )
     db.add(p)
+    versions.bump(db, "payments")
     db.commit()
     db.refresh(p)
     return p
@@ -158,34 +223,147 @@ def mark_student_paid(db: Session, student_id: int, paid_date: date):
     s = get_student(db, student_id)
     if s:
         s.last_paid_date = paid_date
+        versions.bump(db, "students")
         db.commit()
         db.refresh(s)
     return s
 
+# -------- PAGOS ONLINE (checkouts de Mercado Pago) --------
+def create_checkout(db: Session, student_id: int, external_reference: str, amount: float):
+    """
+    Registra un pago iniciado (preferencia creada). Si la referencia ya existe
+    y sigue pendiente, actualiza el monto.
+    """
+    stmt = dialect_insert(db, Checkout).values(
+        student_id=student_id,
+        external_reference=external_reference,
+        amount=amount,
+        created_at=datetime.utcnow(),
+        status="pending"
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["external_reference"],
+        set_={"amount": stmt.excluded.amount},
+        where=(Checkout.status == "pending")
+    )
+    db.execute(stmt)
+    versions.bump(db, "checkouts")
+    db.commit()
+
+def get_checkout_by_reference(db: Session, external_reference: str):
+    return db.query(Checkout).filter(Checkout.external_reference == external_reference).first()
+
+def list_pending_checkouts(db: Session) -> List[Checkout]:
+    # Los reemplazados también: si igual se pagan, el pago pasa a "review".
+    # Una consulta por estado: con IN sqlite deja de usar el índice de status
+    return [c for status in ("pending", "superseded")
+            for c in db.query(Checkout).filter(Checkout.status == status).all()]
+
+def record_checkout_payments(db: Session, confirmed: List[dict]) -> int:
+    """
+    Aplica pagos confirmados por el gateway en UNA transacción. Cada item trae
+    external_reference, gateway_payment_id, amount y paid_date.
+    Por cada checkout todavía pendiente: lo marca "approved", inserta el Payment
+    y actualiza Student.last_paid_date. Los ya aprobados se ignoran (idempotente).
+    Un pago menor al monto del checkout, o de un checkout reemplazado
+    ("superseded"), no salda la cuota: el checkout pasa a "review".
+    Devuelve la cantidad de pagos aplicados.
+    """
+    applied = 0
+    for item in confirmed:
+        chk = get_checkout_by_reference(db, item["external_reference"])
+        if chk is None or chk.status in ("approved", "review"):
+            continue
+        if chk.status == "superseded" or item["amount"] < chk.amount - AMOUNT_TOLERANCE:
+            db.execute(
+                update(Checkout)
+                .where(Checkout.id == chk.id, Checkout.status == chk.status)
+                .values(status="review", gateway_payment_id=str(item["gateway_payment_id"]))
+                .execution_options(synchronize_session=False)
+            )
+            log.warning("Pago no aplicado: queda para revisar",
+                        extra={"external_reference": chk.external_reference, "student_id": chk.student_id,
+                               "checkout_status": chk.status, "checkout_amount": chk.amount,
+                               "amount": item["amount"], "gateway_payment_id": item["gateway_payment_id"]})
+            continue
+        res = db.execute(
+            update(Checkout)
+            .where(Checkout.external_reference == item["external_reference"],
+                   Checkout.status == "pending")
+            .values(status="approved", gateway_payment_id=str(item["gateway_payment_id"]))
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount != 1:
+            continue
+        rollups.apply_payment(db, chk.student_id, item["amount"], item["paid_date"])
+        p = models.Payment(
+            student_id = chk.student_id,
+            amount     = item["amount"],
+            paid_date  = item["paid_date"]
+        )
+        db.add(p)
+        db.flush()
+        chk.payment_id = p.id
+        db.execute(
+            update(Student)
+            .where(Student.id == chk.student_id,
+                   or_(Student.last_paid_date.is_(None), Student.last_paid_date < item["paid_date"]))
+            .values(last_paid_date=item["paid_date"])
+            .execution_options(synchronize_session=False)
+        )
+        changefeed.record(db, "students", [chk.student_id])
+        # El link pregenerado de esa referencia ya no se ofrece para pagar
+        db.execute(
+            update(PaymentLink)
+            .where(PaymentLink.external_reference == item["external_reference"])
+            .values(status="paid")
+            .execution_options(synchronize_session=False)
+        )
+        applied += 1
+    versions.bump(db, "checkouts", "payments", "students", "payment_links")
+    db.commit()
+    return applied
+
+
+# -------- ESTADO DE TAREAS --------
+def get_job_state(db: Session, key: str) -> Optional[str]:
+    row = db.get(JobState, key)
+    return row.value if row else None
+
+def set_job_state(db: Session, key: str, value: str, commit: bool = True):
+    row = db.get(JobState, key)
+    if row:
+        row.value = value
+    else:
+        db.add(JobState(key=key, value=value))
+    if commit:
+        db.commit()
+
+
 def get_payments_summary(db: Session, course_id: Optional[int] = None) -> Dict[str, int]:
     """
     Devuelve conteos de estudiantes pagados vs no pagados.
     Si se pasa course_id, filtra sólo dentro de ese taller.
     """
-    q = db.query(Student)
-    if course_id is not None:
-        q = q.join(Enrollment).filter(Enrollment.course_id == course_id)
+    # count(DISTINCT id) en vez de DISTINCT de filas completas: se resuelve
+    # con los índices (last_paid_date / enrollments.course_id) sin leer la tabla
+    def count(cond):
+        q = select(func.count(func.distinct(Student.id))).select_from(Student).where(cond)
+        if course_id is not None:
+            q = q.join(Enrollment, Enrollment.student_id == Student.id).where(Enrollment.course_id == course_id)
+        return db.execute(q).scalar()
 
-    paid_count   = q.filter(Student.last_paid_date.isnot(None)).distinct().count()
-    unpaid_count = q.filter(Student.last_paid_date.is_(None)).distinct().count()
+    paid_count   = count(Student.last_paid_date.isnot(None))
+    unpaid_count = count(Student.last_paid_date.is_(None))
     return {"paid": paid_count, "unpaid": unpaid_count}
 
 
-def search_students(
-    db: Session,
-    name: Optional[str]        = None,
-    course_id: Optional[int]   = None,
-    paid: Optional[bool]       = None
-) -> List[Student]:
+def _filter_students(q, name: Optional[str] = None, course_id: Optional[int] = None,
+                     paid: Optional[bool] = None):
     """
-    Busca estudiantes por nombre (ILIKE), taller y estado de pago.
+    Aplica sobre `q` los filtros de búsqueda de estudiantes (nombre, taller, pago).
+    Lo comparten search_students y las operaciones masivas.
     """
-    q = db.query(Student)
     if name:
         q = q.filter(Student.name.ilike(f"%{name}%"))
     if course_id:
@@ -194,5 +372,119 @@ def search_students(
         q = q.filter(Student.last_paid_date.isnot(None))
     elif paid is False:
         q = q.filter(Student.last_paid_date.is_(None))
+    return q
 
+
+def search_students(
+    db: Session,
+    name: Optional[str]        = None,
+    course_id: Optional[int]   = None,
+    paid: Optional[bool]       = None
+) -> List[Student]:
+    """
+    Busca estudiantes por nombre (ILIKE), taller y estado de pago.
+    """
+    q = _filter_students(db.query(Student), name, course_id, paid)
     return q.order_by(Student.name).all()
+
+
+# -------- OPERACIONES MASIVAS --------
+def select_student_ids(
+    db: Session,
+    student_ids: Optional[List[int]] = None,
+    name: Optional[str]              = None,
+    course_id: Optional[int]         = None,
+    paid: Optional[bool]             = None
+):
+    """
+    Construye (sin ejecutar) un SELECT con los ids de estudiantes que cumplen
+    la lista explícita de ids y/o los filtros de search_students.
+    Se usa como subconsulta en los UPDATE/INSERT/DELETE masivos.
+    """
+    q = _filter_students(db.query(Student.id), name, course_id, paid)
+    if student_ids is not None:
+        q = q.filter(Student.id.in_(student_ids))
+    return q.subquery().select()
+
+
+def _fetch_ids(db: Session, ids) -> List[int]:
+    # La lista sirve de conteo (matched) y para el audit log de la operación
+    return db.execute(ids).scalars().all()
+
+
+def bulk_mark_paid(db: Session, ids, paid_date: date) -> Dict[str, int]:
+    """
+    Marca como pagados (last_paid_date) a todos los estudiantes de `ids`
+    con un único UPDATE en una sola transacción.
+    """
+    matched = _fetch_ids(db, ids)
+    res = db.execute(
+        update(Student)
+        .where(Student.id.in_(ids))
+        .values(last_paid_date=paid_date)
+        .execution_options(synchronize_session=False)
+    )
+    audit.record(db, "students", matched, "bulk_update", {"last_paid_date": paid_date})
+    changefeed.record(db, "students", matched)
+    versions.bump(db, "students")
+    db.commit()
+    return {"matched": len(matched), "affected": res.rowcount}
+
+def bulk_set_status(db: Session, ids, status: str) -> Dict[str, int]:
+    """
+    Cambia el status (p.ej. "egresado") de todos los estudiantes de `ids`.
+    """
+    matched = _fetch_ids(db, ids)
+    res = db.execute(
+        update(Student)
+        .where(Student.id.in_(ids))
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    audit.record(db, "students", matched, "bulk_update", {"status": status})
+    changefeed.record(db, "students", matched)
+    versions.bump(db, "students")
+    db.commit()
+    return {"matched": len(matched), "affected": res.rowcount}
+
+def bulk_enroll(db: Session, ids, course_id: int, status: str = "activo") -> Dict[str, int]:
+    """
+    Inscribe a todos los estudiantes de `ids` en el taller con un único
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING (las inscripciones existentes
+    no se tocan).
+    """
+    matched = _fetch_ids(db, ids)
+    stmt = dialect_insert(db, Enrollment).from_select(
+        ["student_id", "course_id", "status"],
+        select(Student.id, literal(course_id), literal(status)).where(Student.id.in_(ids))
+    ).on_conflict_do_nothing(index_elements=["student_id", "course_id"])
+    res = db.execute(stmt)
+    # Se audita por alumno: las inscripciones nuevas no devuelven su id
+    audit.record(db, "students", matched, "bulk_enroll", {"course_id": course_id, "status": status})
+    changefeed.record(db, "enrollments", db.execute(
+        select(Enrollment.id).where(Enrollment.course_id == course_id, Enrollment.student_id.in_(matched))
+    ).scalars().all())
+    propagation.touch(db, "enrollments", students=matched)
+    rollups.refresh_enrollment_counts(db)
+    versions.bump(db, "enrollments")
+    db.commit()
+    return {"matched": len(matched), "affected": res.rowcount}
+
+def bulk_unenroll(db: Session, ids, course_id: int) -> Dict[str, int]:
+    """
+    Da de baja del taller a todos los estudiantes de `ids` con un único DELETE.
+    """
+    matched = _fetch_ids(db, ids)
+    removed = db.execute(
+        delete(Enrollment)
+        .where(Enrollment.course_id == course_id, Enrollment.student_id.in_(ids))
+        .returning(Enrollment.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    changefeed.record(db, "enrollments", removed, "delete")
+    propagation.touch(db, "enrollments", students=matched)
+    audit.record(db, "students", matched, "bulk_unenroll", {"course_id": course_id})
+    rollups.refresh_enrollment_counts(db)
+    versions.bump(db, "enrollments")
+    db.commit()
+    return {"matched": len(matched), "affected": len(removed)}
@@ -5,11 +5,19 @@ Prioriza SQLite (archivo alma_paid.db en la raíz del repo) salvo que
 se indique explícitamente usar Postgres vía USE_POSTGRES=1 y DATABASE_URL.
 """
 
+import logging
 import os
 import pathlib
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import declarative_base, sessionmaker
-from .config import SQLALCHEMY_ENGINE_OPTIONS, SQLALCHEMY_DATABASE_URI
+from .config import (
+    SQLALCHEMY_ENGINE_OPTIONS, SQLALCHEMY_DATABASE_URI,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+)
+
+log = logging.getLogger(__name__)
 
 # Ruta base del repo (un nivel arriba de app/)
 BASE_DIR = pathlib.Path(__file__).resolve().parent.parent
@@ -39,18 +47,97 @@ else:
     # fallback a la configuración (config.py puede usar DATABASE_URL o sqlite por defecto)
     DATABASE_URL = SQLALCHEMY_DATABASE_URI or DEFAULT_SQLITE_URI
 
+def engine_options(url: str) -> dict:
+    """
+    Opciones de engine según el driver: check_same_thread es sólo de sqlite
+    (psycopg2 lo rechaza como opción de conexión); el tamaño del pool
+    (DB_POOL_*) sólo aplica a motores con servidor.
+    """
+    opts = dict(SQLALCHEMY_ENGINE_OPTIONS or {})
+    if not url.startswith("sqlite"):
+        opts.pop("connect_args", None)
+        opts.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=True)
+    return opts
+
 # Engine (pasa las engine options definidas en config)
-engine = create_engine(DATABASE_URL, **(SQLALCHEMY_ENGINE_OPTIONS or {}))
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 
 # Declarative base y session factory
 Base = declarative_base()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# DEBUG: imprime la DB que se está usando (ver logs de Render)
-try:
-    print(f"[database] Usando DB -> driver: {engine.url.drivername}, url: {str(engine.url)}")
-except Exception:
-    print("[database] Usando DB (no se pudo mostrar URL completa por seguridad).")
+
+# ---------- Réplicas de sólo lectura (opcional) ----------
+# DATABASE_REPLICA_URLS: URLs separadas por coma. Para probar en local con
+# copias del archivo sqlite:  sqlite:///file:/ruta/replica1.db?mode=ro&uri=true
+REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_CHECK_SECONDS    = float(os.getenv("REPLICA_CHECK_SECONDS", "10"))
+REPLICA_COOLDOWN_SECONDS = float(os.getenv("REPLICA_COOLDOWN_SECONDS", "30"))
+
+
+class ReplicaSet:
+    """
+    Reparte lecturas entre réplicas en round-robin, salteando las que fallan
+    el chequeo de salud (SELECT 1). Una réplica caída queda fuera durante
+    REPLICA_COOLDOWN_SECONDS; si no hay ninguna sana, pick() devuelve None
+    y se lee del primario.
+    """
+
+    def __init__(self, engines):
+        self.engines    = list(engines)
+        self.lock       = threading.Lock()
+        self.next_idx   = 0
+        self.down_until = [0.0] * len(self.engines)
+        self.checked_at = [0.0] * len(self.engines)
+
+    def _healthy(self, i: int, now: float) -> bool:
+        if now < self.down_until[i]:
+            return False
+        if now - self.checked_at[i] < REPLICA_CHECK_SECONDS:
+            return True
+        try:
+            with self.engines[i].connect() as conn:
+                conn.execute(text("SELECT 1"))
+            self.checked_at[i] = now
+            return True
+        except Exception:
+            self.mark_down(self.engines[i])
+            return False
+
+    def mark_down(self, eng):
+        i = self.engines.index(eng)
+        self.down_until[i] = time.monotonic() + REPLICA_COOLDOWN_SECONDS
+        log.warning("Réplica %d fuera de servicio por %.0fs", i, REPLICA_COOLDOWN_SECONDS)
+
+    def pick(self):
+        if not self.engines:
+            return None
+        with self.lock:
+            start = self.next_idx
+            self.next_idx = (self.next_idx + 1) % len(self.engines)
+        now = time.monotonic()
+        for k in range(len(self.engines)):
+            i = (start + k) % len(self.engines)
+            if self._healthy(i, now):
+                return self.engines[i]
+        return None
+
+
+replicas = ReplicaSet(create_engine(u, **engine_options(u)) for u in REPLICA_URLS)
+
+
+def ReadSessionLocal():
+    """
+    Sesión para dependencias de sólo lectura: una réplica sana o, si no hay,
+    el primario.
+    """
+    return SessionLocal(bind=replicas.pick() or engine)
+
+# DB en uso (ver logs de Render). Sin la URL completa: puede traer credenciales
+log.info("Usando DB", extra={"driver": engine.url.drivername, "host": engine.url.host,
+                             "database": engine.url.database, "replicas": len(REPLICA_URLS)})
 
 
 
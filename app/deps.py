@@ -1,15 +1,60 @@
 # app/deps.py
 
-from fastapi import Request
+import os
+import time
+
+from fastapi import HTTPException, Request
 from fastapi.responses import RedirectResponse
-from .database import SessionLocal
+from .database import SessionLocal, ReadSessionLocal
+from . import tenants
+
+# Después de una escritura, las lecturas de ese admin van al primario durante
+# este tiempo (read-your-writes aunque las réplicas tengan lag).
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+
+def _tenant_session():
+    """
+    En modo multi-academia: sesión contra el engine del tenant del request
+    (las réplicas no aplican). None si el modo está apagado.
+    """
+    if not tenants.enabled():
+        return None
+    eng = tenants.engine_for_current()
+    if eng is None:
+        raise HTTPException(status_code=404, detail="Academia no encontrada")
+    return SessionLocal(bind=eng)
+
 
-def get_db():
+def get_db(request: Request):
     """
-    Abre una sesión de DB usando SessionLocal (que ya apunta a Postgres).
+    Abre una sesión contra la DB primaria (lecturas y escrituras).
     La cede (yield) para que FastAPI la injete en dependencias, y la cierra al finalizar.
+    Las lecturas puras usan get_read_db: si un admin pide la primaria es que
+    escribe, aunque sea por GET (los borrados de /admin/*/delete/<id>).
+    """
+    if request.session.get("admin"):
+        request.session["rw_until"] = time.time() + READ_YOUR_WRITES_SECONDS
+    db = _tenant_session()
+    if db is None:
+        db = SessionLocal()
+    db.info["actor"] = request.session.get("admin")   # para el audit log
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request):
     """
-    db = SessionLocal()
+    Sesión para páginas y APIs de sólo lectura: va a una réplica (si hay
+    configuradas), salvo que el admin haya escrito hace poco.
+    """
+    db = _tenant_session()
+    if db is None:
+        if request.session.get("rw_until", 0) > time.time():
+            db = SessionLocal()
+        else:
+            db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -22,7 +67,31 @@ def ensure_admin(request: Request):
     - Si existe, devuelve el valor (por ejemplo, el email del admin).
     """
     admin_user = request.session.get("admin")
+    # Con varias academias en el mismo host (modo path) la cookie de sesión
+    # es compartida: el login vale sólo para la academia donde se hizo
+    if tenants.enabled() and request.session.get("admin_tenant") != tenants.current_tenant.get():
+        admin_user = None
     if not admin_user:
         return RedirectResponse(url="/login", status_code=302)
     return admin_user
 
+
+class LazyTemplates:
+    """
+    Jinja2Templates que se construye en el primer render: jinja2 y el
+    entorno de plantillas no se cargan al importar los routers. Todas las
+    instancias de un mismo directorio comparten el entorno (y su cache de
+    plantillas compiladas, que precarga warmup.py).
+    """
+
+    _built = {}
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def __getattr__(self, name):
+        templates = self._built.get(self.directory)
+        if templates is None:
+            from fastapi.templating import Jinja2Templates
+            templates = self._built.setdefault(self.directory, Jinja2Templates(directory=self.directory))
+        return getattr(templates, name)
@@ -0,0 +1,270 @@
+# app/logs.py
+"""
+Logging estructurado de la app.
+
+- Cada registro sale como una línea JSON (LOG_FORMAT=text para desarrollo).
+- Los handlers de la app sólo encolan (QueueHandler); la escritura a stdout
+  la hace un QueueListener en su propio hilo, así el I/O de logs nunca corre
+  en el hilo del request. Si la cola se llena, se descarta y se cuenta.
+- RequestLogMiddleware asigna un request_id (o respeta X-Request-ID), lo
+  agrega a todos los registros emitidos durante el request y lo devuelve en
+  la respuesta. También deja un registro de acceso en "app.access".
+- Muestreo para eventos de alto volumen: LOG_SAMPLE="app.access=0.1" deja
+  pasar ~10% de los registros INFO/DEBUG de ese logger (WARNING+ siempre
+  pasan). Un registro puede fijar su propia tasa con extra={"sample_rate": x}.
+- Niveles por módulo: LOG_LEVELS="app.database=WARNING,sqlalchemy.engine=INFO".
+- Las probes (/healthz, /readyz) se loguean muestreadas (LOG_PROBE_SAMPLE).
+
+Uso:
+    log = logging.getLogger(__name__)
+    log.info("Checkout creado", extra={"student_id": 12, "amount": 15000})
+"""
+
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+LOG_LEVEL      = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS     = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT     = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE     = os.getenv("LOG_SAMPLE", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_PROBE_SAMPLE = float(os.getenv("LOG_PROBE_SAMPLE", "0.01"))
+
+PROBE_PATHS = ("/healthz", "/readyz")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Atributos propios de LogRecord: todo lo demás es un campo "extra"
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+_REQUEST_ID_OK = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_DroppingQueueHandler"] = None
+
+
+def _parse_pairs(spec: str) -> Dict[str, str]:
+    out = {}
+    for part in spec.split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            out[k.strip()] = v.strip()
+    return out
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una línea JSON por registro: ts, level, logger, msg, request_id, los
+    campos de `extra` y, si hay, exc.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            out["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(name)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        rid = getattr(record, "request_id", None)
+        return f"{line} (rid={rid})" if rid else line
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Copia el request_id del contexto al registro. Corre en el hilo que
+    loguea (antes de encolar), que es donde el contextvar tiene valor.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "request_id", None):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Deja pasar una fracción de los registros INFO/DEBUG según el logger
+    (prefijo más largo en `rates`) o el extra "sample_rate" del registro.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda kv: len(kv[0]), reverse=True)
+
+    def rate_for(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = self.rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        record.sample_rate = rate    # para re-escalar conteos aguas abajo
+        return random.random() < rate
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloquea: si la cola está llena descarta el
+    registro y lo cuenta.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolver msg % args y la traza acá: el registro cruza de hilo
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(force: bool = False):
+    """
+    Configura el logger raíz (idempotente). Lo llaman main.py, migrate.py y
+    los CLIs de app/services.
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+
+        out = logging.StreamHandler(sys.stdout)
+        out.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+        q = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = _DroppingQueueHandler(q)
+        _queue_handler.addFilter(RequestIdFilter())
+        rates = {k: float(v) for k, v in _parse_pairs(LOG_SAMPLE).items()}
+        _queue_handler.addFilter(SamplingFilter(rates))
+
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(_queue_handler)
+        root.setLevel(LOG_LEVEL)
+        for name, level in _parse_pairs(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        _listener = logging.handlers.QueueListener(q, out, respect_handler_level=True)
+        _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Vacía la cola y detiene el hilo escritor.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def stats() -> Dict[str, int]:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+    }
+
+
+class RequestLogMiddleware:
+    """
+    Middleware ASGI: request_id por request (X-Request-ID entrante si es
+    válido), header X-Request-ID en la respuesta y un registro de acceso con
+    método, ruta, status y duración.
+    """
+
+    def __init__(self, app, logger_name: str = "app.access"):
+        self.app = app
+        self.log = logging.getLogger(logger_name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+        rid = incoming if _REQUEST_ID_OK.match(incoming) else uuid.uuid4().hex[:16]
+        token = request_id_var.set(rid)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-request-id", rid.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            self.log.exception("Error no manejado en %s %s", scope["method"], scope["path"])
+            raise
+        finally:
+            code = status["code"]
+            extra = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "client": (scope.get("client") or ("", 0))[0],
+            }
+            if scope["path"] in PROBE_PATHS:
+                extra["sample_rate"] = LOG_PROBE_SAMPLE
+            self.log.log(logging.WARNING if code >= 500 else logging.INFO,
+                         "%s %s %d", scope["method"], scope["path"], code, extra=extra)
+            request_id_var.reset(token)
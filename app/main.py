@@ -1,116 +1,140 @@
 # app/main.py
 import os
-import subprocess
-import sys
-import traceback
 import importlib.util
+import logging
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
-from .database import Base, engine
+from .logs import setup_logging, RequestLogMiddleware
+setup_logging()   # antes de importar database: el resto de la app ya loguea
+
+from .database import Base, engine, SessionLocal
 from . import models          # Asegura que los modelos se registren en Base
-from .routes import landing, admin
+from .routes import landing, admin, health
 from .auth import router as auth_router
 
+log = logging.getLogger(__name__)
+
 app = FastAPI()
 
-# ---------- 1) Ejecutar migraciones pendientes (intento principal + fallback) ----------
+# ---------- 1) Ejecutar migraciones pendientes (en este mismo proceso) ----------
+# Antes se lanzaba un segundo intérprete; ahora se importa migrate.py y se usa
+# el engine de la app. MIGRATE_ON_STARTUP=0 lo saltea (p.ej. en Render, donde
+# el startCommand ya corre migrate.py antes de uvicorn).
 migrate_script = os.path.join(os.getcwd(), "migrate.py")
-migration_ok = False
 
-if os.path.isfile(migrate_script):
-    print(f"🔎 Se encontró migrate.py en: {migrate_script}")
-    # Intento con subprocess (no levantar excepción automática)
+if os.getenv("MIGRATE_ON_STARTUP", "1").lower() not in ("1", "true", "yes"):
+    log.info("MIGRATE_ON_STARTUP desactivado; se omite paso de migraciones.")
+elif os.path.isfile(migrate_script):
     try:
-        proc = subprocess.run(
-            [sys.executable, migrate_script],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        print("---- salida stdout de migrate.py ----")
-        print(proc.stdout or "<vacío>")
-        print("---- salida stderr de migrate.py ----")
-        print(proc.stderr or "<vacío>")
-        if proc.returncode == 0:
-            print("✅ Migraciones ejecutadas correctamente (subprocess).")
-            migration_ok = True
-        else:
-            print(f"⚠️ migrate.py retornó código {proc.returncode}. Intentando fallback importando el módulo migrate.py ...")
+        spec = importlib.util.spec_from_file_location("migrate", migrate_script)
+        migrate = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migrate)
+        migrate.main(engine)
+        log.info("Migraciones ejecutadas correctamente.")
     except Exception:
-        print("❌ Error ejecutando migrate.py via subprocess:")
-        print(traceback.format_exc())
-
-    # Fallback: intentar importar migrate.py y llamar a funciones (get_engine/listar_tablas)
-    if not migration_ok:
-        try:
-            spec = importlib.util.spec_from_file_location("migrate", migrate_script)
-            migrate = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(migrate)
-            print("🔁 migrate.py importado. Intentando usar migrate.get_engine() y migrate.listar_tablas() ...")
-            try:
-                eng = migrate.get_engine()
-            except AttributeError:
-                eng = None
-            if eng is not None:
-                tablas = migrate.listar_tablas(eng)
-                print("✅ Fallback: tablas encontradas:", tablas)
-                migration_ok = True
-            else:
-                # Si migrate no provee get_engine, aún puede exponer una función principal
-                if hasattr(migrate, "__main__") or hasattr(migrate, "main"):
-                    # intentar llamar main() si existe
-                    try:
-                        if hasattr(migrate, "main"):
-                            migrate.main()
-                        else:
-                            # no hay main, no hacemos nada
-                            pass
-                        migration_ok = True
-                        print("✅ Fallback: migrate.main() ejecutado.")
-                    except Exception:
-                        print("❌ Fallback: migrate.main() falló:")
-                        print(traceback.format_exc())
-                else:
-                    print("⚠️ Fallback no pudo determinar engine ni main en migrate.py.")
-        except Exception:
-            print("❌ Error importando/ejecutando migrate.py como módulo:")
-            print(traceback.format_exc())
+        # Seguimos: create_all (abajo) sí es obligatorio
+        log.exception("Error ejecutando migrate.py")
 else:
-    print("ℹ️ No se encontró migrate.py; se omite paso de migraciones.")
+    log.info("No se encontró migrate.py; se omite paso de migraciones.")
 
 # ---------- 2) Crear tablas nuevas (no toca columnas existentes) ----------
 # Si migrate falló, seguiremos, pero si create_all falla, ahí sí abortamos
 try:
     Base.metadata.create_all(bind=engine)
-    print("✅ Base.metadata.create_all() completado.")
+    log.info("Base.metadata.create_all() completado.")
+    from .services.archive import ensure_views
+    ensure_views(engine)   # vistas payments_all / students_all (caliente + archivo)
 except Exception:
-    print("❌ Error en Base.metadata.create_all():")
-    print(traceback.format_exc())
+    log.exception("Error en Base.metadata.create_all()")
     # Es razonable detener aquí porque sin DB funcional la app no puede levantar
     raise RuntimeError("Error creando tablas en la base de datos (ver logs arriba).")
 
+# Backfill único de los agregados de recaudación (si hay pagos y la tabla está vacía)
+try:
+    from .services import rollups
+    _db = SessionLocal()
+    try:
+        if rollups.ensure_backfilled(_db):
+            log.info("Agregados de recaudación reconstruidos desde payments.")
+    finally:
+        _db.close()
+except Exception:
+    log.exception("No se pudieron reconstruir los agregados de recaudación")
+
+# Cuotas precalculadas por alumno (student_dues): se arman una vez si faltan
+try:
+    from .services import propagation
+    _db = SessionLocal()
+    try:
+        if propagation.ensure_built(_db):
+            log.info("Cuotas por alumno calculadas desde inscripciones.")
+    finally:
+        _db.close()
+except Exception:
+    log.exception("No se pudieron calcular las cuotas por alumno")
+
+# Backups programados de la DB sqlite (BACKUP_INTERVAL_HOURS > 0 para activarlos)
+@app.on_event("startup")
+def start_backup_scheduler():
+    from .services import backup
+    if backup.start_scheduler(backup.sqlite_path_of(engine)):
+        log.info("Backups programados cada %sh.", backup.BACKUP_INTERVAL_HOURS)
+
+# Calentamiento (pool de DB, plantillas, caches) en un hilo: /readyz da 503
+# hasta que termina, así el balanceador no manda tráfico a una instancia fría
+@app.on_event("startup")
+def start_warmup():
+    from .services import warmup
+    warmup.start()
+
+# Compactación periódica del feed de cambios de admin (CHANGES_COMPACT_MINUTES)
+@app.on_event("startup")
+def start_changefeed_compactor():
+    from .services import changefeed
+    changefeed.start_compactor()
+
+# Links de pago pregenerados del período en curso (PAYLINK_CHECK_MINUTES > 0)
+@app.on_event("startup")
+def start_paylinks_scheduler():
+    from .services import paylinks
+    paylinks.start_scheduler()
+
+# Vuelca lo que quede en el buffer del audit log antes de salir
+@app.on_event("shutdown")
+def stop_audit_writer():
+    from .services import audit
+    audit.writer.stop()
+    log.info("Audit log cerrado", extra={"result": audit.writer.stats()})
+
 # ---------- 3) Middleware de sesiones (necesario para autenticación en /admin) ----------
 app.add_middleware(
     SessionMiddleware,
     secret_key=os.getenv("SESSION_SECRET", "CAMBIÁ_ESTA_CLAVE_POR_ALGO_AZAR")
 )
+# Multi-academia (TENANT_MODE=host|path): resuelve el tenant de cada request
+from .tenants import TenantMiddleware
+app.add_middleware(TenantMiddleware)
+
+# request_id + log de acceso (se agrega último: envuelve a todo lo demás)
+app.add_middleware(RequestLogMiddleware)
 
 # ---------- 4) Archivos estáticos (CSS, JS, imágenes, etc.) ----------
 # asegurarse que la carpeta exista o StaticFiles fallará al arrancar
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if not os.path.isdir(static_dir):
-    print(f"⚠️ static directory no encontrado en {static_dir} — verifica la ruta.")
+    log.warning("static directory no encontrado en %s — verifica la ruta.", static_dir)
 else:
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
-    print(f"📂 Montado /static -> {static_dir}")
+    log.debug("Montado /static -> %s", static_dir)
 
 # ---------- 5) Registrar routers ----------
 app.include_router(landing.router)
 app.include_router(auth_router)
 app.include_router(admin.router)
+app.include_router(health.router)
 
 @app.get("/", include_in_schema=False)
 async def root_redirect():
@@ -1,6 +1,6 @@
 # app/models.py
 
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import date
@@ -13,7 +13,7 @@ class Student(Base):
     email          = Column(String(255), default="", nullable=True)
     dni            = Column(String(50), default="", nullable=True)
     status         = Column(String(50), default="activo", nullable=False)
-    last_paid_date = Column(Date, nullable=True)   # ← Nuevo campo: fecha del último pago realizado
+    last_paid_date = Column(Date, nullable=True, index=True)   # ← Nuevo campo: fecha del último pago realizado
 
     enrollments = relationship(
         "Enrollment",
@@ -25,6 +25,15 @@ class Student(Base):
         back_populates="student",
         cascade="all, delete-orphan"
     )
+    checkouts = relationship(
+        "Checkout",
+        back_populates="student",
+        cascade="all, delete-orphan"
+    )
+
+    # Los ids no se reutilizan: el archivo (services/archive.py) guarda las
+    # filas con su id original (en sqlite hace falta AUTOINCREMENT)
+    __table_args__ = {"sqlite_autoincrement": True}
 
     def __repr__(self):
         return f"<Student {self.id} {self.name}>"
@@ -54,8 +63,12 @@ class Enrollment(Base):
     student = relationship("Student", back_populates="enrollments")
     course  = relationship("Course", back_populates="enrollments")
 
+    # uix_student_course ya sirve para buscar por student_id (es la primera
+    # columna); course_id necesita su propio índice
     __table_args__ = (
         UniqueConstraint("student_id", "course_id", name="uix_student_course"),
+        Index("ix_enrollments_course_id", "course_id"),
+        {"sqlite_autoincrement": True},
     )
 
     def __repr__(self):
@@ -72,6 +85,246 @@ class Payment(Base):
 
     student = relationship("Student", back_populates="payments")
 
+    # Pagos de un alumno (y de un alumno en un período); pagos de un período
+    __table_args__ = (
+        Index("ix_payments_student_paid_date", "student_id", "paid_date"),
+        Index("ix_payments_paid_date", "paid_date"),
+        {"sqlite_autoincrement": True},
+    )
+
     def __repr__(self):
         return f"<Payment {self.id} student:{self.student_id} amount:{self.amount} date:{self.paid_date}>"
 
+
+
+class Checkout(Base):
+    """
+    Pago iniciado en Mercado Pago (una preferencia creada), identificado por
+    su external_reference. Queda "pending" hasta que se confirma el cobro.
+    Otros estados: "superseded" (se regeneró el link de pago con otro monto:
+    la preferencia vieja ya no salda la cuota) y "review" (llegó un pago que
+    no se aplica solo, por monto menor o checkout reemplazado: lo revisa la
+    academia).
+    """
+    __tablename__ = "checkouts"
+
+    id                 = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    student_id         = Column(Integer, ForeignKey("students.id"), nullable=False, index=True)
+    external_reference = Column(String(100), unique=True, nullable=False)
+    amount             = Column(Float, nullable=False)
+    created_at         = Column(DateTime, nullable=False)
+    status             = Column(String(20), default="pending", nullable=False, index=True)
+    gateway_payment_id = Column(String(50), nullable=True)
+    payment_id         = Column(Integer, ForeignKey("payments.id"), nullable=True)
+
+    student = relationship("Student", back_populates="checkouts")
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    def __repr__(self):
+        return f"<Checkout {self.external_reference} {self.status}>"
+
+
+class PaymentLink(Base):
+    """
+    Link de pago pregenerado de un alumno para un período: la preferencia de
+    Mercado Pago ya está creada (services/paylinks.py). El paso de pago lo
+    busca por (student_id, period) y redirige, sin llamar al gateway.
+    """
+    __tablename__ = "payment_links"
+
+    id                 = Column(Integer, primary_key=True, autoincrement=True)
+    period             = Column(String(7), nullable=False)
+    student_id         = Column(Integer, nullable=False)
+    amount             = Column(Float, nullable=False)
+    external_reference = Column(String(100), unique=True, nullable=False)
+    preference_id      = Column(String(100), nullable=True)
+    init_point         = Column(String(500), nullable=True)
+    status             = Column(String(20), nullable=False)     # "ready" | "failed" | "paid" | "stale"
+    revision           = Column(Integer, nullable=False, default=0, server_default="0")   # sufijo de la referencia
+    error              = Column(String(500), nullable=True)
+    created_at         = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("student_id", "period", name="uix_payment_link_student_period"),
+    )
+
+    def __repr__(self):
+        return f"<PaymentLink {self.student_id} {self.period} {self.status}>"
+
+
+class JobState(Base):
+    """
+    Estado persistente de tareas de fondo (p.ej. marca de agua de la conciliación).
+    """
+    __tablename__ = "job_state"
+
+    key   = Column(String(100), primary_key=True)
+    value = Column(String(255), nullable=True)
+
+    def __repr__(self):
+        return f"<JobState {self.key}={self.value}>"
+
+
+class RevenueRollup(Base):
+    """
+    Agregado incremental por (período "YYYY-MM", taller). course_id = 0
+    representa el total de la academia. Se actualiza al registrar pagos.
+    """
+    __tablename__ = "revenue_rollups"
+
+    id                = Column(Integer, primary_key=True, autoincrement=True)
+    period            = Column(String(7), nullable=False)
+    course_id         = Column(Integer, nullable=False, default=0)
+    revenue           = Column(Float, nullable=False, default=0.0)
+    payments          = Column(Integer, nullable=False, default=0)
+    paid_students     = Column(Integer, nullable=False, default=0)
+    enrolled_students = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("period", "course_id", name="uix_rollup_period_course"),
+    )
+
+    def __repr__(self):
+        return f"<RevenueRollup {self.period} c:{self.course_id} ${self.revenue}>"
+
+
+class StudentDues(Base):
+    """
+    Cuota mensual precalculada por alumno (suma de los talleres en que está
+    inscripto, sin recargo). La mantiene services/propagation.py en la misma
+    transacción de cada cambio de cuotas o inscripciones.
+    """
+    __tablename__ = "student_dues"
+
+    student_id   = Column(Integer, primary_key=True, autoincrement=False)
+    subtotal     = Column(Float, nullable=False, default=0.0)
+    course_count = Column(Integer, nullable=False, default=0)
+    updated_at   = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<StudentDues {self.student_id} ${self.subtotal}>"
+
+
+# -------- Archivo (datos fríos, fuera de las tablas calientes) --------
+class StudentArchive(Base):
+    __tablename__ = "students_archive"
+
+    id             = Column(Integer, primary_key=True)
+    name           = Column(String(255), nullable=False)
+    email          = Column(String(255), nullable=True)
+    dni            = Column(String(50), nullable=True)
+    status         = Column(String(50), nullable=True)
+    last_paid_date = Column(Date, nullable=True)
+    archived_at    = Column(DateTime, nullable=False)
+
+
+class EnrollmentArchive(Base):
+    __tablename__ = "enrollments_archive"
+
+    id          = Column(Integer, primary_key=True)
+    student_id  = Column(Integer, nullable=False, index=True)
+    course_id   = Column(Integer, nullable=False)
+    status      = Column(String(50), nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class PaymentArchive(Base):
+    __tablename__ = "payments_archive"
+
+    id          = Column(Integer, primary_key=True)
+    student_id  = Column(Integer, nullable=False, index=True)
+    amount      = Column(Float, nullable=False)
+    paid_date   = Column(Date, nullable=False)
+    archived_at = Column(DateTime, nullable=False)
+
+    # Recibos de un período (services/receipts.py) también leen el archivo
+    __table_args__ = (
+        Index("ix_payments_archive_paid_date", "paid_date"),
+    )
+
+
+class DataVersion(Base):
+    """
+    Contador de versión por tabla; lo incrementan las escrituras de crud.
+    Alimenta los ETag de las APIs de admin.
+    """
+    __tablename__ = "data_versions"
+
+    table_name = Column(String(100), primary_key=True)
+    version    = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DataVersion {self.table_name}={self.version}>"
+
+
+class ReminderDelivery(Base):
+    """
+    Progreso de los recordatorios de pago: una fila por (período, alumno).
+    Permite reanudar una corrida sin reenviar a quien ya recibió el mail.
+    """
+    __tablename__ = "reminder_deliveries"
+
+    id         = Column(Integer, primary_key=True, autoincrement=True)
+    period     = Column(String(7), nullable=False)
+    student_id = Column(Integer, nullable=False)
+    email      = Column(String(255), nullable=False)
+    status     = Column(String(20), nullable=False)     # "sent" | "failed"
+    attempts   = Column(Integer, nullable=False, default=1)
+    sent_at    = Column(DateTime, nullable=True)
+    error      = Column(String(500), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("period", "student_id", name="uix_reminder_period_student"),
+    )
+
+
+class AuditLog(Base):
+    """
+    Historial de cambios (sólo inserts; nunca se actualiza ni se borra).
+    Lo escribe services/audit.py en lotes, fuera del request.
+    """
+    __tablename__ = "audit_log"
+
+    id         = Column(Integer, primary_key=True, autoincrement=True)
+    ts         = Column(DateTime, nullable=False)
+    actor      = Column(String(255), nullable=True)     # email del admin o "system"
+    action     = Column(String(20), nullable=False)     # "insert" | "update" | "delete" | "bulk_*"
+    entity     = Column(String(50), nullable=False)     # nombre de la tabla
+    entity_id  = Column(String(50), nullable=False)
+    changes    = Column(Text, nullable=True)            # JSON {campo: [antes, después]} (bulk_*: {campo: valor})
+    request_id = Column(String(40), nullable=True)
+
+    # Historial de una entidad, del más nuevo al más viejo
+    __table_args__ = (
+        Index("ix_audit_log_entity", "entity", "entity_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<AuditLog {self.action} {self.entity}:{self.entity_id}>"
+
+
+class ChangeLog(Base):
+    """
+    Feed de cambios para las páginas de admin: una fila por fila tocada de
+    students / courses / enrollments. El id es la versión del feed (crece
+    siempre, aun si la compactación borra todas las filas: AUTOINCREMENT en
+    sqlite); la escribe services/changefeed.py al confirmar cada escritura.
+    """
+    __tablename__ = "change_log"
+
+    id        = Column(Integer, primary_key=True, autoincrement=True)
+    ts        = Column(DateTime, nullable=False, index=True)
+    entity    = Column(String(50), nullable=False)
+    entity_id = Column(String(50), nullable=False)
+    op        = Column(String(10), nullable=False)     # "upsert" | "delete"
+
+    # Compactación: buscar filas posteriores de la misma entidad
+    __table_args__ = (
+        Index("ix_change_log_entity", "entity", "entity_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    def __repr__(self):
+        return f"<ChangeLog {self.id} {self.op} {self.entity}:{self.entity_id}>"
+
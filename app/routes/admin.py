@@ -1,27 +1,38 @@
 # app/routes/admin.py
-from fastapi import APIRouter, Request, Form, Depends, Query
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Request, Form, Depends, Query, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from typing import Optional, List
+import logging
+from datetime import date
 
 from ..crud import (
-    get_student, list_students, create_student, update_student, delete_student,
-    get_course, list_courses, create_course, update_course, delete_course,
-    list_enrollments, create_enrollment, delete_enrollment,
-    calculate_due_for_student, calculate_next_month_due_for_student,
-    get_payments_summary, search_students
+    get_student, create_student, update_student, delete_student,
+    get_course, create_course, update_course, delete_course,
+    iter_students, iter_enrollments, create_enrollment, delete_enrollment,
+    surcharge_for, search_students,
+    select_student_ids, bulk_mark_paid, bulk_set_status, bulk_enroll, bulk_unenroll
 )
-from ..deps import get_db, ensure_admin
+from ..database import SessionLocal
+from ..deps import get_db, get_read_db, ensure_admin, LazyTemplates
+from ..services.reconcile import reconcile
+from ..services.roster import StudentRow
+from ..services import audit, bulkhead, changefeed, events, hotcache, paylinks, pgbulk, receipts, rollups, versions
+from .. import tenants
 from ..schemas import (
     StudentCreate, StudentUpdate,
     CourseCreate, CourseUpdate,
     EnrollmentCreate,
-    StudentOut
+    StudentOut,
+    BulkSelection, BulkMarkPaid, BulkEnroll, BulkUnenroll, BulkStatus, BulkResult
 )
 
-router = APIRouter(prefix="/admin")
-templates = Jinja2Templates(directory="app/templates")
+log = logging.getLogger(__name__)
+
+# Las rutas sync de admin corren en su propio pool (services/bulkhead.py)
+router = APIRouter(prefix="/admin", route_class=bulkhead.route_class("admin"))
+templates = LazyTemplates(directory="app/templates")
 
 
 # — DASHBOARD —
@@ -29,14 +40,14 @@ templates = Jinja2Templates(directory="app/templates")
 def admin_dashboard(
     request: Request,
     user=Depends(ensure_admin),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     if hasattr(user, "status_code"):
         return user
 
-    total_students = len(list_students(db))
-    total_courses  = len(list_courses(db))
-    courses = list_courses(db)
+    courses = hotcache.course_list.get(db)
+    total_students = len(hotcache.roster.get(db))
+    total_courses  = len(courses)
 
     return templates.TemplateResponse("admin/dashboard.html", {
         "request": request,
@@ -51,11 +62,11 @@ def admin_dashboard(
 def admin_manage_students(
     request: Request,
     user=Depends(ensure_admin),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     if hasattr(user, "status_code"):
         return user
-    courses = list_courses(db)
+    courses = hotcache.course_list.get(db)
     return templates.TemplateResponse("admin/students.html", {
         "request": request,
         "courses": courses
@@ -101,11 +112,11 @@ def admin_manage_courses(
     request: Request,
     edit_id: Optional[int] = None,
     user=Depends(ensure_admin),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     if hasattr(user, "status_code"):
         return user
-    courses = list_courses(db)
+    courses = hotcache.course_list.get(db)
     course_to_edit = get_course(db, edit_id) if edit_id else None
     return templates.TemplateResponse("admin/courses.html", {
         "request": request,
@@ -150,13 +161,14 @@ def admin_delete_course(
 def admin_manage_enrollments(
     request: Request,
     user=Depends(ensure_admin),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     if hasattr(user, "status_code"):
         return user
-    students    = list_students(db)
-    courses     = list_courses(db)
-    enrollments = list_enrollments(db)
+    # Cursores del servidor: las filas se leen mientras se arma la página
+    students    = iter_students(db)
+    courses     = hotcache.course_list.get(db)
+    enrollments = iter_enrollments(db)
     return templates.TemplateResponse("admin/enrollments.html", {
         "request": request,
         "students": students,
@@ -196,19 +208,21 @@ def admin_delete_enrollment(
 def admin_invoices(
     request: Request,
     user=Depends(ensure_admin),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     if hasattr(user, "status_code"):
         return user
 
-    students = list_students(db)
+    # Cuotas de todos los alumnos de una vez sobre el padrón en memoria
+    # (misma cuenta que calculate_due_for_student; el mes próximo, igual)
+    roster = hotcache.roster.get(db)
+    subtotals = roster.subtotals().tolist()
+    rec = surcharge_for(date.today())
     dues_data = []
-    for s in students:
-        sub, rec, tot   = calculate_due_for_student(db, s.id)
-        next_sub, next_rec, next_tot = calculate_next_month_due_for_student(db, s.id)
+    for s, sub in zip(roster.rows(), subtotals):
         dues_data.append({
-            "student": s, "subtotal": sub, "recargo": rec, "total": tot,
-            "next_sub": next_sub, "next_rec": next_rec, "next_total": next_tot
+            "student": StudentRow(*s[:5]), "subtotal": sub, "recargo": rec, "total": sub + rec,
+            "next_sub": sub, "next_rec": rec, "next_total": sub + rec
         })
 
     return templates.TemplateResponse("admin/invoices.html", {
@@ -220,24 +234,355 @@ def admin_invoices(
 # — API: Resumen de pagos para Chart.js —
 @router.get("/api/payments-summary")
 def api_payments_summary(
+    request: Request,
+    course_id: Optional[int] = Query(None, description="Filtrar por ID de taller"),
+    db: Session            = Depends(get_read_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    etag = versions.make_etag(versions.get_versions(db, ("students", "enrollments")),
+                              "payments-summary", course_id)
+    cached = versions.not_modified(request, etag)
+    if cached:
+        return cached
+    return JSONResponse(content=hotcache.roster.get(db).summary(course_id),
+                        headers=versions.cache_headers(etag))
+
+
+# — API: Resumen de pagos en vivo (Server-Sent Events) —
+@router.get("/api/events")
+async def api_events(
     course_id: Optional[int] = Query(None, description="Filtrar por ID de taller"),
-    db: Session            = Depends(get_db),
     user=Depends(ensure_admin)
 ):
+    """
+    Manda el resumen actual y después uno nuevo cada vez que una escritura
+    lo cambia (agrupadas, como mucho uno por SSE_MIN_INTERVAL).
+    """
     if hasattr(user, "status_code"):
         return user
-    return JSONResponse(content=get_payments_summary(db, course_id))
+    tenant = tenants.current_tenant.get()
+    try:
+        sub = events.hub.subscribe(tenant, course_id)
+    except OverflowError:
+        raise HTTPException(503, "Demasiadas conexiones abiertas.", headers={"Retry-After": "30"})
+    try:
+        summaries = await bulkhead.pools["admin"].run(events.load_summaries, tenant, [course_id])
+    except Exception:
+        events.hub.unsubscribe(sub)
+        raise
+    first = events.summary_message(sub, summaries[course_id])
+    return StreamingResponse(
+        events.stream(sub, first), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# — API: Serie histórica de recaudación / tasa de cobro para Chart.js —
+@router.get("/api/revenue-series")
+def api_revenue_series(
+    request: Request,
+    course_id: Optional[int] = Query(None, description="Filtrar por ID de taller"),
+    since:     Optional[str] = Query(None, description="Desde período YYYY-MM"),
+    until:     Optional[str] = Query(None, description="Hasta período YYYY-MM"),
+    db: Session            = Depends(get_read_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    etag = versions.make_etag(versions.get_versions(db, ("revenue_rollups",)),
+                              "revenue-series", course_id, since, until)
+    cached = versions.not_modified(request, etag)
+    if cached:
+        return cached
+    return JSONResponse(content=rollups.time_series(db, course_id, since, until),
+                        headers=versions.cache_headers(etag))
 
 
 # — API: Búsqueda de estudiantes —
+STUDENT_FIELDS = list(StudentOut.model_fields)
+
+
 @router.get("/api/students", response_model=List[StudentOut])
 def api_search_students(
+    request: Request,
     name:      Optional[str] = Query(None, description="Buscar por nombre"),
     course_id: Optional[int] = Query(None, description="Filtrar por ID de taller"),
     paid:      Optional[bool]= Query(None, description="True=pagado, False=no pagado"),
-    db: Session            = Depends(get_db),
+    format:    Optional[str] = Query(None, description="'columnar' = arrays paralelos por campo"),
+    fields:    Optional[str] = Query(None, description="Campos a devolver, p.ej. id,name"),
+    db: Session            = Depends(get_read_db),
+    user=Depends(ensure_admin)
+):
+    """
+    Devuelve ETag según la versión de students/enrollments y responde 304
+    si el cliente ya tiene esos datos. Con format=columnar la respuesta es
+    {"count": n, "columns": {campo: [valores...]}}, mucho más compacta en
+    listados grandes; fields= recorta los campos en ambos formatos.
+    """
+    if hasattr(user, "status_code"):
+        return user
+
+    selected = STUDENT_FIELDS
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in STUDENT_FIELDS]
+        if unknown:
+            raise HTTPException(400, f"Campos desconocidos: {', '.join(unknown)}")
+    columnar = format == "columnar"
+
+    etag = versions.make_etag(versions.get_versions(db, ("students", "enrollments")),
+                              "students", name, course_id, paid, columnar, selected)
+    cached = versions.not_modified(request, etag)
+    if cached:
+        return cached
+
+    students = search_students(db, name, course_id, paid)
+    if columnar:
+        content = {
+            "count": len(students),
+            "columns": {f: [getattr(s, f) for s in students] for f in selected},
+        }
+    else:
+        content = [{f: getattr(s, f) for f in selected} for s in students]
+    return JSONResponse(content=jsonable_encoder(content), headers=versions.cache_headers(etag))
+
+
+# — API: Operaciones masivas (una sola transacción por llamada) —
+def _bulk_ids(db: Session, body: BulkSelection):
+    """
+    Traduce la selección (ids explícitos y/o filtro) a una subconsulta de ids.
+    Exige al menos uno de los dos para no tocar a todos los estudiantes por error.
+    Un filtro cuenta con la misma regla de _filter_students: name "" o
+    course_id 0 no filtran nada.
+    """
+    f = body.filter
+    has_filter = f is not None and (bool(f.name and f.name.strip()) or bool(f.course_id)
+                                    or f.paid is not None)
+    if body.student_ids is None and not has_filter:
+        raise HTTPException(400, "Indicá student_ids o un filtro.")
+    return select_student_ids(
+        db,
+        student_ids=body.student_ids,
+        name=f.name if f else None,
+        course_id=f.course_id if f else None,
+        paid=f.paid if f else None
+    )
+
+
+@router.post("/api/bulk/mark-paid", response_model=BulkResult)
+def api_bulk_mark_paid(
+    body: BulkMarkPaid,
+    db: Session = Depends(get_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    result = bulk_mark_paid(db, _bulk_ids(db, body), body.paid_date or date.today())
+    log.info("Operación masiva mark-paid", extra={"result": result})
+    return result
+
+
+@router.post("/api/bulk/enroll", response_model=BulkResult)
+def api_bulk_enroll(
+    body: BulkEnroll,
+    db: Session = Depends(get_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    if not get_course(db, body.course_id):
+        raise HTTPException(404, "Taller no encontrado.")
+    result = bulk_enroll(db, _bulk_ids(db, body), body.course_id, body.status or "activo")
+    log.info("Operación masiva enroll", extra={"result": result})
+    return result
+
+
+@router.post("/api/bulk/unenroll", response_model=BulkResult)
+def api_bulk_unenroll(
+    body: BulkUnenroll,
+    db: Session = Depends(get_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    result = bulk_unenroll(db, _bulk_ids(db, body), body.course_id)
+    log.info("Operación masiva unenroll", extra={"result": result})
+    return result
+
+
+@router.post("/api/bulk/status", response_model=BulkResult)
+def api_bulk_status(
+    body: BulkStatus,
+    db: Session = Depends(get_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    result = bulk_set_status(db, _bulk_ids(db, body), body.status)
+    log.info("Operación masiva status", extra={"result": result})
+    return result
+
+
+# — API: Conciliación de pagos contra Mercado Pago —
+@router.post("/api/reconcile")
+def api_reconcile(
+    db: Session = Depends(get_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    stats = reconcile(db)
+    log.info("Conciliación manual", extra={"result": stats})
+    return JSONResponse(content=stats)
+
+
+# — EXPORTACIÓN CSV (COPY TO STDOUT en Postgres, cursor del servidor si no) —
+@router.get("/export/{table}.csv")
+def admin_export_csv(
+    table: str,
+    user=Depends(ensure_admin),
+    db: Session = Depends(get_read_db)
+):
+    if hasattr(user, "status_code"):
+        return user
+    if table not in pgbulk.TABLES:
+        raise HTTPException(404, "Tabla desconocida.")
+    # El cuerpo se manda después de cerrar la sesión del request: el
+    # generador abre otra contra la misma DB (réplica / tenant)
+    bind = db.get_bind()
+    return StreamingResponse(
+        pgbulk.export_csv(lambda: SessionLocal(bind=bind), table),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}-{date.today().isoformat()}.csv"'}
+    )
+
+
+# — API: Links de pago pregenerados del período —
+@router.post("/api/payment-links")
+def api_payment_links(
+    period: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="Período YYYY-MM (por defecto el actual)"),
+    limit:  Optional[int] = Query(None, ge=1, description="Máximo de links en esta corrida"),
+    db: Session           = Depends(get_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    stats = paylinks.generate(db, period, limit)
+    log.info("Links de pago generados", extra={"result": stats})
+    return JSONResponse(content=stats)
+
+
+# — API: Feed incremental de cambios (para parchear tablas en el navegador) —
+@router.get("/api/changes")
+def api_changes(
+    request: Request,
+    since: Optional[int] = Query(None, description="Última versión que tiene el cliente"),
+    db: Session          = Depends(get_read_db),
+    user=Depends(ensure_admin)
+):
+    """
+    Sin since (o con una versión ya compactada) responde reset=true y la
+    versión actual: el cliente recarga la lista completa y sigue desde ahí.
+    """
+    if hasattr(user, "status_code"):
+        return user
+    etag = versions.make_etag(versions.get_versions(db, ("change_log",)), "changes", since)
+    cached = versions.not_modified(request, etag)
+    if cached:
+        return cached
+    return JSONResponse(content=jsonable_encoder(changefeed.changes_since(db, since)),
+                        headers=versions.cache_headers(etag))
+
+
+# — API: Métricas de los bulkheads (pools por clase de ruta) —
+@router.get("/api/bulkheads")
+async def api_bulkheads(user=Depends(ensure_admin)):
+    if hasattr(user, "status_code"):
+        return user
+    return JSONResponse(content={**bulkhead.stats(), "default": bulkhead.default_pool_stats()},
+                        headers={"Cache-Control": "no-store"})
+
+
+# — API: Historial de cambios de una entidad (audit log) —
+@router.get("/api/audit/{entity}/{entity_id}")
+def api_audit_history(
+    entity: str,
+    entity_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    user=Depends(ensure_admin)
+):
+    """
+    entity es el nombre de la tabla (students, courses, enrollments,
+    payments). Lee del primario después de volcar el buffer del audit log,
+    así el historial incluye los cambios recién hechos.
+    """
+    if hasattr(user, "status_code"):
+        return user
+    if entity not in {m.__tablename__ for m in audit.AUDITED}:
+        raise HTTPException(404, "Entidad sin historial.")
+    flushed = audit.writer.flush()
+    if not flushed:
+        log.warning("Historial pedido con el audit log atrasado", extra={"entity": entity})
+    return JSONResponse(content={
+        "entity": entity,
+        "entity_id": entity_id,
+        "history": audit.history(db, entity, entity_id, limit),
+    })
+
+
+# — Recibos y estados de cuenta en PDF (render en pool de procesos + cache) —
+# Rutas async: la lectura de la DB va al pool "admin" (acotado y medido),
+# no al threadpool por defecto de Starlette
+@router.get("/receipts/{payment_id}.pdf")
+async def admin_receipt_pdf(
+    payment_id: int,
+    db: Session = Depends(get_read_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    data = await bulkhead.pools["admin"].run(receipts.receipt_data, db, payment_id)
+    if not data:
+        raise HTTPException(status_code=404, detail="Pago no encontrado")
+    path = await receipts.render_cached(data)
+    return FileResponse(path, media_type="application/pdf",
+                        filename=f"recibo-{payment_id:08d}.pdf")
+
+
+@router.get("/statements/{student_id}/{period}.pdf")
+async def admin_statement_pdf(
+    student_id: int,
+    period: str,
+    db: Session = Depends(get_read_db),
+    user=Depends(ensure_admin)
+):
+    if hasattr(user, "status_code"):
+        return user
+    try:
+        data = await bulkhead.pools["admin"].run(receipts.statement_data, db, student_id, period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Período inválido (YYYY-MM)")
+    if not data:
+        raise HTTPException(status_code=404, detail="Alumno no encontrado")
+    path = await receipts.render_cached(data)
+    return FileResponse(path, media_type="application/pdf",
+                        filename=f"estado-{student_id}-{period}.pdf")
+
+
+@router.post("/api/receipts/batch")
+async def api_receipts_batch(
+    period: str = Query(..., description="Período YYYY-MM"),
+    db: Session = Depends(get_read_db),
     user=Depends(ensure_admin)
 ):
     if hasattr(user, "status_code"):
         return user
-    return search_students(db, name, course_id, paid)
+    try:
+        result = await bulkhead.pools["admin"].run(receipts.render_month, db, period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Período inválido (YYYY-MM)")
+    log.info("Recibos del período %s", period, extra={"result": result})
+    return JSONResponse(content=result)
@@ -0,0 +1,32 @@
+# app/routes/health.py
+"""
+Probes para el balanceador / Render:
+  - /healthz (liveness): el proceso responde. No toca la DB.
+  - /readyz (readiness): calentamiento terminado, DB respondiendo rápido y
+    pool con lugar. 503 mientras no pueda recibir tráfico.
+"""
+
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..database import engine
+from ..services import warmup
+from .. import tenants
+
+router = APIRouter(include_in_schema=False)
+
+
+@router.get("/healthz")
+def healthz():
+    return {"status": "ok", "uptime_s": round(time.time() - warmup.STARTED_AT, 1)}
+
+
+@router.get("/readyz")
+def readyz():
+    ok, body = warmup.readiness(engine)
+    if tenants.enabled():
+        body["tenants"] = tenants.engines.stats()
+    return JSONResponse(content=body, status_code=200 if ok else 503,
+                        headers={"Cache-Control": "no-store"})
@@ -2,25 +2,30 @@
 
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from datetime import date
-import requests
-import os
+from datetime import date, datetime
+import logging
 
 from ..crud import (
-    list_students,
-    get_courses_for_student,
+    get_student,
+    calculate_due_for_student,
+    create_checkout,
+    get_checkout_by_reference,
+    record_checkout_payments,
+    surcharge_for,
 )
-from ..deps import get_db
+from ..models import Payment
+from ..deps import get_db, get_read_db, LazyTemplates
+from ..services import bulkhead, hotcache, mp_api, paylinks
+from ..services.reconcile import confirmed_item
+from ..services.rollups import period_of
+from .. import tenants
+from ..services.ratelimit import limit_public, gateway_slots
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
-
-# --- Variables de entorno de Mercado Pago ---
-MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
-BASE_URL        = os.getenv("BASE_URL")  # e.g. "https://tu-dominio.com/"
+log = logging.getLogger(__name__)
 
+router = APIRouter()
+templates = LazyTemplates(directory="app/templates")
 
 @router.get("/", response_class=HTMLResponse)
 def landing(request: Request):
@@ -30,19 +35,28 @@ def landing(request: Request):
     return templates.TemplateResponse("landing.html", {"request": request})
 
 
-@router.post("/create_preference", response_class=HTMLResponse)
-def create_preference(
+@router.post("/create_preference", response_class=HTMLResponse,
+             dependencies=[Depends(limit_public)])
+async def create_preference(
     request: Request,
     action: str = Form(...),        # "search" o "pay"
     term: str = Form(None),         # busqueda inicial
     student_id: int = Form(None),   # para el paso de pago
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db)
 ):
     """
     Dos modos, dependiendo de `action`:
       - action=="search": busca alumno y renderiza datos + botón de pagar.
       - action=="pay": crea la preferencia de Mercado Pago y redirige.
+    Cada modo corre en su bulkhead: un gateway lento no frena la búsqueda.
     """
+    pool = bulkhead.pools["public" if action == "search" else "payments"]
+    return await pool.run(_create_preference, request, action, term, student_id, db, read_db)
+
+
+def _create_preference(request: Request, action: str, term: str, student_id: int,
+                       db: Session, read_db: Session):
     # 1) MODO BÚSQUEDA
     if action == "search":
         if not term or not term.strip():
@@ -54,14 +68,9 @@ def create_preference(
                 }
             )
 
-        q = term.strip().lower()
-        alumnos = list_students(db)
-        matches = []
-        for s in alumnos:
-            for campo in (s.name or "", s.dni or "", s.email or "", s.status or ""):
-                if q in campo.lower():
-                    matches.append(s)
-                    break
+        # Padrón en memoria (se actualiza con los cambios desde la última vez)
+        roster = hotcache.roster.get(read_db)
+        matches = roster.search(term)
 
         if not matches:
             return templates.TemplateResponse(
@@ -82,11 +91,9 @@ def create_preference(
 
         # Encontramos exactamente uno
         alumno = matches[0]
-        cursos = get_courses_for_student(db, alumno.id)
-        subtotal = sum(c.monthly_fee for c in cursos)
-        today = date.today()
-        cutoff = date(2025, 6, 10)
-        surcharge = 2000.0 if today >= cutoff else 0.0
+        cursos = roster.courses_of(alumno.id)
+        subtotal = sum(fee for _, fee in cursos)
+        surcharge = surcharge_for(date.today())
         total = subtotal + surcharge
 
         return templates.TemplateResponse(
@@ -94,7 +101,7 @@ def create_preference(
             {
                 "request":  request,
                 "student":  alumno,
-                "courses":  [c.title for c in cursos],
+                "courses":  [title for title, _ in cursos],
                 "subtotal": subtotal,
                 "surcharge": surcharge,
                 "total":    total
@@ -106,48 +113,46 @@ def create_preference(
         if not student_id:
             raise HTTPException(400, "Falta student_id para procesar el pago.")
 
-        # Recalcular montos por seguridad
-        alumno = next((s for s in list_students(db) if s.id == student_id), None)
+        # Recalcular montos por seguridad (cuota precalculada: una búsqueda por PK)
+        alumno = get_student(db, student_id)
         if not alumno:
             raise HTTPException(404, "Alumno no encontrado.")
 
-        cursos = get_courses_for_student(db, alumno.id)
-        subtotal = sum(c.monthly_fee for c in cursos)
         today = date.today()
-        cutoff = date(2025, 6, 10)
-        surcharge = 2000.0 if today >= cutoff else 0.0
-        total = subtotal + surcharge
+        subtotal, surcharge, total = calculate_due_for_student(db, alumno.id)
+
+        # Link pregenerado del período (services/paylinks.py): el checkout ya
+        # existe y no hace falta llamar al gateway. Si cambió la cuota,
+        # propagation.py lo marcó "stale" y no aparece acá
+        link = paylinks.ready_link(db, alumno.id, period_of(today))
+        if link is not None and link.amount == total:
+            log.info("Link pregenerado", extra={"student_id": alumno.id,
+                                                "external_reference": link.external_reference})
+            return RedirectResponse(url=link.init_point)
 
         # Preparamos el payload a Mercado Pago
-        payload = {
-            "items": [
+        external_reference = paylinks.reference_for(alumno.id, today.isoformat(), tenants.current_tenant.get())
+        payload = paylinks.preference_payload(alumno.name, today.isoformat(), total, external_reference)
+        # Tope de llamadas simultáneas al gateway (503 + Retry-After si está lleno)
+        try:
+            with gateway_slots:
+                status_code, data = mp_api.create_preference(payload)
+        except HTTPException:
+            raise
+        except Exception:
+            log.warning("Mercado Pago no respondió", exc_info=True, extra={"student_id": alumno.id})
+            return templates.TemplateResponse(
+                "landing.html",
                 {
-                    "title": f"Pago cuota {today.isoformat()} - {alumno.name}",
-                    "quantity": 1,
-                    "currency_id": "ARS",
-                    "unit_price": total
-                }
-            ],
-            "external_reference": f"{alumno.id}-{today.isoformat()}",
-            "back_urls": {
-                "success": f"{BASE_URL}payment/success",
-                "failure": f"{BASE_URL}payment/failed",
-                "pending": f"{BASE_URL}payment/pending"
-            },
-            "auto_return": "approved"
-        }
-        headers = {
-            "Authorization": f"Bearer {MP_ACCESS_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        resp = requests.post(
-            "https://api.mercadopago.com/checkout/preferences",
-            json=payload,
-            headers=headers
-        )
-        data = resp.json()
+                    "request": request,
+                    "error": "Mercado Pago no responde en este momento. Intentá de nuevo en unos minutos."
+                },
+                status_code=503
+            )
 
-        if resp.status_code != 201 and data.get("error"):
+        if status_code != 201 and data.get("error"):
+            log.warning("Mercado Pago rechazó la preferencia",
+                        extra={"student_id": alumno.id, "status": status_code, "error": data.get("error")})
             return templates.TemplateResponse(
                 "landing.html",
                 {
@@ -156,9 +161,125 @@ def create_preference(
                 }
             )
 
-        link_mp = data.get("response", {}).get("init_point") or data.get("sandbox_init_point")
+        # Queda registrado como pendiente hasta que la conciliación lo confirme
+        create_checkout(db, alumno.id, external_reference, total)
+        log.info("Checkout creado", extra={"student_id": alumno.id,
+                                           "external_reference": external_reference, "amount": total})
+
+        link_mp = mp_api.init_point(data)
         return RedirectResponse(url=link_mp)
 
     else:
         raise HTTPException(400, "Acción inválida.")
 
+
+# -------- Retorno desde Mercado Pago (back_urls) --------
+# Estados del gateway que ya no van a terminar aprobados
+MP_FAILED_STATUSES = ("rejected", "cancelled", "refunded", "charged_back")
+# Pago recibido que no salda la cuota (checkout en "review", ver crud)
+REVIEW_MESSAGE = ("Recibimos el pago, pero no coincide con la cuota vigente. "
+                  "La academia lo va a revisar y se va a comunicar con vos.")
+
+
+def _render_success(request: Request, db: Session, chk):
+    payment = db.get(Payment, chk.payment_id) if chk.payment_id else None
+    return templates.TemplateResponse(
+        "payment_success.html",
+        {
+            "request":    request,
+            "student_id": chk.student_id,
+            "amount":     payment.amount if payment else chk.amount,
+            "paid_date":  payment.paid_date if payment else None,
+        }
+    )
+
+
+def _render_failed(request: Request, error: str, status_code: int = 200):
+    return templates.TemplateResponse(
+        "payment_failed.html", {"request": request, "error": error}, status_code=status_code
+    )
+
+
+def payment_return(request: Request, db: Session):
+    """
+    Resuelve el estado real del pago al volver de Mercado Pago. No confía en
+    los parámetros de la URL: busca el checkout por external_reference
+    (índice único) y, si sigue pendiente, consulta el pago al gateway.
+    Un pago aprobado se registra con crud.record_checkout_payments (checkout,
+    Payment y last_paid_date en una sola transacción). Si el checkout ya
+    estaba aprobado (refrescos del navegador, reintentos) no se escribe nada.
+    """
+    params = request.query_params
+    reference = params.get("external_reference")
+    payment_id = params.get("payment_id") or params.get("collection_id")
+    if not reference:
+        return _render_failed(request, "Falta la referencia del pago.", 400)
+
+    chk = get_checkout_by_reference(db, reference)
+    if chk is None:
+        return _render_failed(request, "Referencia de pago desconocida.", 404)
+    if chk.status == "approved":
+        return _render_success(request, db, chk)
+    if chk.status == "review":
+        return _render_failed(request, REVIEW_MESSAGE)
+    if not payment_id or payment_id == "null":
+        # Volvió sin pagar (p.ej. desde el botón "volver" de Mercado Pago)
+        if params.get("status") in MP_FAILED_STATUSES or request.url.path.endswith("/failed"):
+            return _render_failed(request, "El pago no se completó.")
+        return templates.TemplateResponse("payment_pending.html", {"request": request})
+    if not payment_id.isdigit():
+        # Va en la ruta de la API (con el token): sólo ids numéricos
+        log.warning("payment_id inválido al volver de Mercado Pago",
+                    extra={"external_reference": reference, "payment_id": payment_id[:100]})
+        return _render_failed(request, "Identificador de pago inválido.", 400)
+
+    try:
+        with gateway_slots:
+            mp = mp_api.get_payment(payment_id)
+    except Exception:
+        # Gateway caído, lento o sin lugar: la conciliación lo confirma después
+        log.warning("No se pudo consultar el pago al volver de Mercado Pago", exc_info=True,
+                    extra={"external_reference": reference, "payment_id": payment_id})
+        return templates.TemplateResponse("payment_pending.html", {"request": request})
+
+    if mp.get("external_reference") != reference:
+        log.warning("El pago no corresponde a la referencia",
+                    extra={"external_reference": reference, "payment_id": payment_id})
+        return _render_failed(request, "El pago no corresponde a esta referencia.", 400)
+
+    status = mp.get("status")
+    if status == "approved":
+        applied = record_checkout_payments(db, [confirmed_item(mp, chk.amount, datetime.utcnow())])
+        if applied:
+            log.info("Pago registrado al volver de Mercado Pago",
+                     extra={"student_id": chk.student_id, "external_reference": reference,
+                            "payment_id": payment_id})
+        db.refresh(chk)
+        if chk.status != "approved":
+            # Monto menor o link reemplazado: crud lo dejó en "review"
+            return _render_failed(request, REVIEW_MESSAGE)
+        return _render_success(request, db, chk)
+    if status in MP_FAILED_STATUSES:
+        return _render_failed(request, "Mercado Pago rechazó el pago.")
+    return templates.TemplateResponse("payment_pending.html", {"request": request})
+
+
+@router.get("/payment/success", response_class=HTMLResponse,
+            dependencies=[Depends(limit_public)])
+@bulkhead.bulkheaded("payments")
+def payment_success(request: Request, db: Session = Depends(get_db)):
+    return payment_return(request, db)
+
+
+@router.get("/payment/failed", response_class=HTMLResponse,
+            dependencies=[Depends(limit_public)])
+@bulkhead.bulkheaded("payments")
+def payment_failed(request: Request, db: Session = Depends(get_db)):
+    return payment_return(request, db)
+
+
+@router.get("/payment/pending", response_class=HTMLResponse,
+            dependencies=[Depends(limit_public)])
+@bulkhead.bulkheaded("payments")
+def payment_pending(request: Request, db: Session = Depends(get_db)):
+    return payment_return(request, db)
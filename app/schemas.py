@@ -90,3 +90,31 @@ class PaymentOut(PaymentBase):
 
     class Config:
         from_attributes = True
+
+
+# --- Operaciones masivas ---
+class StudentFilter(BaseModel):
+    name: Optional[str] = None
+    course_id: Optional[int] = None
+    paid: Optional[bool] = None
+
+class BulkSelection(BaseModel):
+    student_ids: Optional[List[int]] = None     # ids explícitos
+    filter: Optional[StudentFilter] = None      # o filtro de search_students (se combinan con AND)
+
+class BulkMarkPaid(BulkSelection):
+    paid_date: Optional[date] = None            # por defecto, hoy
+
+class BulkEnroll(BulkSelection):
+    course_id: int
+    status: Optional[str] = "activo"
+
+class BulkUnenroll(BulkSelection):
+    course_id: int
+
+class BulkStatus(BulkSelection):
+    status: str
+
+class BulkResult(BaseModel):
+    matched: int     # estudiantes seleccionados
+    affected: int    # filas modificadas/insertadas/borradas
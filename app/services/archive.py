@@ -0,0 +1,210 @@
+# app/services/archive.py
+"""
+Archivo de datos fríos para mantener chicas las tablas calientes.
+
+- Pagos con paid_date anterior al horizonte (ARCHIVE_PAYMENTS_AFTER_DAYS)
+  pasan de payments a payments_archive.
+- Alumnos inactivos (status distinto de "activo") sin pagos dentro de
+  ARCHIVE_STUDENTS_AFTER_DAYS pasan a students_archive, junto con sus
+  inscripciones y pagos; sus checkouts y links de pago se descartan.
+
+Se mueve por lotes (INSERT ... SELECT + DELETE, una transacción por lote).
+Los reportes ven todo a través de las vistas payments_all y students_all
+(UNION ALL de tabla caliente + archivo).
+
+    python -m app.services.archive            # archiva
+    python -m app.services.archive --dry-run  # sólo cuenta
+"""
+
+import argparse
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import (
+    Column, Date, Float, Integer, MetaData, String, Table,
+    delete, exists, func, literal, select, text, update,
+)
+from sqlalchemy.orm import Session
+
+from . import changefeed, propagation, rollups, versions
+from ..models import (
+    Checkout, Enrollment, EnrollmentArchive, Payment, PaymentArchive, PaymentLink,
+    Student, StudentArchive,
+)
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_PAYMENTS_AFTER_DAYS = int(os.getenv("ARCHIVE_PAYMENTS_AFTER_DAYS", "730"))
+ARCHIVE_STUDENTS_AFTER_DAYS = int(os.getenv("ARCHIVE_STUDENTS_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE          = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+# Vistas de lectura (no forman parte de Base.metadata: las crea ensure_views)
+views = MetaData()
+payments_all = Table(
+    "payments_all", views,
+    Column("id", Integer), Column("student_id", Integer),
+    Column("amount", Float), Column("paid_date", Date),
+)
+students_all = Table(
+    "students_all", views,
+    Column("id", Integer), Column("name", String), Column("email", String),
+    Column("dni", String), Column("status", String), Column("last_paid_date", Date),
+)
+
+_VIEWS = {
+    "payments_all": """
+        SELECT id, student_id, amount, paid_date FROM payments
+        UNION ALL
+        SELECT id, student_id, amount, paid_date FROM payments_archive
+    """,
+    "students_all": """
+        SELECT id, name, email, dni, status, last_paid_date FROM students
+        UNION ALL
+        SELECT id, name, email, dni, status, last_paid_date FROM students_archive
+    """,
+}
+
+
+def ensure_views(engine):
+    """
+    Crea (o reemplaza) las vistas UNION ALL. Idempotente.
+    """
+    with engine.begin() as conn:
+        for name, sql in _VIEWS.items():
+            if engine.dialect.name == "postgresql":
+                conn.execute(text(f"CREATE OR REPLACE VIEW {name} AS {sql}"))
+            else:
+                conn.execute(text(f"CREATE VIEW IF NOT EXISTS {name} AS {sql}"))
+
+
+def _old_payment_ids(cutoff: date):
+    return select(Payment.id).where(Payment.paid_date < cutoff)
+
+
+def _inactive_student_ids(cutoff: date):
+    recent = exists().where(Payment.student_id == Student.id, Payment.paid_date >= cutoff)
+    return select(Student.id).where(
+        Student.status != "activo",
+        (Student.last_paid_date.is_(None)) | (Student.last_paid_date < cutoff),
+        ~recent,
+    )
+
+
+def _move_payments(db: Session, ids, now: datetime) -> int:
+    db.execute(
+        PaymentArchive.__table__.insert().from_select(
+            ["id", "student_id", "amount", "paid_date", "archived_at"],
+            select(Payment.id, Payment.student_id, Payment.amount, Payment.paid_date,
+                   literal(now)).where(Payment.id.in_(ids))
+        )
+    )
+    db.execute(
+        update(Checkout).where(Checkout.payment_id.in_(ids)).values(payment_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(
+        delete(Payment).where(Payment.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def archive_payments(db: Session, cutoff: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Mueve pagos anteriores a `cutoff` a payments_archive, por lotes.
+    """
+    moved = 0
+    now = datetime.utcnow()
+    while True:
+        ids = db.execute(_old_payment_ids(cutoff).limit(batch_size)).scalars().all()
+        if not ids:
+            return moved
+        moved += _move_payments(db, ids, now)
+        versions.bump(db, "payments", "checkouts")
+        db.commit()
+
+
+def archive_students(db: Session, cutoff: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Mueve alumnos inactivos (con sus inscripciones y pagos) al archivo, por lotes.
+    """
+    moved = 0
+    now = datetime.utcnow()
+    while True:
+        ids = db.execute(_inactive_student_ids(cutoff).limit(batch_size)).scalars().all()
+        if not ids:
+            return moved
+        payment_ids = select(Payment.id).where(Payment.student_id.in_(ids))
+        _move_payments(db, db.execute(payment_ids).scalars().all(), now)
+        db.execute(
+            EnrollmentArchive.__table__.insert().from_select(
+                ["id", "student_id", "course_id", "status", "archived_at"],
+                select(Enrollment.id, Enrollment.student_id, Enrollment.course_id,
+                       Enrollment.status, literal(now)).where(Enrollment.student_id.in_(ids))
+            )
+        )
+        changefeed.record(db, "enrollments", db.execute(
+            delete(Enrollment).where(Enrollment.student_id.in_(ids)).returning(Enrollment.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all(), "delete")
+        db.execute(delete(Checkout).where(Checkout.student_id.in_(ids))
+                   .execution_options(synchronize_session=False))
+        db.execute(delete(PaymentLink).where(PaymentLink.student_id.in_(ids))
+                   .execution_options(synchronize_session=False))
+        db.execute(
+            StudentArchive.__table__.insert().from_select(
+                ["id", "name", "email", "dni", "status", "last_paid_date", "archived_at"],
+                select(Student.id, Student.name, Student.email, Student.dni, Student.status,
+                       Student.last_paid_date, literal(now)).where(Student.id.in_(ids))
+            )
+        )
+        moved += db.execute(delete(Student).where(Student.id.in_(ids))
+                            .execution_options(synchronize_session=False)).rowcount
+        changefeed.record(db, "students", ids, "delete")
+        propagation.touch(db, "students", students=ids)
+        rollups.refresh_enrollment_counts(db)
+        versions.bump(db, "students", "enrollments", "payments", "checkouts", "payment_links")
+        db.commit()
+
+
+def run(db: Session, today: date = None, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Pasada completa de archivo. Primero alumnos (arrastran sus pagos), después
+    pagos viejos de alumnos que siguen activos.
+    """
+    today = today or date.today()
+    students_cutoff = today - timedelta(days=ARCHIVE_STUDENTS_AFTER_DAYS)
+    payments_cutoff = today - timedelta(days=ARCHIVE_PAYMENTS_AFTER_DAYS)
+    if dry_run:
+        count = lambda q: db.execute(select(func.count()).select_from(q.subquery())).scalar_one()
+        return {
+            "students": count(_inactive_student_ids(students_cutoff)),
+            "payments": count(_old_payment_ids(payments_cutoff)),
+        }
+    return {
+        "students": archive_students(db, students_cutoff),
+        "payments": archive_payments(db, payments_cutoff),
+    }
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine, SessionLocal
+
+    parser = argparse.ArgumentParser(description="Archiva pagos viejos y alumnos inactivos")
+    parser.add_argument("--dry-run", action="store_true", help="Sólo cuenta lo que se archivaría")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    ensure_views(engine)
+    db = SessionLocal()
+    try:
+        result = run(db, dry_run=args.dry_run)
+        log.info("Archivado%s", " (dry-run)" if args.dry_run else "", extra={"result": result})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
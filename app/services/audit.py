@@ -0,0 +1,255 @@
+# app/services/audit.py
+"""
+Historial de cambios (tabla audit_log, sólo inserts).
+
+Los cambios se capturan con eventos de la Session de SQLAlchemy, sin tocar
+cada ruta de admin:
+  - after_flush: por cada objeto auditado nuevo, modificado o borrado se
+    arma un registro (campos cambiados con su valor anterior y nuevo) y se
+    guarda en session.info hasta que la transacción termine;
+  - after_commit: los registros pasan al buffer en memoria del escritor;
+  - after_rollback: se descartan.
+
+El escritor es un hilo que inserta el buffer en lotes (AUDIT_BATCH_SIZE)
+cada AUDIT_FLUSH_SECONDS, así el request no paga un INSERT extra. Si el
+proceso muere se pierde como mucho lo que estaba en el buffer (un
+intervalo); si la DB no responde el buffer retiene hasta AUDIT_MAX_BUFFER
+registros y descarta los más viejos (quedan contados en stats()).
+
+El actor sale de session.info["actor"] (deps.get_db pone el email del
+admin) o de `actor_var` (tareas y CLIs); si no hay, "system".
+
+Los UPDATE/DELETE/INSERT masivos de crud (bulk_*) no pasan por el
+flush del ORM: esas funciones llaman a record() con los ids afectados
+(acción "bulk_*", con los valores nuevos; el anterior no se conoce).
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, inspect, insert, select
+from sqlalchemy.orm import Session
+
+from ..logs import request_id_var
+from ..models import AuditLog, Course, Enrollment, Payment, Student
+
+log = logging.getLogger(__name__)
+
+AUDIT_ENABLED       = os.getenv("AUDIT_ENABLED", "1").lower() in ("1", "true", "yes")
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+AUDIT_BATCH_SIZE    = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_MAX_BUFFER    = int(os.getenv("AUDIT_MAX_BUFFER", "50000"))
+
+AUDITED = (Student, Course, Enrollment, Payment)
+
+PENDING_KEY = "audit_pending"
+
+actor_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("audit_actor", default=None)
+
+
+def _value(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+
+def _actor(session: Session) -> str:
+    return session.info.get("actor") or actor_var.get() or "system"
+
+
+def _entry(session: Session, action: str, entity: str, entity_id, changes: Optional[dict]) -> dict:
+    return {
+        "ts": datetime.utcnow(),
+        "actor": _actor(session),
+        "action": action,
+        "entity": entity,
+        "entity_id": str(entity_id),
+        "changes": json.dumps(changes, ensure_ascii=False, default=str) if changes else None,
+        "request_id": request_id_var.get(),
+    }
+
+
+def _snapshot(obj) -> dict:
+    state = inspect(obj)
+    return {col.key: _value(state.dict[col.key]) for col in state.mapper.column_attrs
+            if col.key in state.dict}
+
+
+def _diff(obj) -> dict:
+    state = inspect(obj)
+    changes = {}
+    for col in state.mapper.column_attrs:
+        hist = state.attrs[col.key].history
+        if hist.has_changes():
+            before = hist.deleted[0] if hist.deleted else None
+            after = hist.added[0] if hist.added else None
+            if before != after:
+                changes[col.key] = [_value(before), _value(after)]
+    return changes
+
+
+def _pk(obj):
+    # En after_flush los objetos nuevos todavía no tienen identity key
+    ident = inspect(obj).mapper.primary_key_from_instance(obj)
+    return ident[0] if len(ident) == 1 else ",".join(map(str, ident))
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context):
+    if not AUDIT_ENABLED:
+        return
+    pending = session.info.setdefault(PENDING_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, AUDITED):
+            pending.append(_entry(session, "insert", obj.__tablename__, _pk(obj), _snapshot(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, AUDITED) and session.is_modified(obj, include_collections=False):
+            changes = _diff(obj)
+            if changes:
+                pending.append(_entry(session, "update", obj.__tablename__, _pk(obj), changes))
+    for obj in session.deleted:
+        if isinstance(obj, AUDITED):
+            pending.append(_entry(session, "delete", obj.__tablename__, _pk(obj), _snapshot(obj)))
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        writer.enqueue(session.get_bind(), pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def record(db: Session, entity: str, ids: Iterable, action: str, changes: Optional[dict] = None):
+    """
+    Registra a mano cambios hechos con sentencias masivas (no pasan por el
+    flush del ORM). Se escriben al confirmar la transacción, como los demás.
+    """
+    if not AUDIT_ENABLED:
+        return
+    pending = db.info.setdefault(PENDING_KEY, [])
+    pending.extend(_entry(db, action, entity, i, changes) for i in ids)
+
+
+class AuditWriter:
+    """
+    Buffer acotado de registros + hilo que los inserta en lotes.
+    Cada registro recuerda su engine (en multi-academia, el del tenant).
+    """
+
+    def __init__(self, max_buffer: int):
+        self.buffer: "deque[tuple]" = deque()
+        self.max_buffer = max_buffer
+        self.cond = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def enqueue(self, engine, entries: List[dict]):
+        with self.cond:
+            for entry in entries:
+                if len(self.buffer) >= self.max_buffer:
+                    self.buffer.popleft()
+                    self.dropped += 1
+                self.buffer.append((engine, entry))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self.thread.start()
+            if len(self.buffer) >= AUDIT_BATCH_SIZE:
+                self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.stopping and len(self.buffer) < AUDIT_BATCH_SIZE:
+                    self.cond.wait(AUDIT_FLUSH_SECONDS)
+                stopping = self.stopping
+            if not self.flush() and not stopping:
+                time.sleep(AUDIT_FLUSH_SECONDS)   # DB con problemas: no insistir en loop
+            if stopping:
+                return
+
+    def flush(self) -> bool:
+        """
+        Escribe todo lo que hay en el buffer. Devuelve False si algún lote
+        falló (esos registros vuelven al buffer para el próximo intento).
+        """
+        with self.flush_lock:
+            while True:
+                with self.cond:
+                    batch = [self.buffer.popleft() for _ in range(min(AUDIT_BATCH_SIZE, len(self.buffer)))]
+                if not batch:
+                    return True
+                by_engine: Dict[object, List[dict]] = {}
+                for engine, entry in batch:
+                    by_engine.setdefault(engine, []).append(entry)
+                failed = []
+                for engine, rows in by_engine.items():
+                    try:
+                        with engine.begin() as conn:
+                            conn.execute(insert(AuditLog), rows)
+                        self.written += len(rows)
+                    except Exception:
+                        self.failures += 1
+                        log.exception("No se pudo escribir el audit log", extra={"rows": len(rows)})
+                        failed.extend((engine, r) for r in rows)
+                if failed:
+                    with self.cond:
+                        room = self.max_buffer - len(self.buffer)
+                        self.dropped += max(0, len(failed) - room)
+                        self.buffer.extendleft(reversed(failed[-room:] if room > 0 else []))
+                    return False
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout=10)
+        self.flush()
+        with self.cond:
+            # Un enqueue posterior (p.ej. otra app en el mismo proceso) relanza el hilo
+            self.thread = None
+            self.stopping = False
+
+    def stats(self) -> Dict[str, int]:
+        return {"buffered": len(self.buffer), "written": self.written,
+                "dropped": self.dropped, "failures": self.failures}
+
+
+writer = AuditWriter(AUDIT_MAX_BUFFER)
+atexit.register(writer.stop)
+
+
+def history(db: Session, entity: str, entity_id: str, limit: int = 100) -> List[dict]:
+    """
+    Historial de una entidad, del cambio más nuevo al más viejo.
+    """
+    rows = db.execute(
+        select(AuditLog)
+        .where(AuditLog.entity == entity, AuditLog.entity_id == str(entity_id))
+        .order_by(AuditLog.id.desc())
+        .limit(limit)
+    ).scalars().all()
+    return [{
+        "id": r.id,
+        "ts": r.ts.isoformat(),
+        "actor": r.actor,
+        "action": r.action,
+        "changes": json.loads(r.changes) if r.changes else None,
+        "request_id": r.request_id,
+    } for r in rows]
@@ -0,0 +1,271 @@
+# app/services/backup.py
+"""
+Backups online de la base sqlite con la API de backup de sqlite3.
+
+- snapshot(): copia consistente en pasos de BACKUP_PAGES_PER_STEP páginas
+  (los escritores siguen trabajando entre pasos; si las escrituras la
+  reinician más de BACKUP_MAX_RESTARTS veces, en un solo paso), comprimida con gzip y
+  con política de retención (se guardan los BACKUP_KEEP más nuevos).
+- verify(): descomprime a un temporal y corre PRAGMA integrity_check.
+- restore(): verifica y vuelca el snapshot sobre la DB viva, también con
+  la API de backup (las conexiones abiertas ven el contenido restaurado).
+- start_scheduler(): hilo de fondo que toma un snapshot cada
+  BACKUP_INTERVAL_HOURS (0 = desactivado). Con varios workers sólo uno
+  toma el snapshot (lock de archivo + antigüedad del último).
+
+    python -m app.services.backup snapshot|list|prune
+    python -m app.services.backup verify  RUTA.db.gz
+    python -m app.services.backup restore RUTA.db.gz
+"""
+
+import argparse
+import datetime
+import fcntl
+import gzip
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+BACKUP_DIR            = os.getenv("BACKUP_DIR", "")   # por defecto: <carpeta de la DB>/backups
+BACKUP_KEEP           = int(os.getenv("BACKUP_KEEP", "14"))
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "0"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_PAUSE     = float(os.getenv("BACKUP_STEP_PAUSE", "0.005"))
+# sqlite reinicia la copia por pasos si otra conexión escribe en la DB; tras
+# estos reinicios se copia en un solo paso (frena a los escritores mientras
+# dura, pero termina)
+BACKUP_MAX_RESTARTS   = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+
+SUFFIX = ".db.gz"
+
+
+def backup_dir_for(db_path: str) -> pathlib.Path:
+    d = pathlib.Path(BACKUP_DIR) if BACKUP_DIR else pathlib.Path(db_path).resolve().parent / "backups"
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def list_snapshots(db_path: str) -> List[pathlib.Path]:
+    """
+    Snapshots de esta DB, del más nuevo al más viejo.
+    """
+    stem = pathlib.Path(db_path).stem
+    return sorted(backup_dir_for(db_path).glob(f"{stem}.*{SUFFIX}"), reverse=True)
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _online_copy(src_path: str, dst_path: str):
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(dst_path)
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        # Si lo que falta no baja, sqlite volvió a empezar
+        if state["remaining"] is not None and remaining >= state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state["remaining"] = remaining
+        # Pausa corta entre pasos para que los escritores tomen el lock
+        time.sleep(BACKUP_STEP_PAUSE)
+
+    try:
+        try:
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=progress)
+        except _TooManyRestarts:
+            log.warning("La copia por pasos se reinició %s veces (DB con escrituras); "
+                        "se copia en un solo paso", state["restarts"])
+            src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+
+
+def snapshot(db_path: str) -> str:
+    """
+    Toma un snapshot comprimido y aplica la retención. Devuelve la ruta.
+    """
+    out_dir = backup_dir_for(db_path)
+    now = datetime.datetime.utcnow()
+    ts = now.strftime("%Y%m%dT%H%M%S") + f"{now.microsecond // 1000:03d}Z"
+    final = out_dir / f"{pathlib.Path(db_path).stem}.{ts}{SUFFIX}"
+
+    fd, tmp = tempfile.mkstemp(prefix=".snapshot-", suffix=".db", dir=out_dir)
+    os.close(fd)
+    try:
+        _online_copy(db_path, tmp)
+        part = final.with_name(final.name + ".part")
+        with open(tmp, "rb") as fin, gzip.open(part, "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        os.replace(part, final)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    prune(db_path)
+    return str(final)
+
+
+def prune(db_path: str, keep: int = None) -> List[str]:
+    """
+    Borra los snapshots más viejos dejando los `keep` más nuevos.
+    """
+    keep = BACKUP_KEEP if keep is None else keep
+    removed = []
+    for old in list_snapshots(db_path)[keep:]:
+        old.unlink()
+        removed.append(str(old))
+    return removed
+
+
+def _decompress(path: str, dest_dir: str) -> str:
+    fd, tmp = tempfile.mkstemp(prefix=".verify-", suffix=".db", dir=dest_dir)
+    os.close(fd)
+    with gzip.open(path, "rb") as fin, open(tmp, "wb") as fout:
+        shutil.copyfileobj(fin, fout, 1024 * 1024)
+    return tmp
+
+
+def verify(path: str) -> Tuple[bool, str]:
+    """
+    Descomprime el snapshot y corre PRAGMA integrity_check.
+    """
+    tmp = _decompress(path, str(pathlib.Path(path).parent))
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            tables = conn.execute("SELECT count(*) FROM sqlite_master WHERE type='table'").fetchone()[0]
+        finally:
+            conn.close()
+        return result == "ok", f"integrity_check={result}, tablas={tables}"
+    except sqlite3.DatabaseError as exc:
+        return False, str(exc)
+    finally:
+        os.remove(tmp)
+
+
+def restore(path: str, db_path: str) -> str:
+    """
+    Verifica el snapshot y lo vuelca sobre `db_path`. Antes toma un snapshot
+    de seguridad del estado actual; devuelve su ruta.
+    """
+    ok, msg = verify(path)
+    if not ok:
+        raise ValueError(f"Snapshot inválido ({msg}); no se restaura.")
+    tmp = _decompress(path, str(pathlib.Path(db_path).resolve().parent))
+    try:
+        safety = snapshot(db_path) if os.path.exists(db_path) else ""
+        src = sqlite3.connect(tmp)
+        dst = sqlite3.connect(db_path)
+        try:
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP)
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        os.remove(tmp)
+    return safety
+
+
+def latest_age_hours(db_path: str) -> Optional[float]:
+    snaps = list_snapshots(db_path)
+    if not snaps:
+        return None
+    return (time.time() - snaps[0].stat().st_mtime) / 3600.0
+
+
+def snapshot_if_due(db_path: str, interval_hours: float) -> Optional[str]:
+    """
+    Toma un snapshot si el último tiene más de `interval_hours`. Un lock de
+    archivo evita que varios procesos lo hagan a la vez.
+    """
+    lock_path = backup_dir_for(db_path) / ".lock"
+    with open(lock_path, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        age = latest_age_hours(db_path)
+        if age is not None and age < interval_hours:
+            return None
+        return snapshot(db_path)
+
+
+def start_scheduler(db_path: str, interval_hours: float = None) -> Optional[threading.Thread]:
+    """
+    Lanza el hilo de backups periódicos (si el intervalo es > 0).
+    """
+    interval_hours = BACKUP_INTERVAL_HOURS if interval_hours is None else interval_hours
+    if interval_hours <= 0 or not db_path:
+        return None
+
+    def loop():
+        while True:
+            try:
+                done = snapshot_if_due(db_path, interval_hours)
+                if done:
+                    log.info("Snapshot creado: %s", done)
+            except Exception:
+                log.exception("Error en backup programado")
+            time.sleep(min(interval_hours * 3600, 600))
+
+    t = threading.Thread(target=loop, name="sqlite-backup", daemon=True)
+    t.start()
+    return t
+
+
+def sqlite_path_of(engine) -> Optional[str]:
+    """
+    Ruta del archivo si el engine es sqlite sobre archivo; si no, None.
+    """
+    if engine.url.get_backend_name() != "sqlite":
+        return None
+    path = engine.url.database
+    return path if path and path != ":memory:" else None
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import engine
+
+    parser = argparse.ArgumentParser(description="Backups online de la DB sqlite")
+    parser.add_argument("command", choices=["snapshot", "list", "prune", "verify", "restore"])
+    parser.add_argument("path", nargs="?", help="Snapshot .db.gz (verify/restore)")
+    args = parser.parse_args()
+
+    db_path = sqlite_path_of(engine)
+    if not db_path:
+        raise SystemExit("La DB configurada no es un archivo sqlite.")
+
+    if args.command == "snapshot":
+        log.info("Snapshot creado: %s", snapshot(db_path))
+    elif args.command == "list":
+        for p in list_snapshots(db_path):
+            print(f"{p}  {p.stat().st_size / 1024:.0f} KiB")
+    elif args.command == "prune":
+        log.info("Borrados", extra={"removed": prune(db_path)})
+    elif not args.path:
+        parser.error(f"{args.command} necesita la ruta del snapshot")
+    elif args.command == "verify":
+        ok, msg = verify(args.path)
+        log.log(logging.INFO if ok else logging.ERROR, "%s: %s", "OK" if ok else "FALLÓ", msg)
+        raise SystemExit(0 if ok else 1)
+    else:
+        safety = restore(args.path, db_path)
+        log.info("Restaurado %s -> %s (estado previo en %s)", args.path, db_path, safety or "-")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# app/services/bulkhead.py
+"""
+Bulkheads: un pool de hilos propio por clase de ruta.
+
+Las rutas sync de FastAPI corren todas en el threadpool por defecto de
+Starlette; unos pocos requests colgados en el gateway de pagos lo llenan y
+también frenan /admin. Acá cada clase tiene su pool y su cola acotada:
+
+  - public:   búsqueda del landing
+  - payments: inicio de pago y retorno desde Mercado Pago (llaman al gateway)
+  - admin:    todas las rutas sync de /admin
+
+Si una clase tiene ocupados sus workers y su cola llena, el request
+siguiente recibe 503 + Retry-After en el acto, sin afectar a las demás.
+Tamaños por entorno: BULKHEAD_<CLASE>_WORKERS y BULKHEAD_<CLASE>_QUEUE.
+
+Uso:
+  - @bulkheaded("payments") sobre una función de ruta sync la convierte en
+    async y la corre en ese pool (copiando los contextvars: request_id,
+    tenant).
+  - APIRouter(route_class=route_class("admin")) hace lo mismo con todas
+    las rutas sync del router.
+  - await pools["public"].run(fn, *args) para partes de una ruta.
+
+stats() (GET /admin/api/bulkheads) da, por clase, ocupación, cola, rechazos
+y tiempos de espera en cola / ejecución (promedio, p95, máximo) de los
+últimos pedidos, para dimensionar cada pool con su carga real.
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+
+SAMPLES = 1000   # tiempos recientes que se guardan por clase
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _summary(values) -> Dict[str, float]:
+    if not values:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    return {
+        "avg": round(sum(ordered) / len(ordered), 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class Bulkhead:
+    def __init__(self, name: str, workers: int, queue_limit: int, retry_after: int = 2):
+        self.name        = name
+        self.workers     = workers
+        self.queue_limit = queue_limit
+        self.retry_after = retry_after
+        self.executor    = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"bulkhead-{name}")
+        self.lock        = threading.Lock()
+        self.queued      = 0
+        self.running     = 0
+        self.completed   = 0
+        self.rejected    = 0
+        self.wait_ms     = deque(maxlen=SAMPLES)
+        self.run_ms      = deque(maxlen=SAMPLES)
+
+    def _admit(self):
+        with self.lock:
+            if self.queued + self.running >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise HTTPException(
+                    503, "Servidor ocupado, intentá de nuevo en unos segundos.",
+                    headers={"Retry-After": str(self.retry_after)}
+                )
+            self.queued += 1
+
+    def _call(self, submitted: float, ctx: contextvars.Context, fn: Callable):
+        started = time.perf_counter()
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_ms.append((started - submitted) * 1000)
+        try:
+            return ctx.run(fn)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_ms.append((time.perf_counter() - started) * 1000)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Corre fn(*args, **kwargs) en el pool de la clase y espera el resultado.
+        Lanza 503 si el pool y su cola están llenos.
+        """
+        self._admit()
+        call = functools.partial(self._call, time.perf_counter(), contextvars.copy_context(),
+                                 functools.partial(fn, *args, **kwargs))
+        try:
+            future = self.executor.submit(call)
+        except Exception:
+            with self.lock:
+                self.queued -= 1
+            raise
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "running": self.running,
+                "queued": self.queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_ms": _summary(list(self.wait_ms)),
+                "run_ms": _summary(list(self.run_ms)),
+            }
+
+
+def _make(name: str, workers: int, queue_limit: int) -> Bulkhead:
+    prefix = f"BULKHEAD_{name.upper()}_"
+    return Bulkhead(name, _env_int(prefix + "WORKERS", workers), _env_int(prefix + "QUEUE", queue_limit))
+
+
+pools: Dict[str, Bulkhead] = {
+    "public":   _make("public", 8, 32),
+    "payments": _make("payments", 4, 8),
+    "admin":    _make("admin", 8, 32),
+}
+
+
+def bulkheaded(name: str):
+    """
+    Decorador para rutas sync: las corre en el pool `name`. La firma se
+    conserva (functools.wraps), así FastAPI sigue resolviendo parámetros y
+    dependencias igual que antes.
+    """
+    pool = pools[name]
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            return fn   # las rutas async ya no ocupan hilos
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await pool.run(fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def route_class(name: str):
+    """
+    Clase de ruta para APIRouter(route_class=...): aplica bulkheaded(name)
+    a cada endpoint sync del router.
+    """
+    wrap = bulkheaded(name)
+
+    class BulkheadRoute(APIRoute):
+        def __init__(self, path: str, endpoint: Callable, **kwargs):
+            super().__init__(path, wrap(endpoint), **kwargs)
+
+    return BulkheadRoute
+
+
+def default_pool_stats() -> dict:
+    """
+    Ocupación del threadpool por defecto (dependencias sync y rutas sin
+    bulkhead). Hay que llamarla desde el event loop.
+    """
+    import anyio.to_thread
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {"workers": int(limiter.total_tokens), "running": limiter.borrowed_tokens,
+            "queued": limiter.statistics().tasks_waiting}
+
+
+def stats() -> Dict[str, dict]:
+    return {name: pool.stats() for name, pool in pools.items()}
@@ -0,0 +1,256 @@
+# app/services/changefeed.py
+"""
+Feed incremental de cambios para las páginas de admin.
+
+Cada escritura que toca students / courses / enrollments deja en change_log
+una fila (entidad, id, "upsert" | "delete"); el id de change_log es la
+versión del feed. /admin/api/changes?since=N devuelve lo cambiado después
+de N, con las filas actuales de lo modificado y los ids de lo borrado, y el
+navegador parchea su tabla en vez de volver a pedir la lista completa.
+
+Cómo se llena:
+  - after_flush junta los objetos nuevos, modificados y borrados del ORM
+    en session.info;
+  - before_commit los escribe en la misma transacción. Antes incrementa la
+    versión "change_log" de data_versions: ese UPDATE toma un lock de fila
+    hasta el commit, así que los ids se asignan en el orden en que las
+    transacciones confirman (un cliente nunca saltea un id que aparece
+    después). Se hace al final de la transacción para que sea siempre el
+    último lock que se toma (sin deadlocks con los demás bump()).
+  - Las sentencias masivas de crud llaman a record() con los ids.
+
+Compactación (compact(), cada CHANGES_COMPACT_MINUTES y por CLI):
+  - borra las filas que tienen otra posterior de la misma entidad (el
+    cliente sólo necesita la última);
+  - borra las de más de CHANGES_RETENTION_HOURS y sube el piso (job_state
+    "changes.floor"). Un cliente con since por debajo del piso recibe
+    reset=true y recarga todo.
+
+    python -m app.services.changefeed compact
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, exists, func, insert, select
+from sqlalchemy.orm import Session, aliased
+
+from .. import crud
+from ..models import ChangeLog, Course, Enrollment, Student
+from ..schemas import StudentOut
+from . import versions
+
+log = logging.getLogger(__name__)
+
+CHANGES_RETENTION_HOURS = float(os.getenv("CHANGES_RETENTION_HOURS", "72"))
+CHANGES_COMPACT_MINUTES = float(os.getenv("CHANGES_COMPACT_MINUTES", "60"))
+CHANGES_MAX_ROWS        = int(os.getenv("CHANGES_MAX_ROWS", "2000"))
+
+FLOOR_KEY   = "changes.floor"
+PENDING_KEY = "changefeed_pending"
+
+# Entidad -> (modelo, columnas que se mandan al navegador)
+FEED = {
+    "students":    (Student, list(StudentOut.model_fields)),
+    "courses":     (Course, ["id", "title", "monthly_fee"]),
+    "enrollments": (Enrollment, ["id", "student_id", "course_id", "status"]),
+}
+FEED_MODELS = tuple(model for model, _ in FEED.values())
+
+
+# -------- Escritura --------
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context):
+    pending = session.info.setdefault(PENDING_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, FEED_MODELS):
+            pending.append((obj.__tablename__, obj.id, "upsert"))
+    for obj in session.dirty:
+        if isinstance(obj, FEED_MODELS) and session.is_modified(obj, include_collections=False):
+            pending.append((obj.__tablename__, obj.id, "upsert"))
+    for obj in session.deleted:
+        if isinstance(obj, FEED_MODELS):
+            pending.append((obj.__tablename__, obj.id, "delete"))
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session: Session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()   # que after_flush vea lo último antes de escribir
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    versions.bump(session, "change_log")
+    now = datetime.utcnow()
+    session.connection().execute(insert(ChangeLog), [
+        {"ts": now, "entity": entity, "entity_id": str(entity_id), "op": op}
+        for entity, entity_id, op in pending
+    ])
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def record(db: Session, entity: str, ids: Iterable, op: str = "upsert"):
+    """
+    Anota cambios hechos con sentencias masivas (no pasan por el flush del
+    ORM); se escriben al confirmar la transacción.
+    """
+    db.info.setdefault(PENDING_KEY, []).extend((entity, i, op) for i in ids)
+
+
+# -------- Lectura --------
+def floor(db: Session) -> int:
+    return int(crud.get_job_state(db, FLOOR_KEY) or 0)
+
+
+def current_version(db: Session) -> int:
+    top = db.execute(select(func.max(ChangeLog.id))).scalar()
+    return max(top or 0, floor(db))
+
+
+def _load(db: Session, entity: str, ids: List[int]) -> List[dict]:
+    model, fields = FEED[entity]
+    rows = db.execute(select(model).where(model.id.in_(ids))).scalars().all()
+    return [{f: getattr(r, f) for f in fields} for r in rows]
+
+
+def changes_since(db: Session, since: Optional[int]) -> dict:
+    """
+    {"version": v, "reset": bool, "changes": {entidad: {"upsert": [filas], "delete": [ids]}}}
+    reset=true: el cliente tiene que recargar todo (since vacío, por debajo
+    del piso de compactación, o demasiados cambios juntos).
+    """
+    version = current_version(db)
+    out = {"version": version, "reset": False, "changes": {}}
+    if since is None or since < floor(db) or since > version:
+        out["reset"] = True
+        return out
+    if since == version:
+        return out
+
+    rows = db.execute(
+        select(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op)
+        .where(ChangeLog.id > since)
+        .order_by(ChangeLog.id)
+        .limit(CHANGES_MAX_ROWS + 1)
+    ).all()
+    if len(rows) > CHANGES_MAX_ROWS:
+        out["reset"] = True
+        return out
+
+    # La última operación sobre cada fila es la que vale
+    last: Dict[Tuple[str, int], str] = {}
+    for row in rows:
+        last[(row.entity, int(row.entity_id))] = row.op
+    for entity in FEED:
+        upserts = [i for (e, i), op in last.items() if e == entity and op == "upsert"]
+        deletes = [i for (e, i), op in last.items() if e == entity and op == "delete"]
+        loaded = _load(db, entity, upserts) if upserts else []
+        # Anotada como upsert pero ya no está (la borró algo que no pasa por el feed)
+        found = {r["id"] for r in loaded}
+        deletes += [i for i in upserts if i not in found]
+        if loaded or deletes:
+            out["changes"][entity] = {"upsert": loaded, "delete": sorted(deletes)}
+    return out
+
+
+# -------- Compactación --------
+def compact(db: Session, now: datetime = None) -> Dict[str, int]:
+    """
+    Una pasada de compactación en una transacción. Devuelve contadores.
+    """
+    now = now or datetime.utcnow()
+    stats = {"expired": 0, "superseded": 0, "floor": floor(db)}
+
+    cutoff = now - timedelta(hours=CHANGES_RETENTION_HOURS)
+    new_floor = db.execute(select(func.max(ChangeLog.id)).where(ChangeLog.ts < cutoff)).scalar()
+    if new_floor and new_floor > stats["floor"]:
+        stats["expired"] = db.execute(
+            delete(ChangeLog).where(ChangeLog.id <= new_floor)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        crud.set_job_state(db, FLOOR_KEY, str(new_floor), commit=False)
+        versions.bump(db, "change_log")   # invalida los ETag de /admin/api/changes
+        stats["floor"] = new_floor
+
+    later = aliased(ChangeLog)
+    stats["superseded"] = db.execute(
+        delete(ChangeLog).where(exists().where(
+            later.entity == ChangeLog.entity,
+            later.entity_id == ChangeLog.entity_id,
+            later.id > ChangeLog.id,
+        )).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return stats
+
+
+def _engines():
+    from ..database import engine
+    from .. import tenants
+
+    if not tenants.enabled():
+        return [("", engine)]
+    with tenants.engines.lock:
+        return [(slug, entry[0]) for slug, entry in tenants.engines.engines.items()]
+
+
+def compact_all() -> Dict[str, dict]:
+    """
+    Compacta la DB de la app o, en multi-academia, la de cada tenant abierto.
+    """
+    from ..database import SessionLocal
+
+    result = {}
+    for slug, eng in _engines():
+        db = SessionLocal(bind=eng)
+        try:
+            result[slug or "default"] = compact(db)
+        finally:
+            db.close()
+    return result
+
+
+def start_compactor(interval_minutes: float = None) -> Optional[threading.Thread]:
+    """
+    Lanza el hilo de compactación periódica (si el intervalo es > 0).
+    """
+    interval_minutes = CHANGES_COMPACT_MINUTES if interval_minutes is None else interval_minutes
+    if interval_minutes <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval_minutes * 60)
+            try:
+                log.info("Feed de cambios compactado", extra={"result": compact_all()})
+            except Exception:
+                log.exception("Error compactando el feed de cambios")
+
+    t = threading.Thread(target=loop, name="changefeed-compact", daemon=True)
+    t.start()
+    return t
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine
+
+    if sys.argv[1:] != ["compact"]:
+        print("Uso: python -m app.services.changefeed compact")
+        sys.exit(2)
+    Base.metadata.create_all(bind=engine)
+    log.info("Feed de cambios compactado", extra={"result": compact_all()})
+
+
+if __name__ == "__main__":
+    main()
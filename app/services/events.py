@@ -0,0 +1,222 @@
+# app/services/events.py
+"""
+Actualizaciones en vivo del dashboard por Server-Sent Events.
+
+Pub/sub en el proceso, sin consultar la DB en loop:
+  - versions.bump() anota en session.info las tablas que toca cada
+    escritura; al confirmar la transacción (after_commit) se publican
+    acá. Cubre tanto el ORM como las sentencias masivas de crud.
+  - publish() puede llamarse desde cualquier hilo: sólo marca el tenant
+    como "sucio" en el event loop (call_soon_threadsafe).
+  - Una tarea del loop (_pump) junta las marcas y, como mucho una vez cada
+    SSE_MIN_INTERVAL segundos, recalcula el resumen de pagos una vez por
+    (tenant, taller) con suscriptores y lo deja en cada suscriptor. Una
+    ráfaga de escrituras termina en un solo mensaje.
+  - Cada conexión espera en su propio asyncio.Event: cientos de conexiones
+    ociosas no cuestan nada más que memoria. Cada SSE_KEEPALIVE_SECONDS se
+    manda un comentario para que los proxies no corten la conexión.
+
+Es por proceso: con varios workers de uvicorn, cada uno avisa sólo de las
+escrituras que hizo él (Render corre uno solo).
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .. import crud, tenants
+
+log = logging.getLogger(__name__)
+
+SSE_MIN_INTERVAL       = float(os.getenv("SSE_MIN_INTERVAL", "1"))
+SSE_KEEPALIVE_SECONDS  = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SSE_MAX_SUBSCRIBERS    = int(os.getenv("SSE_MAX_SUBSCRIBERS", "1000"))
+
+BUMPED_KEY = "events_bumped"
+
+# Tablas de las que depende el resumen / la serie de recaudación
+SUMMARY_TABLES = {"students", "enrollments"}
+REVENUE_TABLES = {"payments", "revenue_rollups"}
+WATCHED = SUMMARY_TABLES | REVENUE_TABLES
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    tables = session.info.pop(BUMPED_KEY, None)
+    if tables and tables & WATCHED:
+        hub.publish(tenants.current_tenant.get(), tables & WATCHED)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(BUMPED_KEY, None)
+
+
+class Subscriber:
+    def __init__(self, tenant: Optional[str], course_id: Optional[int]):
+        self.tenant = tenant
+        self.course_id = course_id
+        self.pending: Optional[dict] = None
+        self.ready = asyncio.Event()
+        self.last_summary: Optional[dict] = None
+
+    def offer(self, message: dict):
+        # Si el cliente no leyó el anterior, se reemplaza: sólo importa el último
+        self.pending = message
+        self.ready.set()
+
+    def take(self) -> Optional[dict]:
+        message, self.pending = self.pending, None
+        self.ready.clear()
+        return message
+
+
+class Hub:
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers: Set[Subscriber] = set()
+        self.dirty: Dict[Optional[str], Set[str]] = {}
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.pushes = 0
+
+    # -- desde cualquier hilo --
+    def publish(self, tenant: Optional[str], tables: Iterable[str]):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return   # nadie escuchando
+        self.published += 1
+        try:
+            loop.call_soon_threadsafe(self._mark, tenant, set(tables))
+        except RuntimeError:
+            pass     # loop cerrándose
+
+    # -- en el event loop --
+    def _mark(self, tenant: Optional[str], tables: Set[str]):
+        self.dirty.setdefault(tenant, set()).update(tables)
+        self.wakeup.set()
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.task is None or self.task.done():
+            self.loop = loop
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self._pump(), name="sse-pump")
+
+    def subscribe(self, tenant: Optional[str], course_id: Optional[int]) -> Subscriber:
+        if len(self.subscribers) >= SSE_MAX_SUBSCRIBERS:
+            raise OverflowError("Demasiadas conexiones de eventos")
+        self._ensure_started()
+        sub = Subscriber(tenant, course_id)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+
+    async def _pump(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            dirty, self.dirty = self.dirty, {}
+            try:
+                await self._push(dirty)
+            except Exception:
+                log.exception("Error enviando actualizaciones del dashboard")
+            # Coalescencia: lo que llegue mientras tanto sale en el próximo envío
+            await asyncio.sleep(SSE_MIN_INTERVAL)
+
+    async def _push(self, dirty: Dict[Optional[str], Set[str]]):
+        loop = asyncio.get_running_loop()
+        for tenant, tables in dirty.items():
+            subs = [s for s in self.subscribers if s.tenant == tenant]
+            if not subs:
+                continue
+            courses = {s.course_id for s in subs}
+            summaries = await loop.run_in_executor(None, load_summaries, tenant, courses)
+            revenue = bool(tables & REVENUE_TABLES)
+            for sub in subs:
+                summary = summaries.get(sub.course_id)
+                if summary == sub.last_summary and not revenue:
+                    continue
+                sub.offer(summary_message(sub, summary, sorted(tables)))
+                self.pushes += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": len(self.subscribers), "published": self.published, "pushes": self.pushes}
+
+
+hub = Hub()
+
+
+def note_bump(db: Session, tables: Iterable[str]):
+    """
+    Lo llama versions.bump(): tablas tocadas por la transacción en curso.
+    """
+    db.info.setdefault(BUMPED_KEY, set()).update(tables)
+
+
+def _session_for(tenant: Optional[str]) -> Session:
+    # Primario (no réplica): el aviso llega apenas confirma la escritura
+    from ..database import SessionLocal
+
+    if tenant:
+        return SessionLocal(bind=tenants.engines.get(tenant))
+    return SessionLocal()
+
+
+def load_summaries(tenant: Optional[str], course_ids: Iterable[Optional[int]]) -> Dict[Optional[int], dict]:
+    db = _session_for(tenant)
+    try:
+        return {cid: crud.get_payments_summary(db, cid) for cid in course_ids}
+    finally:
+        db.close()
+
+
+def summary_message(sub: Subscriber, summary: dict, tables=()) -> dict:
+    """
+    Resumen nuevo + diferencia con el último que recibió este cliente.
+    """
+    prev = sub.last_summary or {}
+    sub.last_summary = summary
+    return {
+        "event": "summary",
+        "data": {
+            "course_id": sub.course_id,
+            **summary,
+            "delta": {k: v - prev.get(k, 0) for k, v in summary.items()} if prev else None,
+            "tables": list(tables),
+        },
+    }
+
+
+def format_sse(message: Optional[dict]) -> str:
+    if message is None:
+        return ": keepalive\n\n"
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+async def stream(sub: Subscriber, first: dict):
+    """
+    Generador de la respuesta: primero el estado actual, después cada
+    actualización (o un keepalive si no hubo ninguna en un rato).
+    """
+    try:
+        yield "retry: 5000\n\n" + format_sse(first)
+        while True:
+            try:
+                await asyncio.wait_for(sub.ready.wait(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield format_sse(None)
+                continue
+            message = sub.take()
+            if message is not None:
+                yield format_sse(message)
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,176 @@
+# app/services/fake_gateway.py
+"""
+Gateway falso de Mercado Pago para desarrollo y pruebas locales.
+
+    python -m app.services.fake_gateway --port 8089
+    MP_API_BASE=http://localhost:8089 uvicorn app.main:app
+
+Implementa lo que usa la app:
+  POST /checkout/preferences   -> crea la preferencia (init_point = /checkout/<id>)
+  GET  /checkout/<id>          -> "paga" (aprueba) y redirige a back_urls.success
+  GET  /v1/payments/search     -> filtros external_reference, status, range/begin/end, offset/limit
+  GET  /v1/payments/<id>       -> un pago
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+log = logging.getLogger(__name__)
+
+
+class FakeGateway:
+    """
+    Estado en memoria del gateway falso (preferencias y pagos).
+    """
+
+    def __init__(self):
+        self.lock        = threading.Lock()
+        self.ids         = itertools.count(1000)
+        self.preferences = {}
+        self.payments    = {}
+
+    def create_preference(self, payload: dict, base_url: str) -> dict:
+        with self.lock:
+            pref_id = f"pref-{next(self.ids)}"
+            self.preferences[pref_id] = payload
+        return {
+            "id": pref_id,
+            "init_point": f"{base_url}/checkout/{pref_id}",
+            "sandbox_init_point": f"{base_url}/checkout/{pref_id}",
+        }
+
+    def approve(self, pref_id: str, when: datetime = None) -> dict:
+        """
+        Simula el cobro de una preferencia: crea un pago "approved".
+        """
+        pref = self.preferences[pref_id]
+        ts = (when or datetime.now(timezone.utc)).isoformat(timespec="milliseconds")
+        with self.lock:
+            pay_id = next(self.ids)
+            payment = {
+                "id": pay_id,
+                "status": "approved",
+                "external_reference": pref.get("external_reference"),
+                "transaction_amount": sum(
+                    float(i.get("unit_price", 0)) * int(i.get("quantity", 1)) for i in pref.get("items", [])
+                ),
+                "date_created": ts,
+                "date_approved": ts,
+                "date_last_updated": ts,
+                "preference_id": pref_id,
+            }
+            self.payments[pay_id] = payment
+        return payment
+
+    def search(self, params: dict) -> dict:
+        def p(name, default=None):
+            return params.get(name, [default])[0]
+
+        with self.lock:
+            rows = list(self.payments.values())
+        if p("external_reference"):
+            rows = [r for r in rows if r["external_reference"] == p("external_reference")]
+        if p("status"):
+            rows = [r for r in rows if r["status"] == p("status")]
+        field = p("range")
+        if field:
+            begin, end = p("begin_date"), p("end_date")
+            key = lambda r: datetime.fromisoformat(r[field].replace("Z", "+00:00"))
+            if begin:
+                rows = [r for r in rows if key(r) >= datetime.fromisoformat(begin.replace("Z", "+00:00"))]
+            if end:
+                rows = [r for r in rows if key(r) <= datetime.fromisoformat(end.replace("Z", "+00:00"))]
+        rows.sort(key=lambda r: r.get(p("sort", "date_created")) or "", reverse=p("criteria") == "desc")
+        offset, limit = int(p("offset", 0)), int(p("limit", 30))
+        return {
+            "paging": {"total": len(rows), "offset": offset, "limit": limit},
+            "results": rows[offset:offset + limit],
+        }
+
+
+def make_handler(gw: FakeGateway):
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, code: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _base_url(self) -> str:
+            return f"http://{self.headers.get('Host')}"
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/checkout/preferences":
+                return self._json(404, {"error": "not_found"})
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            self._json(201, gw.create_preference(payload, self._base_url()))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if url.path == "/v1/payments/search":
+                return self._json(200, gw.search(parse_qs(url.query)))
+            if len(parts) == 3 and parts[:2] == ["v1", "payments"]:
+                payment = gw.payments.get(int(parts[2])) if parts[2].isdigit() else None
+                return self._json(200, payment) if payment else self._json(404, {"error": "not_found"})
+            if len(parts) == 2 and parts[0] == "checkout" and parts[1] in gw.preferences:
+                payment = gw.approve(parts[1])
+                success = (gw.preferences[parts[1]].get("back_urls") or {}).get("success")
+                if not success:
+                    return self._json(200, payment)
+                query = urlencode({
+                    "payment_id": payment["id"],
+                    "collection_id": payment["id"],
+                    "status": "approved",
+                    "collection_status": "approved",
+                    "external_reference": payment["external_reference"],
+                    "preference_id": parts[1],
+                })
+                self.send_response(302)
+                self.send_header("Location", f"{success}?{query}")
+                self.end_headers()
+                return
+            self._json(404, {"error": "not_found"})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_gateway(host: str = "127.0.0.1", port: int = 0):
+    """
+    Levanta el gateway en un thread. Devuelve (server, gateway, base_url);
+    cerrar con server.shutdown().
+    """
+    gw = FakeGateway()
+    server = ThreadingHTTPServer((host, port), make_handler(gw))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, gw, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gateway falso de Mercado Pago")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+    from ..logs import setup_logging
+    setup_logging()
+    gw = FakeGateway()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(gw))
+    log.info("Escuchando en http://%s:%d", args.host, args.port)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# app/services/hotcache.py
+"""
+Caches en memoria de datos "calientes", invalidados por versión de tabla.
+
+Cada cache guarda el valor junto con las versiones (data_versions) de las
+tablas de las que depende; get() compara contra las versiones actuales (una
+consulta chica) y recarga sólo si alguna cambió. Las escrituras de crud ya
+hacen versions.bump(), así que no hay que invalidar a mano. En modo
+multi-academia hay una entrada por tenant (LRU de MAX_TENANT_ENTRIES).
+
+- course_list: lista de talleres (páginas de admin).
+- roster: padrón en columnas (roster.py) para la búsqueda pública del
+  landing, la facturación y los resúmenes; se actualiza con los cambios
+  del feed en vez de recargarse entero.
+
+warmup.py los precarga al arrancar.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import Course
+from . import roster as _roster
+from . import versions
+from .. import tenants
+
+MAX_TENANT_ENTRIES = 64
+
+
+class VersionedCache:
+    def __init__(self, name: str, tables: Tuple[str, ...], loader: Callable[[Session], object]):
+        self.name = name
+        self.tables = tables
+        self.loader = loader
+        self.lock = threading.Lock()
+        # tenant (None sin multi-academia) -> (versiones, valor)
+        self.entries: "OrderedDict[Optional[str], Tuple[Dict[str, int], object]]" = OrderedDict()
+        self.loads = 0
+
+    def get(self, db: Session):
+        key = tenants.current_tenant.get()
+        current = versions.get_versions(db, self.tables)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == current:
+            return entry[1]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != current:
+                entry = (current, self.loader(db))
+                self.entries[key] = entry
+                self.loads += 1
+            self.entries.move_to_end(key)
+            while len(self.entries) > MAX_TENANT_ENTRIES:
+                self.entries.popitem(last=False)
+        return entry[1]
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "loads": self.loads,
+                "version": self.entries[None][0] if None in self.entries else None}
+
+
+def _load_courses(db: Session) -> List:
+    return db.execute(
+        select(Course.id, Course.title, Course.monthly_fee).order_by(Course.id)
+    ).all()
+
+
+course_list = VersionedCache("course_list", ("courses",), _load_courses)
+roster      = _roster.cache
+
+ALL = (course_list, roster)
+
+
+def prime(db: Session):
+    for cache in ALL:
+        cache.get(db)
+
+
+def stats() -> Dict[str, dict]:
+    return {cache.name: cache.stats() for cache in ALL}
@@ -0,0 +1,69 @@
+# app/services/mp_api.py
+"""
+Cliente mínimo de la API REST de Mercado Pago (preferencias, búsqueda y consulta de pagos).
+MP_API_BASE permite apuntar a un gateway falso local (ver fake_gateway.py).
+`requests` se importa al primer llamado: no pesa en el arranque de la app.
+"""
+
+import os
+
+MP_API_BASE     = os.getenv("MP_API_BASE", "https://api.mercadopago.com").rstrip("/")
+MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
+# Sin timeout un gateway colgado retiene el hilo (y el lugar en el bulkhead) para siempre
+MP_TIMEOUT      = float(os.getenv("MP_TIMEOUT_SECONDS", "10"))
+
+
+def _http():
+    import requests
+    return requests
+
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {MP_ACCESS_TOKEN}",
+        "Content-Type": "application/json"
+    }
+
+
+def create_preference(payload: dict):
+    """
+    Crea una preferencia de pago. Devuelve (status_code, json).
+    """
+    resp = _http().post(f"{MP_API_BASE}/checkout/preferences", json=payload,
+                        headers=_headers(), timeout=MP_TIMEOUT)
+    return resp.status_code, resp.json()
+
+
+def init_point(data: dict) -> str:
+    """
+    Link de pago de una preferencia (producción o sandbox).
+    """
+    return (
+        data.get("init_point")
+        or (data.get("response") or {}).get("init_point")
+        or data.get("sandbox_init_point")
+        or ""
+    )
+
+
+def get_payment(payment_id, timeout: float = MP_TIMEOUT) -> dict:
+    """
+    GET /v1/payments/{id}. Lanza requests.HTTPError si no existe y
+    ValueError si el id no es numérico (va en la ruta, con el token).
+    """
+    if not str(payment_id).isdigit():
+        raise ValueError(f"payment_id inválido: {str(payment_id)[:100]!r}")
+    resp = _http().get(f"{MP_API_BASE}/v1/payments/{payment_id}",
+                       headers=_headers(), timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def search_payments(params: dict, timeout: float = 15.0) -> dict:
+    """
+    GET /v1/payments/search. Devuelve el json con "paging" y "results".
+    """
+    resp = _http().get(f"{MP_API_BASE}/v1/payments/search", params=params,
+                       headers=_headers(), timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
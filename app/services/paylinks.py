@@ -0,0 +1,315 @@
+# app/services/paylinks.py
+"""
+Links de pago pregenerados por período.
+
+El día de vencimiento todos entran al landing a la vez y cada "pagar"
+creaba la preferencia en Mercado Pago en el momento. Acá se crean antes,
+en lote:
+
+1) Una consulta trae a los alumnos activos con talleres y sin pago en el
+   período, con su cuota precalculada (student_dues, ver propagation.py);
+   el total suma el recargo vigente.
+2) Se descartan los que ya tienen link "ready" (o "paid") por ese mismo
+   monto: la corrida se puede repetir o reanudar sin duplicar. Los links
+   que propagation.py marcó "stale" (cambió la cuota) se regeneran con la
+   revisión siguiente (otra external_reference, "<id>-<período>-r<n>") y el
+   checkout del link anterior pasa a "superseded": si igual se paga la
+   preferencia vieja, el pago queda para revisar (crud.record_checkout_payments).
+   Las preferencias vencen al terminar el período.
+3) Las preferencias se crean en paralelo con PAYLINK_WORKERS hilos.
+4) Los resultados se guardan por lotes (PAYLINK_FLUSH_EVERY): el link en
+   payment_links y el checkout "pending" con la misma external_reference,
+   así la conciliación y el retorno desde MP lo reconocen aunque el alumno
+   pague el link sin pasar por el landing.
+
+El paso de pago (landing, action=pay) busca el link con ready_link() y
+redirige; si no hay o el monto ya no coincide, crea la preferencia como
+antes.
+
+Se corre al empezar cada período: el hilo de start_scheduler() (cada
+PAYLINK_CHECK_MINUTES si es > 0, en cada tenant abierto), por CLI o con
+POST /admin/api/payment-links.
+
+    python -m app.services.paylinks [--period YYYY-MM] [--dry-run] [--limit N]
+
+Prueba local:
+    python -m app.services.fake_gateway --port 8089
+    MP_API_BASE=http://localhost:8089 python -m app.services.paylinks
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from .. import crud, tenants
+from ..config import BASE_URL
+from ..models import Checkout, PaymentLink, Student, StudentDues
+from . import mp_api, propagation, versions
+from .rollups import period_of, period_bounds
+
+log = logging.getLogger(__name__)
+
+PAYLINK_WORKERS       = int(os.getenv("PAYLINK_WORKERS", "8"))
+PAYLINK_FLUSH_EVERY   = int(os.getenv("PAYLINK_FLUSH_EVERY", "100"))
+PAYLINK_CHECK_MINUTES = float(os.getenv("PAYLINK_CHECK_MINUTES", "0"))   # 0 = sin hilo
+PAYLINK_TZ_OFFSET     = os.getenv("PAYLINK_TZ_OFFSET", "-03:00")          # huso de los vencimientos
+
+
+def reference_for(student_id: int, period: str, tenant: Optional[str] = None, revision: int = 0) -> str:
+    reference = f"{student_id}-{period}"
+    if revision:
+        reference = f"{reference}-r{revision}"
+    if tenant:
+        # Misma cuenta de MP para todas las academias: que no choquen
+        reference = f"{tenant}:{reference}"
+    return reference
+
+
+def preference_payload(name: str, label: str, total: float, external_reference: str,
+                       expires_on: Optional[date] = None) -> dict:
+    payload = {
+        "items": [
+            {
+                "title": f"Pago cuota {label} - {name}",
+                "quantity": 1,
+                "currency_id": "ARS",
+                "unit_price": total
+            }
+        ],
+        "external_reference": external_reference,
+        "back_urls": {
+            "success": f"{BASE_URL}payment/success",
+            "failure": f"{BASE_URL}payment/failed",
+            "pending": f"{BASE_URL}payment/pending"
+        },
+        "auto_return": "approved"
+    }
+    if expires_on:
+        # Deja de aceptar pagos a las 00:00 de ese día (hora local)
+        payload.update(expires=True,
+                       expiration_date_to=f"{expires_on.isoformat()}T00:00:00.000{PAYLINK_TZ_OFFSET}")
+    return payload
+
+
+def select_due(db: Session, period: str, today: date = None, limit: int = None) -> List[dict]:
+    """
+    Alumnos a los que les falta link (o cuyo link quedó con otro monto),
+    con el total a cobrar en el período.
+    """
+    start, _ = period_bounds(period)
+    surcharge = crud.surcharge_for(today or date.today())
+    propagation.ensure_built(db)
+    q = (
+        select(Student.id, Student.name, StudentDues.subtotal)
+        .join(StudentDues, StudentDues.student_id == Student.id)
+        .where(
+            Student.status == "activo",
+            StudentDues.course_count > 0,
+            or_(Student.last_paid_date.is_(None), Student.last_paid_date < start),
+        )
+        .order_by(Student.id)
+    )
+    existing = {
+        r.student_id: r for r in db.execute(
+            select(PaymentLink.student_id, PaymentLink.status, PaymentLink.amount, PaymentLink.revision)
+            .where(PaymentLink.period == period)
+        )
+    }
+    rows = []
+    for r in db.execute(q):
+        total = (r.subtotal or 0.0) + surcharge
+        link = existing.get(r.id)
+        if link is not None and (link.status == "paid" or (link.status == "ready" and link.amount == total)):
+            continue
+        rows.append({"id": r.id, "name": r.name, "total": total,
+                     "revision": link.revision + 1 if link is not None else 0})
+        if limit and len(rows) >= limit:
+            break
+    return rows
+
+
+def _create(row: dict, period: str, tenant: Optional[str]) -> dict:
+    reference = reference_for(row["id"], period, tenant, row["revision"])
+    result = {"student_id": row["id"], "amount": row["total"], "external_reference": reference,
+              "revision": row["revision"], "preference_id": None, "init_point": None, "error": None}
+    _, expires_on = period_bounds(period)
+    try:
+        status_code, data = mp_api.create_preference(
+            preference_payload(row["name"], period, row["total"], reference, expires_on))
+        link = mp_api.init_point(data)
+        if status_code != 201 or not link:
+            result.update(status="failed", error=f"HTTP {status_code}: {data}"[:500])
+        else:
+            result.update(status="ready", preference_id=str(data.get("id") or ""), init_point=link)
+    except Exception as exc:
+        result.update(status="failed", error=repr(exc)[:500])
+    return result
+
+
+def _record(db: Session, period: str, results: List[dict]):
+    """
+    Guarda un lote (upsert por alumno+período) y los checkouts pendientes de
+    los links creados, en una transacción. El checkout del link que se
+    reemplaza (revisión anterior) pasa a "superseded".
+    """
+    now = datetime.utcnow()
+    for r in results:
+        previous = select(PaymentLink.external_reference).where(
+            PaymentLink.student_id == r["student_id"], PaymentLink.period == period,
+            PaymentLink.status != "paid")
+        db.execute(
+            update(Checkout)
+            .where(Checkout.external_reference.in_(previous),
+                   Checkout.external_reference != r["external_reference"],
+                   Checkout.status == "pending")
+            .values(status="superseded")
+            .execution_options(synchronize_session=False)
+        )
+        stmt = crud.dialect_insert(db, PaymentLink).values(period=period, created_at=now, **r)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["student_id", "period"],
+            set_={k: getattr(stmt.excluded, k) for k in (
+                "amount", "external_reference", "revision", "preference_id", "init_point", "status", "error",
+                "created_at")},
+            where=(PaymentLink.status != "paid"),
+        )
+        db.execute(stmt)
+        if r["status"] != "ready":
+            continue
+        chk = crud.dialect_insert(db, Checkout).values(
+            student_id=r["student_id"], external_reference=r["external_reference"],
+            amount=r["amount"], created_at=now, status="pending",
+        )
+        chk = chk.on_conflict_do_update(
+            index_elements=["external_reference"],
+            set_={"amount": chk.excluded.amount},
+            where=(Checkout.status == "pending"),
+        )
+        db.execute(chk)
+    versions.bump(db, "payment_links", "checkouts")
+    db.commit()
+
+
+def generate(db: Session, period: str = None, limit: int = None, dry_run: bool = False) -> Dict[str, float]:
+    """
+    Crea los links que falten del período. Devuelve contadores.
+    """
+    period = period or period_of(date.today())
+    rows = select_due(db, period, limit=limit)
+    stats = {"period": period, "selected": len(rows), "ready": 0, "failed": 0}
+    if dry_run or not rows:
+        return stats
+
+    tenant = tenants.current_tenant.get()
+    started = time.monotonic()
+    pending: List[dict] = []
+    with ThreadPoolExecutor(max_workers=PAYLINK_WORKERS, thread_name_prefix="paylinks") as pool:
+        futures = [pool.submit(_create, row, period, tenant) for row in rows]
+        for future in as_completed(futures):
+            result = future.result()
+            stats[result["status"]] += 1
+            pending.append(result)
+            if len(pending) >= PAYLINK_FLUSH_EVERY:
+                _record(db, period, pending)
+                pending = []
+    if pending:
+        _record(db, period, pending)
+    elapsed = time.monotonic() - started
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["per_s"] = round(len(rows) / elapsed, 2) if elapsed > 0 else 0.0
+    return stats
+
+
+def ready_link(db: Session, student_id: int, period: str) -> Optional[PaymentLink]:
+    """
+    Link listo para pagar del alumno en el período (una búsqueda por índice).
+    """
+    return db.execute(
+        select(PaymentLink).where(PaymentLink.student_id == student_id,
+                                  PaymentLink.period == period,
+                                  PaymentLink.status == "ready")
+    ).scalars().first()
+
+
+def _engines():
+    from ..database import engine
+
+    if not tenants.enabled():
+        return [(None, engine)]
+    with tenants.engines.lock:
+        return [(slug, entry[0]) for slug, entry in tenants.engines.engines.items()]
+
+
+def generate_all(period: str = None) -> Dict[str, dict]:
+    """
+    generate() en la DB de la app o, en multi-academia, en la de cada
+    tenant abierto (con el tenant puesto, para las external_reference).
+    """
+    from ..database import SessionLocal
+
+    result = {}
+    for slug, eng in _engines():
+        token = tenants.current_tenant.set(slug)
+        db = SessionLocal(bind=eng)
+        try:
+            result[slug or "default"] = generate(db, period)
+        finally:
+            db.close()
+            tenants.current_tenant.reset(token)
+    return result
+
+
+def start_scheduler(interval_minutes: float = None) -> Optional[threading.Thread]:
+    """
+    Lanza el hilo que genera los links del período en curso (si el
+    intervalo es > 0). La primera pasada de cada período crea todos; las
+    siguientes sólo los nuevos o los que cambiaron de monto.
+    """
+    interval_minutes = PAYLINK_CHECK_MINUTES if interval_minutes is None else interval_minutes
+    if interval_minutes <= 0:
+        return None
+
+    def loop():
+        while True:
+            try:
+                result = generate_all()
+                if any(r["selected"] for r in result.values()):
+                    log.info("Links de pago generados", extra={"result": result})
+            except Exception:
+                log.exception("Error generando links de pago")
+            time.sleep(interval_minutes * 60)
+
+    t = threading.Thread(target=loop, name="paylinks", daemon=True)
+    t.start()
+    return t
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine, SessionLocal
+
+    parser = argparse.ArgumentParser(description="Pregenera los links de pago del período")
+    parser.add_argument("--period", help="Período YYYY-MM (por defecto el actual)")
+    parser.add_argument("--dry-run", action="store_true", help="Sólo cuenta alumnos")
+    parser.add_argument("--limit", type=int, help="Máximo de links en esta corrida")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        log.info("Links de pago", extra={"result": generate(db, args.period, args.limit, args.dry_run)})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
 # app/services/payments.py
-import mercadopago
 import datetime
-from app.config import MP_ACCESS_TOKEN, BASE_URL
+import logging
+from functools import lru_cache
 
-sdk = mercadopago.SDK(MP_ACCESS_TOKEN)
+from ..config import MP_ACCESS_TOKEN, BASE_URL
+
+log = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_sdk():
+    """
+    Cliente del SDK de Mercado Pago, creado al primer uso: importar el SDK
+    (y requests) en cada arranque del worker es caro y casi nunca se usa.
+    """
+    import mercadopago
+    return mercadopago.SDK(MP_ACCESS_TOKEN)
 
 def calculate_total(subtotal: float) -> (float, float):
     today = datetime.date.today()
@@ -18,7 +30,7 @@ def create_payment_preference(
 ) -> str:
     # Si no hay ACCESS_TOKEN, no podemos seguir
     if not MP_ACCESS_TOKEN:
-        raise ValueError("MP_ACCESS_TOKEN no configurado en app/config.py")
+        raise ValueError("MP_ACCESS_TOKEN no configurado (variable de entorno)")
 
     ref_code = f"{student_id}-{datetime.date.today().isoformat()}"
     preference_data = {
@@ -39,12 +51,11 @@ def create_payment_preference(
         # "sandbox_mode": True,  # descomentá si querés obligar sandbox
     }
 
-    pref = sdk.preference().create(preference_data)
+    pref = get_sdk().preference().create(preference_data)
     resp = pref.get("response", {}) or {}
 
-    # Para debug: imprimimos en stdout la respuesta completa
-    print("=== MercadoPago preference response =====")
-    print(resp)
+    # Para debug: respuesta completa (LOG_LEVELS="app.services.payments=DEBUG")
+    log.debug("Respuesta de preferencia de MercadoPago", extra={"response": resp})
 
     # Retornamos init_point (producción) o sandbox_init_point (sandbox)
     init = resp.get("init_point") or resp.get("sandbox_init_point")
@@ -0,0 +1,115 @@
+# app/services/pdf.py
+"""
+Generador mínimo de PDF (una página A4, texto con Helvetica) sin dependencias.
+
+Corre dentro de los procesos del ProcessPoolExecutor de receipts.py: por eso
+este módulo no importa nada de la app (ni SQLAlchemy ni FastAPI) y sólo
+recibe datos planos (dicts) ya leídos de la DB.
+"""
+
+import zlib
+from typing import List, Tuple
+
+# Cambiar al modificar el diseño: invalida el cache en disco
+LAYOUT_VERSION = "1"
+
+PAGE_W, PAGE_H = 595, 842   # A4 en puntos
+MARGIN = 56
+
+
+def _esc(text: str) -> bytes:
+    raw = str(text).encode("cp1252", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _money(value) -> str:
+    # 15000.5 -> "$ 15.000,50"
+    s = f"{float(value or 0):,.2f}"
+    return "$ " + s.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def build_pdf(lines: List[Tuple[str, int, str]]) -> bytes:
+    """
+    `lines`: tuplas (texto, tamaño, "F1"|"F2"); F2 es negrita. Se escriben
+    de arriba hacia abajo. Devuelve los bytes del PDF.
+    """
+    ops = [b"BT"]
+    y = PAGE_H - MARGIN
+    for text, size, font in lines:
+        y -= int(size * 1.6)
+        ops.append(b"/%s %d Tf 1 0 0 1 %d %d Tm (%s) Tj" % (font.encode(), size, MARGIN, y, _esc(text)))
+    ops.append(b"ET")
+    stream = zlib.compress(b"\n".join(ops), 9)
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+        b"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>" % (PAGE_W, PAGE_H),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def render_receipt(data: dict) -> bytes:
+    """
+    Recibo de un pago. `data` viene de receipts.receipt_data().
+    """
+    lines = [
+        ("AlmaPaid", 20, "F2"),
+        (f"Recibo de pago N° {data['payment_id']:08d}", 14, "F2"),
+        ("", 10, "F1"),
+        (f"Alumno: {data['student_name']}", 11, "F1"),
+        (f"DNI: {data.get('dni') or '-'}", 11, "F1"),
+        (f"Fecha de pago: {data['paid_date']}", 11, "F1"),
+        ("", 10, "F1"),
+        ("Talleres", 12, "F2"),
+    ]
+    for c in data.get("courses", []):
+        lines.append((f"   {c['title']}  —  {_money(c['monthly_fee'])}", 11, "F1"))
+    lines += [
+        ("", 10, "F1"),
+        (f"Importe recibido: {_money(data['amount'])}", 13, "F2"),
+    ]
+    return build_pdf(lines)
+
+
+def render_statement(data: dict) -> bytes:
+    """
+    Estado de cuenta mensual de un alumno. `data` viene de receipts.statement_data().
+    """
+    lines = [
+        ("AlmaPaid", 20, "F2"),
+        (f"Estado de cuenta — {data['period']}", 14, "F2"),
+        ("", 10, "F1"),
+        (f"Alumno: {data['student_name']}", 11, "F1"),
+        (f"DNI: {data.get('dni') or '-'}", 11, "F1"),
+        ("", 10, "F1"),
+        ("Cuotas del período", 12, "F2"),
+    ]
+    for c in data.get("courses", []):
+        lines.append((f"   {c['title']}  —  {_money(c['monthly_fee'])}", 11, "F1"))
+    lines.append((f"   Subtotal: {_money(data['subtotal'])}", 11, "F1"))
+    lines += [("", 10, "F1"), ("Pagos registrados", 12, "F2")]
+    if not data.get("payments"):
+        lines.append(("   (sin pagos en el período)", 11, "F1"))
+    for p in data.get("payments", []):
+        lines.append((f"   {p['paid_date']}  —  {_money(p['amount'])}  (N° {p['id']:08d})", 11, "F1"))
+    lines += [
+        ("", 10, "F1"),
+        (f"Total pagado: {_money(data['paid'])}", 12, "F2"),
+        (f"Saldo: {_money(data['balance'])}", 12, "F2"),
+    ]
+    return build_pdf(lines)
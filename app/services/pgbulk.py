@@ -0,0 +1,347 @@
+# app/services/pgbulk.py
+"""
+Camino masivo para Postgres: COPY y cursores del lado del servidor.
+
+El ORM trae y arma un objeto por fila; para cargas y exportaciones grandes
+eso domina el tiempo y la memoria. Con Postgres (USE_POSTGRES=1):
+
+  - copy_in():   COPY tabla (cols) FROM STDIN, con las filas convertidas a
+                 formato texto de COPY a medida que el servidor las lee.
+  - copy_out():  COPY (SELECT ...) TO STDOUT WITH CSV: el servidor arma el
+                 CSV y el cliente sólo lo copia.
+  - stream_rows(): cursor con nombre (stream_results / yield_per): las filas
+                 llegan de a PG_STREAM_BATCH, sin cargar el resultado entero.
+
+Con sqlite (o cualquier otro motor) las mismas funciones caen en
+executemany por lotes / csv.writer sobre stream_rows(), así el resto de la
+app no tiene que preguntar qué DB hay abajo.
+
+Exportaciones: export_csv() (GET /admin/export/<tabla>.csv).
+Cargas: CLI, con un CSV con encabezado (las columnas son las del encabezado).
+
+    python -m app.services.pgbulk load students alumnos.csv
+    python -m app.services.pgbulk export payments pagos.csv
+
+Las cargas por COPY no pasan por el flush del ORM: no quedan en el audit log
+ni en el feed de cambios; se hace versions.bump() de la tabla (los caches
+que miran esas versiones, hotcache y roster, se recargan) y se recalculan
+todos los derivados de propagation.py.
+
+Ver scripts/bench_pg.py para medir la diferencia contra un Postgres local.
+"""
+
+import csv
+import io
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator, List, Sequence
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from ..models import Checkout, Course, Enrollment, Payment, Student
+from . import propagation, versions
+
+log = logging.getLogger(__name__)
+
+PG_STREAM_BATCH = int(os.getenv("PG_STREAM_BATCH", "1000"))
+PG_COPY_CHUNK   = int(os.getenv("PG_COPY_CHUNK", str(64 * 1024)))   # bytes por lectura/escritura de COPY
+
+# Tablas que se pueden exportar y cargar, con las columnas que se exportan
+TABLES = {
+    "students":    (Student, ["id", "name", "email", "dni", "status", "last_paid_date"]),
+    "courses":     (Course, ["id", "title", "monthly_fee"]),
+    "enrollments": (Enrollment, ["id", "student_id", "course_id", "status"]),
+    "payments":    (Payment, ["id", "student_id", "amount", "paid_date"]),
+    "checkouts":   (Checkout, ["id", "student_id", "external_reference", "amount", "created_at",
+                               "status", "gateway_payment_id", "payment_id"]),
+}
+
+
+def is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def export_query(table: str):
+    model, columns = TABLES[table]
+    return select(*(getattr(model, c) for c in columns)).order_by(model.id)
+
+
+# -------- Lectura --------
+def stream_rows(db: Session, stmt, batch: int = None):
+    """
+    Ejecuta stmt con un cursor del servidor (en Postgres, un cursor con
+    nombre) y devuelve el Result: iterarlo trae las filas de a `batch`.
+    """
+    return db.execute(stmt.execution_options(stream_results=True, yield_per=batch or PG_STREAM_BATCH))
+
+
+def _raw_connection(db: Session):
+    # Conexión de psycopg2 de la transacción en curso de la sesión
+    return db.connection().connection.driver_connection
+
+
+def _compiled_sql(db: Session, stmt, cursor) -> str:
+    compiled = stmt.compile(dialect=db.get_bind().dialect)
+    return cursor.mogrify(str(compiled), compiled.params).decode()
+
+
+def copy_out(db: Session, stmt, out) -> None:
+    """
+    Escribe en `out` (archivo de texto) el resultado de stmt como CSV con
+    encabezado.
+    """
+    if is_postgres(db.get_bind()):
+        with _raw_connection(db).cursor() as cur:
+            sql = _compiled_sql(db, stmt, cur)
+            cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", out, size=PG_COPY_CHUNK)
+        return
+    result = stream_rows(db, stmt)
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(result.keys())
+    for rows in result.partitions():
+        writer.writerows(rows)
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _QueueWriter(io.TextIOBase):
+    """
+    Archivo de sólo escritura que pasa lo escrito a una cola acotada: COPY
+    escribe desde un hilo y la respuesta HTTP lo va leyendo. Si se pide
+    `stop` (el cliente se fue) la escritura falla y el COPY se corta.
+    """
+
+    def __init__(self, q: "queue.Queue", stop: threading.Event):
+        self.q = q
+        self.stop = stop
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        chunk = data.decode() if isinstance(data, bytes) else data
+        while not self.stop.is_set():
+            try:
+                self.q.put(chunk, timeout=0.1)
+                return len(data)
+            except queue.Full:
+                continue
+        raise _Cancelled("exportación cancelada")
+
+
+_DONE = object()
+
+
+def export_csv(open_session: Callable[[], Session], table: str) -> Iterator[str]:
+    """
+    Generador de trozos de CSV de la tabla, para una StreamingResponse.
+    Abre su propia sesión (la del request ya está cerrada cuando se
+    manda el cuerpo). En Postgres el COPY corre en un hilo y la cola
+    (acotada) frena al servidor si el cliente lee más lento; si el cliente
+    corta, se cancela el COPY y se espera al hilo antes de cerrar la sesión
+    (la conexión vuelve al pool sin un COPY a medias).
+    """
+    stmt = export_query(table)
+    db = open_session()
+    try:
+        if not is_postgres(db.get_bind()):
+            buf = io.StringIO()
+            result = stream_rows(db, stmt)
+            writer = csv.writer(buf, lineterminator="\n")
+            writer.writerow(result.keys())
+            for rows in result.partitions():
+                writer.writerows(rows)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue()
+            return
+
+        q: "queue.Queue" = queue.Queue(maxsize=64)
+        stop = threading.Event()
+        failure: List[BaseException] = []
+        raw = _raw_connection(db)
+
+        def run():
+            try:
+                copy_out(db, stmt, _QueueWriter(q, stop))
+            except BaseException as exc:   # se relanza en el generador
+                failure.append(exc)
+            finally:
+                if not stop.is_set():
+                    q.put(_DONE)
+
+        worker = threading.Thread(target=run, name=f"copy-out-{table}", daemon=True)
+        worker.start()
+        finished = False
+        try:
+            while True:
+                chunk = q.get()
+                if chunk is _DONE:
+                    break
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                # El cliente cortó (GeneratorExit) o falló el envío
+                stop.set()
+                try:
+                    raw.cancel()
+                except Exception:
+                    log.warning("No se pudo cancelar el COPY de %s", table, exc_info=True)
+                while worker.is_alive():
+                    try:
+                        q.get(timeout=0.1)   # libera un put() en curso
+                    except queue.Empty:
+                        pass
+            worker.join()
+        if failure:
+            raise failure[0]
+    finally:
+        db.close()
+
+
+# -------- Carga --------
+def _copy_text(value) -> str:
+    """
+    Un valor en el formato texto de COPY (\\N = NULL).
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    text = value.isoformat() if hasattr(value, "isoformat") else str(value)
+    return (text.replace("\\", "\\\\").replace("\t", "\\t")
+                .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class _RowsReader(io.TextIOBase):
+    """
+    Archivo de sólo lectura sobre un iterable de filas, en formato texto de
+    COPY: copy_expert lo lee de a trozos, sin armar todo en memoria.
+    """
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self.rows = iter(rows)
+        self.buf = ""
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buf) < size:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            self.buf += "\t".join(_copy_text(v) for v in row) + "\n"
+            self.count += 1
+        if size < 0:
+            out, self.buf = self.buf, ""
+        else:
+            out, self.buf = self.buf[:size], self.buf[size:]
+        return out
+
+
+def copy_in(db: Session, table: str, columns: List[str], rows: Iterable[Sequence],
+            batch: int = 1000, commit: bool = True) -> int:
+    """
+    Carga filas (tuplas en el orden de `columns`) en la tabla. En Postgres
+    con COPY FROM STDIN; si no, con INSERT executemany de a `batch`.
+    Devuelve la cantidad de filas cargadas.
+    """
+    model, allowed = TABLES[table]
+    unknown = set(columns) - set(allowed)
+    if unknown:
+        raise ValueError(f"Columnas desconocidas para {table}: {sorted(unknown)}")
+
+    if is_postgres(db.get_bind()):
+        reader = _RowsReader(rows)
+        cols = ", ".join(f'"{c}"' for c in columns)
+        with _raw_connection(db).cursor() as cur:
+            cur.copy_expert(f'COPY "{model.__tablename__}" ({cols}) FROM STDIN', reader, size=PG_COPY_CHUNK)
+        loaded = reader.count
+        if "id" in columns:
+            # Las filas traen id: que la secuencia no reparta ids ya usados
+            db.connection().exec_driver_sql(
+                f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM \"{model.__tablename__}\"), 1))"
+            )
+    else:
+        loaded, chunk = 0, []
+        for row in rows:
+            chunk.append(dict(zip(columns, row)))
+            if len(chunk) >= batch:
+                db.execute(insert(model), chunk)
+                loaded += len(chunk)
+                chunk = []
+        if chunk:
+            db.execute(insert(model), chunk)
+            loaded += len(chunk)
+
+    propagation.touch_all(db, table)
+    versions.bump(db, table)
+    if commit:
+        db.commit()
+    return loaded
+
+
+def _parser(column) -> Callable[[str], object]:
+    kind = column.type.python_type
+    if kind is datetime:
+        return datetime.fromisoformat
+    if kind is date:
+        return date.fromisoformat
+    if kind in (int, float):
+        return kind
+    return str
+
+
+def load_csv(db: Session, table: str, path: str) -> int:
+    """
+    Carga un CSV con encabezado; celdas vacías = NULL.
+    """
+    model, _ = TABLES[table]
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        parsers = [_parser(model.__table__.c[c]) if c in model.__table__.c else str for c in columns]
+        rows = ([p(v) if v != "" else None for p, v in zip(parsers, row)] for row in reader)
+        return copy_in(db, table, columns, rows)
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine, SessionLocal
+
+    args = sys.argv[1:]
+    if len(args) != 3 or args[0] not in ("load", "export") or args[1] not in TABLES:
+        print("Uso: python -m app.services.pgbulk load|export <tabla> <archivo.csv>\n"
+              f"Tablas: {', '.join(TABLES)}")
+        sys.exit(2)
+    command, table, path = args
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if command == "load":
+            result = {"table": table, "loaded": load_csv(db, table, path)}
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as out:
+                copy_out(db, export_query(table), out)
+            result = {"table": table, "path": path}
+    finally:
+        db.close()
+    log.info("pgbulk %s", command, extra={"result": result})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# app/services/propagation.py
+"""
+Propagación de cambios a los datos derivados.
+
+Cambiar la cuota de un taller, inscribir o dar de baja a un alumno cambia
+números que se guardan precalculados. Acá se declara de qué depende cada
+uno y, en cada transacción, se recalcula sólo lo afectado:
+
+  DERIVED (en orden):
+    - student_dues:  cuota mensual de cada alumno (suma de sus talleres).
+    - payment_links: links pregenerados (paylinks.py) "ready" cuyo monto ya
+      no coincide con la cuota + recargo pasan a "stale" (el pago cae al
+      camino en vivo y la próxima corrida de paylinks los regenera).
+
+  Cada derivado lista sus fuentes como (tabla, columna); columna None es
+  alta o baja de filas. Un cambio en una fuente se traduce en un alcance
+  (Scope): alumnos afectados directamente (alumno, inscripción) y talleres
+  cuyos inscriptos se ven afectados (cuota de un taller).
+
+Cómo se llena:
+  - after_flush mira los objetos nuevos, modificados (sólo las columnas que
+    cambiaron) y borrados del ORM y anota el alcance de cada derivado en
+    session.info;
+  - before_commit recalcula cada derivado con UNA sentencia por derivado
+    sobre todo el alcance (INSERT ... SELECT ... GROUP BY con upsert, UPDATE
+    con subconsulta), en la misma transacción, y hace versions.bump() de lo
+    que tocó. Corre antes que el before_commit de changefeed, así el lock
+    de "change_log" sigue siendo el último que se toma.
+  - Las sentencias masivas de crud / archive llaman a touch() con los ids;
+    las cargas por COPY (pgbulk) a touch_all().
+
+Los caches en memoria (hotcache, roster) no se listan acá: se invalidan
+solos por versión de tabla.
+
+    python -m app.services.propagation rebuild
+"""
+
+import logging
+import sys
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, exists, func, inspect, literal, or_, select, true, update
+from sqlalchemy.orm import Session
+
+from .. import crud
+from ..models import Course, Enrollment, PaymentLink, Student, StudentDues
+from . import versions
+
+log = logging.getLogger(__name__)
+
+PENDING_KEY = "propagation_pending"
+
+
+class Scope:
+    """
+    Alcance de un cambio: alumnos afectados y talleres cuyos inscriptos lo
+    están. all=True: todos los alumnos.
+    """
+    __slots__ = ("students", "courses", "all")
+
+    def __init__(self, students: Iterable[int] = (), courses: Iterable[int] = (), all: bool = False):
+        self.students: Set[int] = set(students)
+        self.courses: Set[int] = set(courses)
+        self.all = all
+
+    def __bool__(self):
+        return self.all or bool(self.students or self.courses)
+
+    def student_filter(self, column):
+        """
+        Condición SQL: `column` (un id de alumno) cae en el alcance.
+        """
+        if self.all:
+            return true()
+        conds = []
+        if self.students:
+            conds.append(column.in_(sorted(self.students)))
+        if self.courses:
+            conds.append(column.in_(
+                select(Enrollment.student_id).where(Enrollment.course_id.in_(sorted(self.courses)))
+            ))
+        return or_(*conds)
+
+
+class Derived:
+    def __init__(self, name: str, sources: Set[Tuple[str, Optional[str]]],
+                 refresh: Callable[[Session, Scope, datetime], int]):
+        self.name = name
+        self.sources = sources
+        self.refresh = refresh
+
+
+# -------- Recalculo de cada derivado --------
+def refresh_dues(db: Session, scope: Scope, now: datetime) -> int:
+    """
+    Recalcula student_dues de los alumnos del alcance en una sentencia
+    (sólo escribe las filas que cambian) y borra las de alumnos que ya no
+    existen.
+    """
+    computed = (
+        select(Student.id, func.coalesce(func.sum(Course.monthly_fee), 0.0),
+               func.count(Course.id), literal(now))
+        .select_from(Student)
+        .outerjoin(Enrollment, Enrollment.student_id == Student.id)
+        .outerjoin(Course, Course.id == Enrollment.course_id)
+        .where(scope.student_filter(Student.id))
+        .group_by(Student.id)
+    )
+    stmt = crud.dialect_insert(db, StudentDues).from_select(
+        ["student_id", "subtotal", "course_count", "updated_at"], computed)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["student_id"],
+        set_={"subtotal": stmt.excluded.subtotal, "course_count": stmt.excluded.course_count,
+              "updated_at": stmt.excluded.updated_at},
+        where=or_(StudentDues.subtotal != stmt.excluded.subtotal,
+                  StudentDues.course_count != stmt.excluded.course_count),
+    )
+    changed = db.execute(stmt).rowcount
+    if scope.students or scope.all:
+        gone = ~exists().where(Student.id == StudentDues.student_id)
+        if not scope.all:
+            gone = gone & StudentDues.student_id.in_(sorted(scope.students))
+        changed += db.execute(delete(StudentDues).where(gone)
+                              .execution_options(synchronize_session=False)).rowcount
+    return changed
+
+
+def mark_stale_links(db: Session, scope: Scope, now: datetime) -> int:
+    """
+    Pasa a "stale" los links "ready" del alcance cuyo monto ya no es la
+    cuota + recargo vigente.
+    """
+    subtotal = (select(StudentDues.subtotal)
+                .where(StudentDues.student_id == PaymentLink.student_id)
+                .scalar_subquery())
+    total = func.coalesce(subtotal, 0.0) + crud.surcharge_for(date.today())
+    return db.execute(
+        update(PaymentLink)
+        .where(PaymentLink.status == "ready",
+               scope.student_filter(PaymentLink.student_id),
+               PaymentLink.amount != total)
+        .values(status="stale", error="Cambió la cuota")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+DUES_SOURCES = {
+    ("students", None),
+    ("enrollments", None), ("enrollments", "student_id"), ("enrollments", "course_id"),
+    ("courses", None), ("courses", "monthly_fee"),
+}
+
+DERIVED: List[Derived] = [
+    Derived("student_dues", DUES_SOURCES, refresh_dues),
+    Derived("payment_links", DUES_SOURCES, mark_stale_links),
+]
+
+TRACKED = (Student, Enrollment, Course)
+
+
+# -------- Captura de cambios --------
+def _pending(session: Session) -> Dict[str, Scope]:
+    return session.info.setdefault(PENDING_KEY, {})
+
+
+def _scope_of(obj, scope: Scope):
+    if isinstance(obj, Student):
+        scope.students.add(obj.id)
+    elif isinstance(obj, Enrollment):
+        # Si cambió de alumno, también el anterior
+        previous = inspect(obj).attrs.student_id.history.deleted or ()
+        scope.students.update(v for v in (obj.student_id, *previous) if v is not None)
+    elif isinstance(obj, Course):
+        scope.courses.add(obj.id)
+
+
+def _note(session: Session, obj, columns: Iterable[Optional[str]]):
+    table = obj.__tablename__
+    columns = set(columns)
+    for derived in DERIVED:
+        if any((table, c) in derived.sources for c in columns):
+            _scope_of(obj, _pending(session).setdefault(derived.name, Scope()))
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context):
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, TRACKED):
+            _note(session, obj, [None])
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED) and session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            changed = [col.key for col in state.mapper.column_attrs
+                       if state.attrs[col.key].history.has_changes()]
+            if changed:
+                _note(session, obj, changed)
+
+
+@event.listens_for(Session, "before_commit", insert=True)
+def _before_commit(session: Session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    now = datetime.utcnow()
+    touched = []
+    for derived in DERIVED:
+        scope = pending.get(derived.name)
+        if scope:
+            derived.refresh(session, scope, now)
+            touched.append(derived.name)
+    versions.bump(session, *touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def touch(db: Session, table: str, students: Iterable[int] = (), courses: Iterable[int] = (),
+          column: Optional[str] = None):
+    """
+    Anota cambios hechos con sentencias masivas (no pasan por el flush del
+    ORM): filas de `table` (alta/baja si column es None) que afectan a esos
+    alumnos / talleres. Se propagan al confirmar la transacción.
+    """
+    students, courses = list(students), list(courses)
+    for derived in DERIVED:
+        if (table, column) in derived.sources:
+            scope = _pending(db).setdefault(derived.name, Scope())
+            scope.students.update(students)
+            scope.courses.update(courses)
+
+
+def touch_all(db: Session, table: str):
+    """
+    Cambios en `table` sin ids conocidos (p.ej. COPY): se recalcula todo.
+    """
+    for derived in DERIVED:
+        if (table, None) in derived.sources:
+            _pending(db)[derived.name] = Scope(all=True)
+
+
+# -------- Reconstrucción --------
+def rebuild(db: Session) -> Dict[str, int]:
+    """
+    Recalcula todos los derivados desde cero en una transacción.
+    """
+    now = datetime.utcnow()
+    result = {d.name: d.refresh(db, Scope(all=True), now) for d in DERIVED}
+    versions.bump(db, *result)
+    db.commit()
+    return result
+
+
+def ensure_built(db: Session) -> bool:
+    """
+    Si student_dues está vacía pero hay alumnos, la reconstruye.
+    """
+    if db.execute(select(StudentDues.student_id).limit(1)).first():
+        return False
+    if not db.execute(select(Student.id).limit(1)).first():
+        return False
+    rebuild(db)
+    return True
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine, SessionLocal
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("Uso: python -m app.services.propagation rebuild")
+        sys.exit(2)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        log.info("Derivados reconstruidos", extra={"result": rebuild(db)})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
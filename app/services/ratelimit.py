@@ -0,0 +1,152 @@
+# app/services/ratelimit.py
+"""
+Limitación de tasa en proceso para el endpoint público de pagos.
+
+- TokenBucket: cubeta de fichas clásica (tasa + ráfaga), thread-safe.
+- KeyedBuckets: una cubeta por clave (IP del cliente), acotada en memoria (LRU).
+- ConcurrencyLimit: tope de llamadas simultáneas al gateway; si no hay lugar
+  falla en el acto en vez de encolar.
+
+Todo falla rápido con 429 (cliente puntual) o 503 (sobrecarga global) y
+cabecera Retry-After, así los workers quedan libres para /admin.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+# --- Configuración (entorno) ---
+RATE_LIMIT_IP_PER_MIN    = float(os.getenv("RATE_LIMIT_IP_PER_MIN", "20"))
+RATE_LIMIT_IP_BURST      = float(os.getenv("RATE_LIMIT_IP_BURST", "10"))
+RATE_LIMIT_GLOBAL_PER_SEC = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SEC", "20"))
+RATE_LIMIT_GLOBAL_BURST  = float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "40"))
+RATE_LIMIT_MAX_CLIENTS   = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+GATEWAY_MAX_INFLIGHT     = int(os.getenv("GATEWAY_MAX_INFLIGHT", "4"))
+# Proxies propios delante de la app (Render: 1). Cada uno agrega una IP al
+# final de X-Forwarded-For; lo de antes lo manda el cliente y no sirve.
+TRUSTED_PROXY_HOPS       = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+
+class TokenBucket:
+    """
+    Cubeta de `capacity` fichas que se rellena a `rate` fichas por segundo.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated", "lock")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate     = rate
+        self.capacity = capacity
+        self.tokens   = capacity
+        self.updated  = time.monotonic()
+        self.lock     = threading.Lock()
+
+    def take(self, n: float = 1.0) -> float:
+        """
+        Intenta consumir `n` fichas. Devuelve 0.0 si pudo, o los segundos
+        que faltan para que haya fichas suficientes.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return 0.0
+            if self.rate <= 0:
+                return float("inf")
+            return (n - self.tokens) / self.rate
+
+
+class KeyedBuckets:
+    """
+    Una TokenBucket por clave. Guarda como máximo `max_keys` claves y descarta
+    la menos usada recientemente (una cubeta descartada vuelve llena, lo cual
+    sólo favorece a clientes inactivos).
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int):
+        self.rate     = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.buckets  = OrderedDict()
+        self.lock     = threading.Lock()
+
+    def take(self, key: str, n: float = 1.0) -> float:
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity)
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+        return bucket.take(n)
+
+
+class ConcurrencyLimit:
+    """
+    Semáforo no bloqueante: `with limit:` entra si hay lugar o lanza 503.
+    """
+
+    def __init__(self, size: int, retry_after: int = 2):
+        self.size        = size
+        self.retry_after = retry_after
+        self.sem         = threading.BoundedSemaphore(size)
+
+    def __enter__(self):
+        if not self.sem.acquire(blocking=False):
+            raise HTTPException(
+                503, "Demasiados pagos en curso, intentá de nuevo en unos segundos.",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        return self
+
+    def __exit__(self, *exc):
+        self.sem.release()
+        return False
+
+
+ip_buckets    = KeyedBuckets(RATE_LIMIT_IP_PER_MIN / 60.0, RATE_LIMIT_IP_BURST, RATE_LIMIT_MAX_CLIENTS)
+global_bucket = TokenBucket(RATE_LIMIT_GLOBAL_PER_SEC, RATE_LIMIT_GLOBAL_BURST)
+gateway_slots = ConcurrencyLimit(GATEWAY_MAX_INFLIGHT)
+
+
+def client_ip(request: Request) -> str:
+    """
+    IP del cliente. Detrás del proxy de Render la IP real es la que agregó
+    el proxy: el valor número TRUSTED_PROXY_HOPS contando desde la derecha
+    de X-Forwarded-For (los primeros los elige el cliente).
+    """
+    fwd = request.headers.get("x-forwarded-for")
+    if fwd and TRUSTED_PROXY_HOPS > 0:
+        hops = [h.strip() for h in fwd.split(",") if h.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "desconocido"
+
+
+def _retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(min(wait, 3600))))
+
+
+def limit_public(request: Request):
+    """
+    Dependencia para endpoints públicos: primero la cubeta del cliente (429),
+    después la cubeta global (503, descarte de carga).
+    """
+    wait = ip_buckets.take(client_ip(request))
+    if wait:
+        raise HTTPException(
+            429, "Demasiadas solicitudes, esperá un momento.",
+            headers={"Retry-After": _retry_after(wait)}
+        )
+    wait = global_bucket.take()
+    if wait:
+        raise HTTPException(
+            503, "Servicio saturado, intentá de nuevo en unos segundos.",
+            headers={"Retry-After": _retry_after(wait)}
+        )
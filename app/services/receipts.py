@@ -0,0 +1,225 @@
+# app/services/receipts.py
+"""
+Recibos y estados de cuenta en PDF.
+
+- Los datos se leen de la DB en el proceso principal (dicts planos).
+- El PDF se arma en un ProcessPoolExecutor (pdf.py), fuera del event loop
+  y del threadpool de Starlette.
+- El resultado se cachea en disco bajo el hash del contenido
+  (RECEIPTS_DIR/ab/abcdef....pdf): si los datos no cambiaron, no se vuelve
+  a renderizar.
+- render_month() genera todos los recibos de un período usando todos los
+  núcleos.
+
+    python -m app.services.receipts month 2026-03
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sys
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session, aliased
+
+from ..models import Course, Enrollment, Student, StudentArchive
+from . import pdf
+from .archive import payments_all, students_all
+from .rollups import period_bounds
+
+log = logging.getLogger(__name__)
+
+BASE_DIR        = pathlib.Path(__file__).resolve().parent.parent.parent
+RECEIPTS_DIR    = pathlib.Path(os.getenv("RECEIPTS_DIR", str(BASE_DIR / "receipts_cache")))
+RECEIPTS_WORKERS = int(os.getenv("RECEIPTS_WORKERS", "0")) or (os.cpu_count() or 2)
+
+_pool = None   # ProcessPoolExecutor, ver get_pool()
+
+
+def get_pool():
+    """
+    Pool de procesos, creado al primer uso. Usa "spawn": los hijos no
+    heredan los threads ni las conexiones abiertas del worker web.
+    """
+    global _pool
+    if _pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        _pool = ProcessPoolExecutor(max_workers=RECEIPTS_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# -------- Datos --------
+def _courses(db: Session, student_id: int) -> List[dict]:
+    rows = db.execute(
+        select(Course.title, Course.monthly_fee)
+        .join(Enrollment, Enrollment.course_id == Course.id)
+        .where(Enrollment.student_id == student_id)
+        .order_by(Course.title)
+    ).all()
+    return [{"title": t, "monthly_fee": fee or 0.0} for t, fee in rows]
+
+
+def _student(db: Session, student_id: int):
+    # students_all: también encuentra alumnos archivados
+    return db.execute(
+        select(students_all.c.name, students_all.c.dni).where(students_all.c.id == student_id)
+    ).first()
+
+
+def _receipt(p, name: Optional[str], dni: Optional[str], courses: List[dict]) -> dict:
+    return {
+        "kind": "receipt",
+        "payment_id": p.id,
+        "student_id": p.student_id,
+        "student_name": name if name is not None else f"#{p.student_id}",
+        "dni": (dni if name is not None else ""),
+        "amount": p.amount,
+        "paid_date": str(p.paid_date),
+        "courses": courses,
+    }
+
+
+def receipt_data(db: Session, payment_id: int) -> Optional[dict]:
+    p = db.execute(select(payments_all).where(payments_all.c.id == payment_id)).first()
+    if not p:
+        return None
+    s = _student(db, p.student_id)
+    return _receipt(p, s.name if s else None, s.dni if s else None, _courses(db, p.student_id))
+
+
+def month_receipts_data(db: Session, period: str) -> List[dict]:
+    """
+    Datos de los recibos de todos los pagos del período, en dos consultas
+    (pagos + alumno; talleres de esos alumnos), no unas cuantas por recibo.
+    """
+    start, end = period_bounds(period)
+    in_period = (payments_all.c.paid_date >= start, payments_all.c.paid_date < end)
+    # El alumno está en students o en students_archive: se cruza con las dos
+    # tablas por PK (unir con la vista students_all la recorre entera)
+    archived = aliased(StudentArchive)
+    rows = db.execute(
+        select(payments_all.c.id, payments_all.c.student_id, payments_all.c.amount,
+               payments_all.c.paid_date,
+               func.coalesce(Student.name, archived.name).label("name"),
+               case((Student.id.is_not(None), Student.dni), else_=archived.dni).label("dni"))
+        .select_from(payments_all)
+        .outerjoin(Student, Student.id == payments_all.c.student_id)
+        .outerjoin(archived, archived.id == payments_all.c.student_id)
+        .where(*in_period)
+        .order_by(payments_all.c.id)
+    ).all()
+    courses: Dict[int, List[dict]] = {}
+    for sid, title, fee in db.execute(
+        select(Enrollment.student_id, Course.title, Course.monthly_fee)
+        .join(Course, Course.id == Enrollment.course_id)
+        .where(Enrollment.student_id.in_(select(payments_all.c.student_id).where(*in_period)))
+        .order_by(Enrollment.student_id, Course.title)
+    ):
+        courses.setdefault(sid, []).append({"title": title, "monthly_fee": fee or 0.0})
+    return [_receipt(r, r.name, r.dni, courses.get(r.student_id, [])) for r in rows]
+
+
+def statement_data(db: Session, student_id: int, period: str) -> Optional[dict]:
+    s = _student(db, student_id)
+    if not s:
+        return None
+    start, end = period_bounds(period)
+    payments = db.execute(
+        select(payments_all.c.id, payments_all.c.amount, payments_all.c.paid_date)
+        .where(payments_all.c.student_id == student_id,
+               payments_all.c.paid_date >= start, payments_all.c.paid_date < end)
+        .order_by(payments_all.c.paid_date)
+    ).all()
+    courses = _courses(db, student_id)
+    subtotal = sum(c["monthly_fee"] for c in courses)
+    paid = sum(p.amount for p in payments)
+    return {
+        "kind": "statement",
+        "period": period,
+        "student_id": student_id,
+        "student_name": s.name,
+        "dni": s.dni,
+        "courses": courses,
+        "subtotal": subtotal,
+        "payments": [{"id": p.id, "amount": p.amount, "paid_date": str(p.paid_date)} for p in payments],
+        "paid": paid,
+        "balance": subtotal - paid,
+    }
+
+
+# -------- Cache en disco --------
+def cache_path(data: dict) -> pathlib.Path:
+    raw = json.dumps(data, sort_keys=True, default=str) + "|" + pdf.LAYOUT_VERSION
+    key = hashlib.sha256(raw.encode()).hexdigest()
+    return RECEIPTS_DIR / key[:2] / f"{key}.pdf"
+
+
+def _write(path: pathlib.Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def _renderer(data: dict):
+    return pdf.render_receipt if data["kind"] == "receipt" else pdf.render_statement
+
+
+async def render_cached(data: dict) -> pathlib.Path:
+    """
+    Devuelve la ruta del PDF, renderizándolo en el pool si no está en cache.
+    """
+    path = cache_path(data)
+    if not path.exists():
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(get_pool(), _renderer(data), data)
+        _write(path, content)
+    return path
+
+
+def render_month(db: Session, period: str) -> Dict[str, int]:
+    """
+    Genera (en paralelo, con todos los núcleos) los recibos de todos los
+    pagos del período que no estén ya en cache.
+    """
+    receipts = month_receipts_data(db, period)
+    todo = [data for data in receipts if not cache_path(data).exists()]
+    pool = get_pool()
+    chunk = max(1, len(todo) // (RECEIPTS_WORKERS * 4) or 1)
+    for data, content in zip(todo, pool.map(pdf.render_receipt, todo, chunksize=chunk)):
+        _write(cache_path(data), content)
+    return {"payments": len(receipts), "rendered": len(todo), "cached": len(receipts) - len(todo)}
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] != "month":
+        print("Uso: python -m app.services.receipts month YYYY-MM")
+        sys.exit(2)
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        log.info("Recibos del período %s", sys.argv[2], extra={"result": render_month(db, sys.argv[2])})
+    finally:
+        db.close()
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
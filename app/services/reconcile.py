@@ -0,0 +1,150 @@
+# app/services/reconcile.py
+"""
+Conciliación de pagos iniciados (checkouts) contra Mercado Pago.
+
+1) Toma las external_reference pendientes.
+2) Busca en /v1/payments/search los pagos aprobados actualizados desde la
+   marca de agua (job_state "reconcile.hwm"), bajando las páginas en
+   paralelo con un tope de workers.
+3) Aplica los pagos confirmados (Payment + Student.last_paid_date) en
+   transacciones por lotes y avanza la marca de agua.
+
+Se puede correr como `python -m app.services.reconcile` (p.ej. desde cron)
+o vía POST /admin/api/reconcile. Con MP_API_BASE apuntando a
+`python -m app.services.fake_gateway` se prueba en local.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+from .. import crud
+from . import mp_api
+
+log = logging.getLogger(__name__)
+
+RECONCILE_WORKERS         = int(os.getenv("RECONCILE_WORKERS", "4"))
+RECONCILE_PAGE_SIZE       = int(os.getenv("RECONCILE_PAGE_SIZE", "100"))
+RECONCILE_BATCH_SIZE      = int(os.getenv("RECONCILE_BATCH_SIZE", "200"))
+# Solapamiento hacia atrás de la marca de agua, por demoras de indexación del gateway
+RECONCILE_OVERLAP_MINUTES = int(os.getenv("RECONCILE_OVERLAP_MINUTES", "10"))
+
+HWM_KEY = "reconcile.hwm"
+
+
+def _parse_ts(value: str) -> datetime:
+    """
+    Fechas ISO de Mercado Pago ("2025-06-01T10:20:30.000-04:00") a datetime UTC naive.
+    """
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = (ts - ts.utcoffset()).replace(tzinfo=None)
+    return ts
+
+
+def _fmt_ts(ts: datetime) -> str:
+    return ts.isoformat(timespec="milliseconds") + "Z"
+
+
+def fetch_approved_since(since: datetime, until: datetime) -> List[dict]:
+    """
+    Todos los pagos aprobados con date_last_updated en [since, until].
+    La primera página da el total; el resto se baja en paralelo.
+    """
+    base = {
+        "status": "approved",
+        "sort": "date_last_updated",
+        "criteria": "asc",
+        "range": "date_last_updated",
+        "begin_date": _fmt_ts(since),
+        "end_date": _fmt_ts(until),
+        "limit": RECONCILE_PAGE_SIZE,
+    }
+    first = mp_api.search_payments({**base, "offset": 0})
+    results = list(first.get("results", []))
+    total = (first.get("paging") or {}).get("total", len(results))
+
+    offsets = range(RECONCILE_PAGE_SIZE, total, RECONCILE_PAGE_SIZE)
+    if offsets:
+        with ThreadPoolExecutor(max_workers=RECONCILE_WORKERS) as pool:
+            pages = pool.map(lambda off: mp_api.search_payments({**base, "offset": off}), offsets)
+            for page in pages:
+                results.extend(page.get("results", []))
+    return results
+
+
+def confirmed_item(mp: dict, fallback_amount: float, now: datetime) -> dict:
+    """
+    Pago aprobado del gateway -> item para crud.record_checkout_payments.
+    """
+    approved = mp.get("date_approved") or mp.get("date_last_updated")
+    return {
+        "external_reference": mp.get("external_reference"),
+        "gateway_payment_id": mp.get("id"),
+        "amount": float(mp.get("transaction_amount") or fallback_amount),
+        "paid_date": _parse_ts(approved).date() if approved else now.date(),
+    }
+
+
+def reconcile(db: Session, now: datetime = None) -> Dict[str, int]:
+    """
+    Corre una pasada incremental de conciliación. Devuelve contadores.
+    """
+    now = now or datetime.utcnow()
+    pending = {c.external_reference: c for c in crud.list_pending_checkouts(db)}
+    stats = {"pending": len(pending), "fetched": 0, "confirmed": 0, "applied": 0}
+    if not pending:
+        return stats
+
+    hwm = crud.get_job_state(db, HWM_KEY)
+    if hwm:
+        since = datetime.fromisoformat(hwm) - timedelta(minutes=RECONCILE_OVERLAP_MINUTES)
+    else:
+        since = min(c.created_at for c in pending.values())
+
+    payments = fetch_approved_since(since, now)
+    stats["fetched"] = len(payments)
+
+    confirmed = []
+    new_hwm = None
+    for mp in payments:
+        updated = mp.get("date_last_updated")
+        if updated:
+            ts = _parse_ts(updated)
+            new_hwm = ts if new_hwm is None or ts > new_hwm else new_hwm
+        ref = mp.get("external_reference")
+        if ref not in pending or mp.get("status") != "approved":
+            continue
+        confirmed.append(confirmed_item(mp, pending[ref].amount, now))
+    stats["confirmed"] = len(confirmed)
+
+    for i in range(0, len(confirmed), RECONCILE_BATCH_SIZE):
+        stats["applied"] += crud.record_checkout_payments(db, confirmed[i:i + RECONCILE_BATCH_SIZE])
+
+    # La marca de agua avanza sólo si toda la pasada terminó bien
+    if new_hwm is not None:
+        crud.set_job_state(db, HWM_KEY, new_hwm.isoformat())
+    return stats
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine, SessionLocal
+    from .. import models  # noqa: F401  (registra modelos en Base)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        stats = reconcile(db)
+        log.info("Conciliación terminada", extra={"result": stats})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# app/services/reminders.py
+"""
+Recordatorios de pago masivos por email.
+
+1) Una sola consulta trae a los alumnos activos con email, sin pago en el
+   período y sin recordatorio ya enviado (con sus talleres y subtotal).
+2) Los mensajes se arman con las plantillas Jinja de app/templates/emails.
+3) Se envían con un pool de conexiones SMTP async (aiosmtplib): la
+   concurrencia es el tamaño del pool y hay un tope de mensajes por minuto.
+4) Cada resultado se guarda en reminder_deliveries (por lotes), así una
+   corrida interrumpida se reanuda sin reenviar.
+
+    python -m app.services.reminders [--period YYYY-MM] [--dry-run] [--limit N]
+
+Prueba local contra un sumidero SMTP:
+    python -m aiosmtpd -n -l 127.0.0.1:8025
+    SMTP_HOST=127.0.0.1 SMTP_PORT=8025 python -m app.services.reminders
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime
+from email.message import EmailMessage
+from functools import lru_cache
+from typing import Dict, List
+
+from sqlalchemy import and_, exists, func, or_, select
+from sqlalchemy.orm import Session
+
+from .. import crud
+from ..models import Course, Enrollment, ReminderDelivery, Student
+from .rollups import period_of, period_bounds
+
+log = logging.getLogger(__name__)
+
+SMTP_HOST             = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT             = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USER             = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD         = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS         = os.getenv("SMTP_STARTTLS", "0").lower() in ("1", "true", "yes")
+SMTP_FROM             = os.getenv("SMTP_FROM", "AlmaPaid <no-reply@localhost>")
+REMINDER_POOL_SIZE    = int(os.getenv("REMINDER_POOL_SIZE", "4"))
+REMINDER_RATE_PER_MIN = float(os.getenv("REMINDER_RATE_PER_MIN", "120"))
+REMINDER_FLUSH_EVERY  = int(os.getenv("REMINDER_FLUSH_EVERY", "50"))
+BASE_URL              = os.getenv("BASE_URL", "")
+
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio",
+         "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
+
+
+@lru_cache(maxsize=1)
+def _env():
+    # Entorno Jinja de los mails, creado al primer render
+    from jinja2 import Environment, FileSystemLoader
+    return Environment(
+        loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "..", "templates", "emails")),
+        keep_trailing_newline=True,
+    )
+
+
+def select_unpaid(db: Session, period: str, limit: int = None) -> List[dict]:
+    """
+    Alumnos a recordar en el período, con talleres y subtotal, en UNA consulta.
+    """
+    start, _ = period_bounds(period)
+    if db.get_bind().dialect.name == "postgresql":
+        titles = func.string_agg(Course.title, ", ")
+    else:
+        titles = func.group_concat(Course.title, ", ")
+    already_sent = exists().where(
+        ReminderDelivery.period == period,
+        ReminderDelivery.student_id == Student.id,
+        ReminderDelivery.status == "sent",
+    )
+    q = (
+        select(Student.id, Student.name, Student.email,
+               func.sum(Course.monthly_fee).label("subtotal"), titles.label("courses"))
+        .join(Enrollment, Enrollment.student_id == Student.id)
+        .join(Course, Course.id == Enrollment.course_id)
+        .where(
+            Student.status == "activo",
+            and_(Student.email.isnot(None), Student.email != ""),
+            or_(Student.last_paid_date.is_(None), Student.last_paid_date < start),
+            ~already_sent,
+        )
+        .group_by(Student.id, Student.name, Student.email)
+        .order_by(Student.id)
+    )
+    if limit:
+        q = q.limit(limit)
+    return [dict(r._mapping) for r in db.execute(q)]
+
+
+def render(row: dict, period: str, today: date = None) -> EmailMessage:
+    today = today or date.today()
+    surcharge = crud.surcharge_for(today)
+    ctx = {
+        "name": row["name"],
+        "period_label": f"{MESES[int(period[5:7]) - 1]} {period[:4]}",
+        "courses": [c for c in (row["courses"] or "").split(", ") if c],
+        "subtotal": row["subtotal"] or 0.0,
+        "surcharge": surcharge,
+        "total": (row["subtotal"] or 0.0) + surcharge,
+        "base_url": BASE_URL,
+    }
+    msg = EmailMessage()
+    msg["From"] = SMTP_FROM
+    msg["To"] = row["email"]
+    msg["Subject"] = _env().get_template("reminder_subject.txt").render(ctx).strip()
+    msg.set_content(_env().get_template("reminder.txt").render(ctx))
+    return msg
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket async: como máximo `per_minute` adquisiciones por minuto.
+    """
+
+    def __init__(self, per_minute: float, burst: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1.0, min(per_minute, REMINDER_POOL_SIZE))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SMTPPool:
+    """
+    Pool de conexiones SMTP async; se conectan al primer uso y se reconectan
+    si el servidor las corta. Un rechazo del servidor para un mensaje
+    (destinatario inválido, etc.) no descarta la conexión: aiosmtplib ya
+    hizo RSET y la sesión sigue sirviendo.
+    """
+
+    def __init__(self, size: int):
+        import aiosmtplib  # dependencia sólo del mailer
+
+        self.aiosmtplib = aiosmtplib
+        self.idle = asyncio.Queue()
+        for _ in range(size):
+            self.idle.put_nowait(None)
+
+    async def _connect(self):
+        client = self.aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT, start_tls=SMTP_STARTTLS)
+        await client.connect()
+        if SMTP_USER:
+            try:
+                await client.login(SMTP_USER, SMTP_PASSWORD)
+            except Exception:
+                client.close()
+                raise
+        return client
+
+    async def send(self, msg: EmailMessage):
+        client = await self.idle.get()
+        try:
+            if client is None or not client.is_connected:
+                client = await self._connect()
+            try:
+                await client.send_message(msg)
+            except self.aiosmtplib.SMTPServerDisconnected:
+                client.close()
+                client = None
+                client = await self._connect()
+                await client.send_message(msg)
+        except (self.aiosmtplib.SMTPRecipientsRefused, self.aiosmtplib.SMTPResponseException):
+            # Rechazo de este mensaje; la conexión se devuelve al pool (si el
+            # servidor la cerró, el próximo send reconecta)
+            raise
+        except BaseException:
+            if client is not None:
+                client.close()
+            client = None
+            raise
+        finally:
+            self.idle.put_nowait(client)
+
+    async def close(self):
+        while not self.idle.empty():
+            client = self.idle.get_nowait()
+            if client is not None and client.is_connected:
+                try:
+                    await client.quit()
+                except Exception:
+                    pass
+
+
+def _record(db: Session, period: str, results: List[dict]):
+    """
+    Guarda un lote de resultados (upsert por período+alumno) en una transacción.
+    """
+    for r in results:
+        stmt = crud.dialect_insert(db, ReminderDelivery).values(
+            period=period, student_id=r["student_id"], email=r["email"],
+            status=r["status"], attempts=1, sent_at=r["sent_at"], error=r["error"],
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["period", "student_id"],
+            set_={
+                "status": stmt.excluded.status,
+                "email": stmt.excluded.email,
+                "sent_at": stmt.excluded.sent_at,
+                "error": stmt.excluded.error,
+                "attempts": ReminderDelivery.attempts + 1,
+            },
+        )
+        db.execute(stmt)
+    db.commit()
+
+
+async def send_reminders(db: Session, rows: List[dict], period: str) -> Dict[str, float]:
+    """
+    Envía los recordatorios con concurrencia acotada y tope por minuto,
+    persistiendo el progreso cada REMINDER_FLUSH_EVERY resultados.
+    """
+    pool = SMTPPool(REMINDER_POOL_SIZE)
+    limiter = AsyncRateLimiter(REMINDER_RATE_PER_MIN)
+    pending: List[dict] = []
+    stats = {"selected": len(rows), "sent": 0, "failed": 0}
+    flush_lock = asyncio.Lock()
+
+    async def flush():
+        async with flush_lock:
+            batch, pending[:] = pending[:], []
+            if batch:
+                await asyncio.to_thread(_record, db, period, batch)
+
+    async def one(row: dict):
+        await limiter.acquire()
+        result = {"student_id": row["id"], "email": row["email"],
+                  "sent_at": None, "error": None}
+        try:
+            await pool.send(render(row, period))
+            result.update(status="sent", sent_at=datetime.utcnow())
+            stats["sent"] += 1
+        except Exception as exc:
+            result.update(status="failed", error=repr(exc)[:500])
+            stats["failed"] += 1
+        pending.append(result)
+        if len(pending) >= REMINDER_FLUSH_EVERY:
+            await flush()
+
+    # Como mucho REMINDER_POOL_SIZE envíos en vuelo (uno por conexión)
+    sem = asyncio.Semaphore(REMINDER_POOL_SIZE)
+
+    async def guarded(row):
+        async with sem:
+            await one(row)
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(guarded(r) for r in rows))
+    finally:
+        await flush()
+        await pool.close()
+    elapsed = time.monotonic() - started
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["sent_per_s"] = round(stats["sent"] / elapsed, 2) if elapsed > 0 else 0.0
+    return stats
+
+
+def run(db: Session, period: str = None, dry_run: bool = False, limit: int = None) -> Dict[str, float]:
+    period = period or period_of(date.today())
+    rows = select_unpaid(db, period, limit)
+    if dry_run:
+        return {"selected": len(rows), "period": period}
+    return asyncio.run(send_reminders(db, rows, period))
+
+
+def main():
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine, SessionLocal
+
+    parser = argparse.ArgumentParser(description="Envía recordatorios de pago")
+    parser.add_argument("--period", help="Período YYYY-MM (por defecto el actual)")
+    parser.add_argument("--dry-run", action="store_true", help="Sólo cuenta destinatarios")
+    parser.add_argument("--limit", type=int, help="Máximo de mails en esta corrida")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        log.info("Recordatorios", extra={"result": run(db, args.period, args.dry_run, args.limit)})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# app/services/replicas.py
+"""
+Copias sqlite para probar en local el ruteo lectura/escritura.
+
+    python -m app.services.replicas /tmp/replica1.db /tmp/replica2.db
+    DATABASE_REPLICA_URLS="sqlite:///file:/tmp/replica1.db?mode=ro&uri=true,sqlite:///file:/tmp/replica2.db?mode=ro&uri=true"
+
+Cada destino se sobreescribe con una copia consistente del primario usando la
+API de backup de sqlite (no bloquea a los escritores). Correrlo de nuevo
+"pone al día" las réplicas; entre corridas se comportan como réplicas con lag.
+"""
+
+import logging
+import sqlite3
+import sys
+
+from ..database import engine
+
+log = logging.getLogger(__name__)
+
+
+def sync_sqlite_replicas(paths):
+    if engine.url.get_backend_name() != "sqlite":
+        raise SystemExit("El primario no es sqlite; usá réplicas reales de Postgres.")
+    src = sqlite3.connect(engine.url.database)
+    try:
+        for path in paths:
+            dst = sqlite3.connect(path)
+            try:
+                src.backup(dst, pages=1024)
+            finally:
+                dst.close()
+            log.info("%s -> %s", engine.url.database, path)
+    finally:
+        src.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python -m app.services.replicas DESTINO.db [DESTINO2.db ...]")
+        sys.exit(2)
+    from ..logs import setup_logging
+    setup_logging()
+    sync_sqlite_replicas(sys.argv[1:])
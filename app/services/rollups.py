@@ -0,0 +1,245 @@
+# app/services/rollups.py
+"""
+Agregados de recaudación y tasa de cobro por (período, taller).
+
+Los pagos se suman a la tabla revenue_rollups en la misma transacción que los
+inserta (apply_payment), así los gráficos históricos leen unas pocas filas
+pre-agregadas en vez de recorrer payments/enrollments completos.
+
+- El monto de un pago se reparte entre los talleres del alumno en proporción
+  a su cuota mensual; course_id = 0 guarda el total.
+- paid_students cuenta alumnos con al menos un pago en el período.
+- enrolled_students es la foto de inscriptos del período (se toma con el
+  primer pago del mes y se refresca con cada cambio de inscripciones).
+
+`python -m app.services.rollups rebuild` recalcula todo desde el ledger
+(vista payments_all: incluye los pagos archivados).
+"""
+
+import logging
+import sys
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update, delete
+from sqlalchemy.orm import Session
+
+from .. import crud
+from . import versions
+from ..models import Course, Enrollment, Payment, RevenueRollup
+
+log = logging.getLogger(__name__)
+
+ALL_COURSES = 0
+
+
+def period_of(d: date) -> str:
+    return f"{d.year:04d}-{d.month:02d}"
+
+
+def period_bounds(period: str):
+    y, m = int(period[:4]), int(period[5:7])
+    start = date(y, m, 1)
+    end = date(y + 1, 1, 1) if m == 12 else date(y, m + 1, 1)
+    return start, end
+
+
+def _upsert(db: Session, period: str, course_id: int, revenue: float = 0.0,
+            payments: int = 0, paid_students: int = 0):
+    """
+    Suma los deltas a la fila (period, course_id), creándola si no existe.
+    """
+    stmt = crud.dialect_insert(db, RevenueRollup).values(
+        period=period, course_id=course_id, revenue=revenue,
+        payments=payments, paid_students=paid_students, enrolled_students=0
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["period", "course_id"],
+        set_={
+            "revenue": RevenueRollup.revenue + stmt.excluded.revenue,
+            "payments": RevenueRollup.payments + stmt.excluded.payments,
+            "paid_students": RevenueRollup.paid_students + stmt.excluded.paid_students,
+        }
+    )
+    db.execute(stmt)
+
+
+def _student_fees(db: Session, student_id: int) -> Dict[int, float]:
+    rows = db.execute(
+        select(Course.id, Course.monthly_fee)
+        .join(Enrollment, Enrollment.course_id == Course.id)
+        .where(Enrollment.student_id == student_id)
+    ).all()
+    return {cid: fee or 0.0 for cid, fee in rows}
+
+
+def _shares(amount: float, fees: Dict[int, float]) -> Dict[int, float]:
+    """
+    Reparte `amount` entre talleres en proporción a la cuota.
+    """
+    if not fees:
+        return {}
+    total = sum(fees.values())
+    if total <= 0:
+        return {cid: amount / len(fees) for cid in fees}
+    return {cid: amount * fee / total for cid, fee in fees.items()}
+
+
+def apply_payment(db: Session, student_id: int, amount: float, paid_date: date):
+    """
+    Suma un pago a los agregados. Llamar ANTES de insertar el Payment y dentro
+    de la misma transacción (no hace commit).
+    """
+    period = period_of(paid_date)
+    start, end = period_bounds(period)
+    first_in_period = not db.execute(
+        select(Payment.id).where(
+            Payment.student_id == student_id,
+            Payment.paid_date >= start, Payment.paid_date < end
+        ).limit(1)
+    ).first()
+    new_period = db.execute(
+        select(RevenueRollup.id).where(
+            RevenueRollup.period == period, RevenueRollup.course_id == ALL_COURSES
+        )
+    ).first() is None
+
+    paid = 1 if first_in_period else 0
+    _upsert(db, period, ALL_COURSES, amount, 1, paid)
+    for cid, share in _shares(amount, _student_fees(db, student_id)).items():
+        _upsert(db, period, cid, share, 1, paid)
+
+    if new_period:
+        refresh_enrollment_counts(db, period)
+    versions.bump(db, "revenue_rollups")
+
+
+def refresh_enrollment_counts(db: Session, period: Optional[str] = None):
+    """
+    Actualiza enrolled_students del período (por defecto el actual) con un
+    GROUP BY sobre enrollments. No hace commit.
+    """
+    period = period or period_of(date.today())
+    counts = dict(db.execute(
+        select(Enrollment.course_id, func.count(func.distinct(Enrollment.student_id)))
+        .group_by(Enrollment.course_id)
+    ).all())
+    counts[ALL_COURSES] = db.execute(
+        select(func.count(func.distinct(Enrollment.student_id)))
+    ).scalar_one()
+
+    db.execute(
+        update(RevenueRollup)
+        .where(RevenueRollup.period == period)
+        .values(enrolled_students=0)
+        .execution_options(synchronize_session=False)
+    )
+    for cid, n in counts.items():
+        _upsert(db, period, cid)
+        db.execute(
+            update(RevenueRollup)
+            .where(RevenueRollup.period == period, RevenueRollup.course_id == cid)
+            .values(enrolled_students=n)
+            .execution_options(synchronize_session=False)
+        )
+    versions.bump(db, "revenue_rollups")
+
+
+def rebuild(db: Session) -> int:
+    """
+    Recalcula todos los agregados desde payments_all (pagos calientes +
+    archivados; reparto por talleres según las inscripciones actuales).
+    Devuelve la cantidad de filas generadas.
+    """
+    from .archive import payments_all
+
+    per_student = defaultdict(lambda: [0.0, 0])
+    for student_id, paid_date, amount in db.execute(
+        select(payments_all.c.student_id, payments_all.c.paid_date, payments_all.c.amount)
+    ):
+        acc = per_student[(student_id, period_of(paid_date))]
+        acc[0] += amount or 0.0
+        acc[1] += 1
+
+    fees_cache = {}
+    rows = defaultdict(lambda: [0.0, 0, 0])
+    for (student_id, period), (amount, n) in per_student.items():
+        if student_id not in fees_cache:
+            fees_cache[student_id] = _student_fees(db, student_id)
+        targets = {ALL_COURSES: amount, **_shares(amount, fees_cache[student_id])}
+        for cid, share in targets.items():
+            r = rows[(period, cid)]
+            r[0] += share
+            r[1] += n
+            r[2] += 1
+
+    db.execute(delete(RevenueRollup))
+    if rows:
+        db.execute(RevenueRollup.__table__.insert(), [
+            {"period": p, "course_id": cid, "revenue": r[0], "payments": r[1],
+             "paid_students": r[2], "enrolled_students": 0}
+            for (p, cid), r in rows.items()
+        ])
+    for period in {p for p, _ in rows} | {period_of(date.today())}:
+        refresh_enrollment_counts(db, period)
+    db.commit()
+    return len(rows)
+
+
+def ensure_backfilled(db: Session) -> bool:
+    """
+    Si la tabla de agregados está vacía pero hay pagos, la reconstruye.
+    """
+    if db.execute(select(RevenueRollup.id).limit(1)).first():
+        return False
+    if not db.execute(select(Payment.id).limit(1)).first():
+        return False
+    rebuild(db)
+    return True
+
+
+def time_series(db: Session, course_id: Optional[int] = None,
+                since: Optional[str] = None, until: Optional[str] = None) -> Dict[str, List]:
+    """
+    Serie mensual para Chart.js (arrays paralelos, ordenados por período).
+    """
+    q = select(RevenueRollup).where(RevenueRollup.course_id == (course_id or ALL_COURSES))
+    if since:
+        q = q.where(RevenueRollup.period >= since)
+    if until:
+        q = q.where(RevenueRollup.period <= until)
+    rows = db.execute(q.order_by(RevenueRollup.period)).scalars().all()
+    return {
+        "periods": [r.period for r in rows],
+        "revenue": [round(r.revenue, 2) for r in rows],
+        "payments": [r.payments for r in rows],
+        "paid_students": [r.paid_students for r in rows],
+        "enrolled_students": [r.enrolled_students for r in rows],
+        "collection_rate": [
+            round(r.paid_students / r.enrolled_students, 4) if r.enrolled_students else None
+            for r in rows
+        ],
+    }
+
+
+def main():
+    if sys.argv[1:] != ["rebuild"]:
+        print("Uso: python -m app.services.rollups rebuild")
+        sys.exit(2)
+    from ..logs import setup_logging
+    setup_logging()
+    from ..database import Base, engine, SessionLocal
+    from .archive import ensure_views
+
+    Base.metadata.create_all(bind=engine)
+    ensure_views(engine)
+    db = SessionLocal()
+    try:
+        log.info("Filas generadas: %d", rebuild(db))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# app/services/roster.py
+"""
+Padrón en memoria en columnas: alumnos, inscripciones y cuotas de talleres.
+
+La búsqueda del landing, la facturación y los resúmenes leían por el ORM
+las mismas miles de filas en cada request. Acá quedan en arrays de NumPy
+(ids, pagado sí/no, alumno/taller de cada inscripción, cuota de cada taller)
+y el texto de búsqueda en un único string, con un array de offsets para
+saber a qué alumno cae cada posición. Son unas decenas de bytes por alumno
+más su texto, en vez de un objeto del ORM por fila (ver nbytes()).
+
+  - search(): str.find sobre el texto en minúsculas + searchsorted de las
+    posiciones a filas.
+  - subtotals(): la cuota de cada inscripción sumada por alumno con
+    np.bincount, para todos los alumnos de una vez.
+  - summary(): pagados / no pagados, opcionalmente dentro de un taller.
+
+Un Roster no se modifica: cada cambio arma uno nuevo y se reemplaza la
+referencia, así quien lo está leyendo no ve un estado a medias.
+
+RosterCache.get(db) lo mantiene al día:
+  - si las versiones (data_versions) de students / courses / enrollments /
+    change_log no cambiaron, devuelve el mismo (una consulta chica);
+  - si cambiaron, pide a changefeed lo escrito desde la última versión del
+    feed (las escrituras de crud lo anotan al confirmar) y aplica sólo esas
+    filas;
+  - si el feed no alcanza (reset: compactado o demasiados cambios) o las
+    tablas cambiaron sin que avance el feed (escrituras que no pasan por
+    crud), lo arma de nuevo desde la DB.
+
+numpy se importa al primer uso (no entra en el import de la app).
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import Course, Enrollment, Student
+from . import changefeed, versions
+from .. import tenants
+
+MAX_TENANT_ENTRIES = 64
+
+TABLES = ("students", "courses", "enrollments", "change_log")
+
+FIELD_SEP = "\x00"   # entre campos de un alumno
+ROW_SEP   = "\x01"   # entre alumnos
+
+
+class StudentRow(NamedTuple):
+    id: int
+    name: str
+    dni: str
+    email: str
+    status: str
+
+
+def _text(name, dni, email, status) -> str:
+    return FIELD_SEP.join((name or "", dni or "", email or "", status or ""))
+
+
+def _joined(texts: List[str]):
+    """
+    Une los textos con ROW_SEP y devuelve (texto, offsets): la fila i ocupa
+    texto[offsets[i]:offsets[i + 1] - 1].
+    """
+    import numpy as np
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(t) + 1 for t in texts], out=offsets[1:])
+    return ROW_SEP.join(texts) + ROW_SEP, offsets
+
+
+class Roster:
+    __slots__ = ("ids", "paid", "text", "offsets", "folded", "folded_offsets",
+                 "enr_ids", "enr_student", "enr_course",
+                 "course_ids", "course_fees", "course_titles")
+
+    def __init__(self, students: Iterable[tuple], enrollments: Iterable[tuple], courses: Iterable[tuple]):
+        """
+        students: (id, name, dni, email, status, pagado), enrollments:
+        (id, student_id, course_id), courses: (id, title, monthly_fee).
+        """
+        import numpy as np
+
+        students = sorted(students, key=lambda s: s[0])
+        enrollments = sorted(enrollments, key=lambda e: e[0])
+        courses = sorted(courses, key=lambda c: c[0])
+
+        self.ids  = np.fromiter((s[0] for s in students), dtype=np.int64, count=len(students))
+        self.paid = np.fromiter((bool(s[5]) for s in students), dtype=np.bool_, count=len(students))
+        texts = [_text(*s[1:5]) for s in students]
+        self.text, self.offsets = _joined(texts)
+        # lower() puede cambiar el largo de algunos caracteres: offsets propios
+        self.folded, self.folded_offsets = _joined([t.lower() for t in texts])
+
+        self.enr_ids     = np.array([e[0] for e in enrollments], dtype=np.int64)
+        self.enr_student = np.array([e[1] for e in enrollments], dtype=np.int64)
+        self.enr_course  = np.array([e[2] for e in enrollments], dtype=np.int64)
+
+        self.course_ids    = np.array([c[0] for c in courses], dtype=np.int64)
+        self.course_fees   = np.array([c[2] or 0.0 for c in courses], dtype=np.float64)
+        self.course_titles = tuple(c[1] for c in courses)
+
+    # -------- Armado / cambios --------
+    @classmethod
+    def load(cls, db: Session) -> "Roster":
+        return cls(
+            db.execute(select(Student.id, Student.name, Student.dni, Student.email, Student.status,
+                              Student.last_paid_date.isnot(None))).all(),
+            db.execute(select(Enrollment.id, Enrollment.student_id, Enrollment.course_id)).all(),
+            db.execute(select(Course.id, Course.title, Course.monthly_fee)).all(),
+        )
+
+    def rows(self) -> List[tuple]:
+        """
+        Alumnos como tuplas (id, name, dni, email, status, pagado).
+        """
+        texts = self.text.split(ROW_SEP)[:-1]
+        return [(int(i), *t.split(FIELD_SEP), bool(p))
+                for i, t, p in zip(self.ids.tolist(), texts, self.paid.tolist())]
+
+    def apply(self, changes: Dict[str, dict]) -> "Roster":
+        """
+        Roster nuevo con los cambios de changefeed.changes_since() aplicados
+        (filas actuales de lo modificado e ids de lo borrado).
+        """
+        def merge(current: List[tuple], entity: str, as_tuple) -> List[tuple]:
+            change = changes.get(entity)
+            if not change:
+                return current
+            by_id = {row[0]: row for row in current}
+            for i in change["delete"]:
+                by_id.pop(i, None)
+            for row in change["upsert"]:
+                by_id[row["id"]] = as_tuple(row)
+            return list(by_id.values())
+
+        students = merge(self.rows(), "students", lambda r: (
+            r["id"], r["name"], r["dni"], r["email"], r["status"], r["last_paid_date"] is not None))
+        enrollments = merge(
+            list(zip(self.enr_ids.tolist(), self.enr_student.tolist(), self.enr_course.tolist())),
+            "enrollments", lambda r: (r["id"], r["student_id"], r["course_id"]))
+        courses = merge(
+            list(zip(self.course_ids.tolist(), self.course_titles, self.course_fees.tolist())),
+            "courses", lambda r: (r["id"], r["title"], r["monthly_fee"]))
+        return Roster(students, enrollments, courses)
+
+    # -------- Consultas --------
+    def __len__(self):
+        return len(self.ids)
+
+    def _row(self, pos: int) -> StudentRow:
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1]) - 1
+        return StudentRow(int(self.ids[pos]), *self.text[start:end].split(FIELD_SEP))
+
+    def position(self, student_id: int) -> Optional[int]:
+        import numpy as np
+
+        pos = int(np.searchsorted(self.ids, student_id))
+        return pos if pos < len(self.ids) and self.ids[pos] == student_id else None
+
+    def get(self, student_id: int) -> Optional[StudentRow]:
+        pos = self.position(student_id)
+        return None if pos is None else self._row(pos)
+
+    def search(self, term: str) -> List[StudentRow]:
+        """
+        Alumnos con `term` (sin distinguir mayúsculas) en el nombre, DNI,
+        email o estado, ordenados por id.
+        """
+        import numpy as np
+
+        q = term.strip().lower().replace(FIELD_SEP, "").replace(ROW_SEP, "")
+        if not q:
+            return []
+        hits, find, start = [], self.folded.find, 0
+        while True:
+            at = find(q, start)
+            if at < 0:
+                break
+            pos = int(np.searchsorted(self.folded_offsets, at, side="right")) - 1
+            hits.append(pos)
+            start = int(self.folded_offsets[pos + 1])   # un solo resultado por alumno
+        return [self._row(pos) for pos in hits]
+
+    def _enrollment_positions(self):
+        """
+        (posición del alumno, posición del taller) de cada inscripción cuyo
+        alumno y taller existen.
+        """
+        import numpy as np
+
+        spos = np.searchsorted(self.ids, self.enr_student)
+        cpos = np.searchsorted(self.course_ids, self.enr_course)
+        spos_c = np.minimum(spos, max(len(self.ids) - 1, 0))
+        cpos_c = np.minimum(cpos, max(len(self.course_ids) - 1, 0))
+        ok = (spos < len(self.ids)) & (cpos < len(self.course_ids))
+        if len(self.ids) and len(self.course_ids):
+            ok &= (self.ids[spos_c] == self.enr_student) & (self.course_ids[cpos_c] == self.enr_course)
+        return spos[ok], cpos[ok]
+
+    def subtotals(self):
+        """
+        Suma de cuotas de los talleres de cada alumno (array alineado con ids).
+        """
+        import numpy as np
+
+        spos, cpos = self._enrollment_positions()
+        return np.bincount(spos, weights=self.course_fees[cpos], minlength=len(self.ids))
+
+    def courses_of(self, student_id: int) -> List[Tuple[str, float]]:
+        """
+        (título, cuota) de cada taller en que está inscripto el alumno.
+        """
+        import numpy as np
+
+        cpos = np.searchsorted(self.course_ids, self.enr_course[self.enr_student == student_id])
+        cpos = cpos[cpos < len(self.course_ids)]
+        return [(self.course_titles[p], float(self.course_fees[p])) for p in cpos.tolist()]
+
+    def summary(self, course_id: Optional[int] = None) -> Dict[str, int]:
+        """
+        Igual que crud.get_payments_summary: alumnos pagados / no pagados.
+        """
+        import numpy as np
+
+        paid = self.paid
+        if course_id is not None:
+            paid = paid[np.isin(self.ids, self.enr_student[self.enr_course == course_id])]
+        n_paid = int(np.count_nonzero(paid))
+        return {"paid": n_paid, "unpaid": len(paid) - n_paid}
+
+    def nbytes(self) -> Dict[str, int]:
+        """
+        Memoria aproximada: arrays numéricos y texto (string ASCII/latin-1:
+        1 byte por caracter; más si hay otros caracteres).
+        """
+        arrays = sum(getattr(self, f).nbytes for f in (
+            "ids", "paid", "offsets", "folded_offsets", "enr_ids", "enr_student", "enr_course",
+            "course_ids", "course_fees"))
+        text = len(self.text) + len(self.folded)
+        n = max(len(self.ids), 1)
+        return {"students": len(self.ids), "enrollments": len(self.enr_ids),
+                "arrays": arrays, "text": text,
+                "per_student": round((arrays + text) / n, 1),
+                "per_student_arrays": round(arrays / n, 1)}
+
+
+class RosterCache:
+    """
+    Un Roster por tenant (LRU de MAX_TENANT_ENTRIES), al día con la DB.
+    """
+
+    name = "roster"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # tenant -> (versiones, versión del feed, roster)
+        self.entries: "OrderedDict[Optional[str], Tuple[Dict[str, int], int, Roster]]" = OrderedDict()
+        self.loads = 0
+        self.patches = 0
+
+    def get(self, db: Session) -> Roster:
+        key = tenants.current_tenant.get()
+        current = versions.get_versions(db, TABLES)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == current:
+            return entry[2]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != current:
+                entry = self._refresh(db, current, entry)
+                self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > MAX_TENANT_ENTRIES:
+                self.entries.popitem(last=False)
+        return entry[2]
+
+    def _refresh(self, db: Session, current: Dict[str, int], entry) -> tuple:
+        # El feed sólo avanza con escrituras anotadas; si las tablas cambiaron
+        # y el feed no, hubo una escritura por fuera de crud: se recarga todo.
+        if entry is not None and current.get("change_log") != entry[0].get("change_log"):
+            out = changefeed.changes_since(db, entry[1])
+            if not out["reset"]:
+                self.patches += 1
+                roster = entry[2].apply(out["changes"]) if out["changes"] else entry[2]
+                return current, out["version"], roster
+        # La versión del feed se lee antes que las filas: lo que se confirme
+        # entre medio se vuelve a aplicar (es idempotente) en vez de perderse
+        feed_version = changefeed.current_version(db)
+        self.loads += 1
+        return current, feed_version, Roster.load(db)
+
+    def stats(self) -> dict:
+        entry = self.entries.get(None)
+        return {"entries": len(self.entries), "loads": self.loads, "patches": self.patches,
+                "version": entry[0] if entry else None,
+                "memory": entry[2].nbytes() if entry else None}
+
+
+cache = RosterCache()
@@ -0,0 +1,74 @@
+# app/services/versions.py
+"""
+Versiones de datos por tabla para GET condicionales.
+
+Cada escritura de crud llama a bump(db, "students", ...) dentro de su
+transacción. Las APIs de admin arman un ETag fuerte con las versiones de
+las tablas que leen + los parámetros de la consulta (+ el tenant: cada
+academia tiene sus propios contadores), y responden 304 Not Modified si el
+cliente ya tiene esa versión (If-None-Match).
+"""
+
+import hashlib
+from typing import Dict, Iterable
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import crud, tenants
+from ..models import DataVersion
+from . import events
+
+
+def bump(db: Session, *tables: str):
+    """
+    Incrementa la versión de cada tabla. No hace commit (va en la
+    transacción de la escritura).
+    """
+    for table in tables:
+        stmt = crud.dialect_insert(db, DataVersion).values(table_name=table, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["table_name"],
+            set_={"version": DataVersion.version + 1}
+        )
+        db.execute(stmt)
+    events.note_bump(db, tables)   # avisos en vivo al confirmar (services/events.py)
+
+
+def get_versions(db: Session, tables: Iterable[str]) -> Dict[str, int]:
+    tables = sorted(set(tables))
+    rows = dict(db.execute(
+        select(DataVersion.table_name, DataVersion.version)
+        .where(DataVersion.table_name.in_(tables))
+    ).all())
+    return {t: rows.get(t, 0) for t in tables}
+
+
+def make_etag(versions: Dict[str, int], *parts) -> str:
+    """
+    ETag fuerte a partir de las versiones y de los parámetros de la respuesta.
+    Incluye el tenant: dos academias con los mismos contadores no comparten ETag.
+    """
+    raw = "|".join([f"tenant:{tenants.current_tenant.get()}"]
+                   + [f"{t}:{v}" for t, v in sorted(versions.items())] + [repr(p) for p in parts])
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def not_modified(request: Request, etag: str):
+    """
+    Devuelve una respuesta 304 si If-None-Match coincide con `etag`, o None.
+    """
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+        return Response(status_code=304, headers=cache_headers(etag))
+    return None
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    # no-cache: el navegador guarda la respuesta pero revalida siempre con el ETag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if tenants.TENANT_MODE == "path":
+        # Misma URL /admin/api/... para todas las academias: el tenant sale de la cookie
+        headers["Vary"] = "Cookie"
+    return headers
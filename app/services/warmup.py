@@ -0,0 +1,150 @@
+# app/services/warmup.py
+"""
+Fase de calentamiento al arrancar y chequeos para las probes.
+
+start() corre en un hilo (el puerto abre enseguida) los pasos:
+  1) abrir las conexiones del pool (primario y réplicas) con un SELECT 1,
+  2) compilar todas las plantillas Jinja,
+  3) precargar los caches calientes (hotcache: talleres, padrón en columnas).
+Hasta que termina, /readyz responde 503.
+
+readiness() es lo que mira /readyz: calentamiento terminado, latencia de un
+SELECT 1 por debajo de READY_MAX_DB_MS y uso del pool por debajo de
+READY_MAX_POOL_USAGE.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from sqlalchemy import text
+
+log = logging.getLogger(__name__)
+
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "0"))   # 0 = tamaño del pool
+READY_MAX_DB_MS       = float(os.getenv("READY_MAX_DB_MS", "500"))
+READY_MAX_POOL_USAGE  = float(os.getenv("READY_MAX_POOL_USAGE", "0.9"))
+
+STARTED_AT = time.time()
+
+state = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},
+    "errors": {},
+}
+
+
+def pool_status(engine) -> Dict[str, float]:
+    """
+    Conexiones en uso vs. capacidad (size + max_overflow) del pool; los
+    pools sin tamaño (NullPool/StaticPool) reportan sólo el tipo.
+    """
+    pool = engine.pool
+    out = {"pool": type(pool).__name__}
+    if not hasattr(pool, "size"):
+        return out
+    overflow = getattr(pool, "_max_overflow", 0)
+    capacity = pool.size() + max(overflow, 0)
+    out.update(size=pool.size(), max_overflow=overflow, checked_out=pool.checkedout(),
+               usage=round(pool.checkedout() / capacity, 3) if capacity else 0.0)
+    return out
+
+
+def warm_pool(engine) -> int:
+    """
+    Abre a la vez N conexiones del pool (SELECT 1) y las devuelve: quedan
+    establecidas para los primeros requests.
+    """
+    n = WARMUP_DB_CONNECTIONS or (engine.pool.size() if hasattr(engine.pool, "size") else 1)
+    conns = []
+    try:
+        for _ in range(n):
+            conn = engine.connect()
+            conns.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+def compile_templates() -> int:
+    from ..deps import LazyTemplates
+
+    env = LazyTemplates(directory="app/templates").env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def prime_caches() -> dict:
+    from ..database import SessionLocal
+    from . import hotcache
+
+    db = SessionLocal()
+    try:
+        hotcache.prime(db)
+    finally:
+        db.close()
+    return hotcache.stats()
+
+
+def run():
+    from ..database import engine, replicas
+
+    state["started_at"] = time.time()
+    steps = [
+        ("db_pool", lambda: {"primary": warm_pool(engine),
+                             "replicas": [warm_pool(e) for e in replicas.engines]}),
+        ("templates", compile_templates),
+        ("caches", prime_caches),
+    ]
+    for name, step in steps:
+        t0 = time.perf_counter()
+        try:
+            result = step()
+            state["steps"][name] = {"ms": round((time.perf_counter() - t0) * 1000, 1), "result": result}
+        except Exception as exc:
+            state["errors"][name] = repr(exc)
+            log.exception("Falló el paso de calentamiento %s", name)
+    state["finished_at"] = time.time()
+    state["ready"] = True
+    log.info("Calentamiento terminado", extra={"steps": state["steps"], "errors": state["errors"]})
+
+
+def start() -> threading.Thread:
+    t = threading.Thread(target=run, name="warmup", daemon=True)
+    t.start()
+    return t
+
+
+def db_latency_ms(engine) -> float:
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return (time.perf_counter() - t0) * 1000
+
+
+def readiness(engine) -> Tuple[bool, dict]:
+    checks = {"warmup": state["ready"]}
+    body = {"uptime_s": round(time.time() - STARTED_AT, 1)}
+
+    body["pool"] = pool = pool_status(engine)   # antes de tomar la conexión del chequeo
+    checks["pool"] = pool.get("usage", 0.0) < READY_MAX_POOL_USAGE
+    try:
+        body["db_ms"] = round(db_latency_ms(engine), 2)
+        checks["db"] = body["db_ms"] <= READY_MAX_DB_MS
+    except Exception as exc:
+        body["db_error"] = repr(exc)
+        checks["db"] = False
+
+    ok = all(checks.values())
+    body.update(status="ready" if ok else "not_ready", checks=checks)
+    if state["errors"]:
+        body["warmup_errors"] = state["errors"]
+    return ok, body
@@ -0,0 +1,324 @@
+# app/tenants.py
+"""
+Modo multi-academia: una base de datos por academia (tenant).
+
+Se activa con TENANT_MODE:
+  - "host": el tenant sale del Host. Primero TENANT_HOSTS
+    ("pagos.acme.com=acme,..."); si no está, el primer label de un
+    subdominio de TENANT_BASE_DOMAIN (acme.almapaid.com -> acme).
+  - "path": el tenant es el prefijo /t/<tenant>/... (se quita antes de
+    rutear). Se recuerda en la cookie "tenant", así los links absolutos de
+    las plantillas (/admin, /login, ...) siguen en la misma academia.
+
+Cada tenant es un archivo sqlite (TENANT_DB_DIR/<tenant>.db) o, si se
+configura TENANT_PG_URL, un schema de Postgres (tenant_<tenant>, vía
+search_path). Los engines viven en un cache LRU:
+  - como mucho TENANT_MAX_ENGINES abiertos, cada uno con un pool chico
+    (TENANT_POOL_SIZE + TENANT_MAX_OVERFLOW), así el total de conexiones y
+    de descriptores de archivo queda acotado;
+  - los que no se usan hace más de TENANT_IDLE_SECONDS se cierran (dispose).
+
+Un tenant existe si está en TENANTS (lista permitida; se crea al primer
+uso) o, sin lista, si ya existe su archivo / schema. Para crear uno:
+
+    python -m app.tenants create acme
+    python -m app.tenants list
+"""
+
+import contextvars
+import logging
+import os
+import pathlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, text
+
+from .database import BASE_DIR, Base, engine_options
+
+log = logging.getLogger(__name__)
+
+TENANT_MODE         = os.getenv("TENANT_MODE", "").lower()      # "", "host" o "path"
+TENANTS             = [t.strip() for t in os.getenv("TENANTS", "").split(",") if t.strip()]
+TENANT_HOSTS        = dict(p.split("=", 1) for p in os.getenv("TENANT_HOSTS", "").split(",") if "=" in p)
+TENANT_BASE_DOMAIN  = os.getenv("TENANT_BASE_DOMAIN", "").lower().lstrip(".")
+TENANT_PATH_PREFIX  = "/t/"
+TENANT_DB_DIR       = pathlib.Path(os.getenv("TENANT_DB_DIR", str(BASE_DIR / "tenants")))
+TENANT_PG_URL       = os.getenv("TENANT_PG_URL", "").strip()
+TENANT_MAX_ENGINES  = int(os.getenv("TENANT_MAX_ENGINES", "32"))
+TENANT_IDLE_SECONDS = float(os.getenv("TENANT_IDLE_SECONDS", "600"))
+TENANT_POOL_SIZE    = int(os.getenv("TENANT_POOL_SIZE", "2"))
+TENANT_MAX_OVERFLOW = int(os.getenv("TENANT_MAX_OVERFLOW", "3"))
+
+# Rutas que responden sin tenant (probes y estáticos)
+TENANT_OPTIONAL_PATHS = ("/static/", "/healthz", "/readyz")
+
+SLUG_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+
+current_tenant: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("tenant", default=None)
+
+
+def enabled() -> bool:
+    return TENANT_MODE in ("host", "path")
+
+
+def schema_for(slug: str) -> str:
+    return "tenant_" + slug.replace("-", "_")
+
+
+def url_for(slug: str) -> str:
+    if TENANT_PG_URL:
+        return TENANT_PG_URL
+    return f"sqlite:///{TENANT_DB_DIR / (slug + '.db')}"
+
+
+_schemas_seen = {"at": 0.0, "names": set()}
+
+
+def exists(slug: str) -> bool:
+    if not SLUG_RE.match(slug or ""):
+        return False
+    if TENANTS:
+        return slug in TENANTS
+    if slug in engines.engines:
+        return True
+    if TENANT_PG_URL:
+        # La lista de schemas se relee como mucho una vez por minuto
+        if time.monotonic() - _schemas_seen["at"] > 60:
+            _schemas_seen.update(at=time.monotonic(), names=set(list_tenants()))
+        return slug in _schemas_seen["names"]
+    return (TENANT_DB_DIR / f"{slug}.db").is_file()
+
+
+def _create_engine(slug: str):
+    url = url_for(slug)
+    opts = engine_options(url)
+    opts.update(pool_size=TENANT_POOL_SIZE, max_overflow=TENANT_MAX_OVERFLOW,
+                pool_pre_ping=True)
+    if TENANT_PG_URL:
+        opts["connect_args"] = {"options": f"-csearch_path={schema_for(slug)}"}
+    else:
+        TENANT_DB_DIR.mkdir(parents=True, exist_ok=True)
+    eng = create_engine(url, **opts)
+    provision(eng, slug)
+    return eng
+
+
+def provision(eng, slug: str):
+    """
+    Crea (si faltan) el schema, las tablas y las vistas del tenant.
+    """
+    from .services.archive import ensure_views
+
+    if TENANT_PG_URL:
+        with eng.begin() as conn:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_for(slug)}"'))
+    Base.metadata.create_all(bind=eng)
+    ensure_views(eng)
+
+
+class EngineCache:
+    """
+    LRU de engines por tenant con desalojo por inactividad.
+    """
+
+    def __init__(self, max_engines: int, idle_seconds: float):
+        self.max_engines = max_engines
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.engines: "OrderedDict[str, list]" = OrderedDict()   # slug -> [engine, last_used]
+        self.created = 0
+        self.evicted = 0
+
+    def get(self, slug: str):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.engines.get(slug)
+            if entry is not None:
+                entry[1] = now
+                self.engines.move_to_end(slug)
+                eng = entry[0]
+            else:
+                eng = None
+            stale = self._collect(now)
+        self._dispose(stale)
+        if eng is not None:
+            return eng
+
+        # Crear fuera del lock (create_all puede tardar); si otro hilo ganó, usar el suyo
+        new = _create_engine(slug)
+        with self.lock:
+            entry = self.engines.get(slug)
+            if entry is None:
+                self.engines[slug] = entry = [new, time.monotonic()]
+                self.created += 1
+                new = None
+            stale = self._collect(time.monotonic())
+        if new is not None:
+            new.dispose()
+        self._dispose(stale)
+        return entry[0]
+
+    def _collect(self, now: float):
+        """
+        Saca del cache (con el lock tomado) los inactivos y los que exceden
+        el máximo; se cierran después, fuera del lock.
+        """
+        stale = []
+        for slug, (eng, last_used) in list(self.engines.items()):
+            if now - last_used > self.idle_seconds:
+                stale.append((slug, self.engines.pop(slug)[0]))
+        while len(self.engines) > self.max_engines:
+            slug, (eng, _) = self.engines.popitem(last=False)
+            stale.append((slug, eng))
+        self.evicted += len(stale)
+        return stale
+
+    def _dispose(self, stale):
+        # dispose() cierra las conexiones libres; las que estén en uso se
+        # cierran al devolverse
+        for slug, eng in stale:
+            eng.dispose()
+            log.info("Engine de tenant cerrado", extra={"tenant": slug})
+
+    def evict_idle(self):
+        with self.lock:
+            stale = self._collect(time.monotonic())
+        self._dispose(stale)
+
+    def stats(self) -> Dict[str, object]:
+        with self.lock:
+            open_conns = sum(e.pool.checkedout() for e, _ in self.engines.values()
+                             if hasattr(e.pool, "checkedout"))
+            return {"engines": len(self.engines), "max_engines": self.max_engines,
+                    "checked_out": open_conns, "created": self.created, "evicted": self.evicted}
+
+
+engines = EngineCache(TENANT_MAX_ENGINES, TENANT_IDLE_SECONDS)
+
+
+def engine_for_current():
+    """
+    Engine del tenant del request, o None si no hay tenant resuelto.
+    """
+    slug = current_tenant.get()
+    return engines.get(slug) if slug else None
+
+
+def list_tenants():
+    if TENANT_PG_URL:
+        eng = create_engine(TENANT_PG_URL, **engine_options(TENANT_PG_URL))
+        try:
+            with eng.connect() as conn:
+                names = conn.execute(text(
+                    "SELECT schema_name FROM information_schema.schemata "
+                    "WHERE schema_name LIKE 'tenant\\_%'"
+                )).scalars().all()
+        finally:
+            eng.dispose()
+        return sorted(n[len("tenant_"):] for n in names)
+    return sorted(p.stem for p in TENANT_DB_DIR.glob("*.db"))
+
+
+# -------- Resolución del tenant --------
+def tenant_from_host(host: str) -> Optional[str]:
+    host = host.split(":", 1)[0].lower()
+    if host in TENANT_HOSTS:
+        return TENANT_HOSTS[host]
+    if TENANT_BASE_DOMAIN and host.endswith("." + TENANT_BASE_DOMAIN):
+        label = host[: -len(TENANT_BASE_DOMAIN) - 1]
+        return label if "." not in label else None
+    return None
+
+
+class TenantMiddleware:
+    """
+    Middleware ASGI: resuelve el tenant, lo deja en `current_tenant` y en
+    request.state.tenant, y responde 404 si no existe.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled():
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        path = scope["path"]
+        slug = None
+        set_cookie = None
+        if TENANT_MODE == "host":
+            slug = tenant_from_host(headers.get(b"host", b"").decode("latin-1"))
+        else:
+            if path.startswith(TENANT_PATH_PREFIX):
+                slug, _, rest = path[len(TENANT_PATH_PREFIX):].partition("/")
+                prefix = TENANT_PATH_PREFIX + slug
+                scope = dict(scope, path="/" + rest,
+                             root_path=scope.get("root_path", "") + prefix)
+                set_cookie = slug
+            else:
+                slug = _cookie(headers.get(b"cookie", b"").decode("latin-1"), "tenant")
+
+        if slug and not exists(slug):
+            slug = None
+        if slug is None and not scope["path"].startswith(TENANT_OPTIONAL_PATHS):
+            await _not_found(send)
+            return
+
+        scope.setdefault("state", {})["tenant"] = slug
+        token = current_tenant.set(slug)
+
+        async def send_wrapper(message):
+            if set_cookie and slug and message["type"] == "http.response.start":
+                cookie = f"tenant={slug}; Path=/; SameSite=Lax; HttpOnly".encode()
+                message = {**message, "headers": list(message.get("headers") or []) + [(b"set-cookie", cookie)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_tenant.reset(token)
+
+
+def _cookie(raw: str, name: str) -> Optional[str]:
+    for part in raw.split(";"):
+        k, _, v = part.strip().partition("=")
+        if k == name:
+            return v
+    return None
+
+
+async def _not_found(send):
+    body = b'{"detail":"Academia no encontrada"}'
+    await send({"type": "http.response.start", "status": 404,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def main():
+    import sys
+
+    from .logs import setup_logging
+    setup_logging()
+
+    if len(sys.argv) == 3 and sys.argv[1] == "create":
+        slug = sys.argv[2]
+        if not SLUG_RE.match(slug):
+            raise SystemExit("Nombre inválido: minúsculas, números, - y _")
+        _create_engine(slug).dispose()
+        log.info("Tenant creado: %s", slug, extra={"url": url_for(slug) if not TENANT_PG_URL else schema_for(slug)})
+    elif sys.argv[1:] == ["list"]:
+        for slug in list_tenants():
+            print(slug)
+    else:
+        print("Uso: python -m app.tenants create NOMBRE | list")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
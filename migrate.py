@@ -1,19 +1,26 @@
 # migrate.py
 """
-Script mínimo y seguro que asegura que la columna `last_paid_date` exista en la tabla `students`.
-Idempotente: si la columna ya existe no hace nada.
-Hace backup del archivo sqlite antes de modificarlo.
+Script mínimo y seguro que asegura que la columna `last_paid_date` exista en la tabla `students`
+y que existan los índices de las consultas calientes.
+Idempotente: si la columna / los índices ya existen no hace nada.
+Hace backup online (comprimido, con retención) del archivo sqlite si el último
+tiene más de MIGRATE_BACKUP_MAX_AGE_HOURS, y siempre antes de reconstruir tablas.
 """
 
+import logging
 import os
-import shutil
-import datetime
-import traceback
-import pathlib
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.logs import setup_logging
+
+log = logging.getLogger("migrate")
+
+# Antigüedad máxima del último snapshot al arrancar: si es más nuevo no se
+# toma otro (el snapshot bloquea el arranque en proporción al tamaño de la DB)
+MIGRATE_BACKUP_MAX_AGE_HOURS = float(os.getenv("MIGRATE_BACKUP_MAX_AGE_HOURS", "24"))
+
 # Intentar importar la configuración SQLALCHEMY_DATABASE_URI y opciones
 try:
     from app.config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_ENGINE_OPTIONS
@@ -27,25 +34,32 @@ def get_engine():
     engine = create_engine(SQLALCHEMY_DATABASE_URI, **opts)
     return engine
 
-def backup_sqlite_if_file(engine):
+def backup_sqlite_if_file(engine, force=False):
+    """
+    Snapshot online (API de backup de sqlite, comprimido y con retención)
+    antes de migrar, sólo si el último es más viejo que
+    MIGRATE_BACKUP_MAX_AGE_HOURS (force=True: siempre). Ver
+    app/services/backup.py.
+    """
     try:
-        url = str(engine.url)
-        if url.startswith("sqlite:///") or url.startswith("sqlite:////"):
-            db_path = engine.url.database
-            if db_path and os.path.isfile(db_path):
-                ts = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-                p = pathlib.Path(db_path)
-                backup = p.with_name(p.name + f".backup.{ts}")
-                shutil.copy2(p, backup)
-                print(f"[migrate] Backup creado: {backup}")
-                return str(backup)
+        from app.services import backup
+        db_path = backup.sqlite_path_of(engine)
+        if db_path and os.path.isfile(db_path):
+            if force:
+                path = backup.snapshot(db_path)
             else:
-                print(f"[migrate] No existe archivo sqlite en: {db_path}")
+                path = backup.snapshot_if_due(db_path, MIGRATE_BACKUP_MAX_AGE_HOURS)
+            if path:
+                log.info("Backup creado: %s", path)
+            else:
+                log.info("Hay un backup reciente (< %sh); no se toma otro.", MIGRATE_BACKUP_MAX_AGE_HOURS)
+            return path
+        elif db_path:
+            log.info("No existe archivo sqlite en: %s", db_path)
         else:
-            print(f"[migrate] Engine no es sqlite (url={url}), no se hace backup de archivo).")
+            log.info("Engine no es sqlite (%s); no se hace backup de archivo.", engine.url.drivername)
     except Exception:
-        print("[migrate] Error creando backup:")
-        print(traceback.format_exc())
+        log.exception("Error creando backup")
     return None
 
 def pragma_table_info(conn, table_name):
@@ -58,29 +72,176 @@ def pragma_table_info(conn, table_name):
 
 def add_column_if_missing(conn, table_name, column_name, column_type_sql="TEXT"):
     existing = pragma_table_info(conn, table_name)
-    print(f"[migrate] Columnas existentes en `{table_name}`: {existing}")
+    log.debug("Columnas existentes en `%s`: %s", table_name, sorted(existing))
     if column_name in existing:
-        print(f"[migrate] La columna `{column_name}` ya existe en `{table_name}`. Nada que hacer.")
+        log.info("La columna `%s` ya existe en `%s`. Nada que hacer.", column_name, table_name)
         return False
     # construir SQL seguro y ejecutarlo
     sql = f'ALTER TABLE "{table_name}" ADD COLUMN "{column_name}" {column_type_sql};'
-    print(f"[migrate] Ejecutando: {sql}")
+    log.info("Ejecutando: %s", sql)
     try:
         conn.execute(text(sql))
-        print(f"[migrate] Columna `{column_name}` agregada a `{table_name}` correctamente.")
+        log.info("Columna `%s` agregada a `%s` correctamente.", column_name, table_name)
         return True
     except Exception:
-        print(f"[migrate] ERROR al agregar columna `{column_name}` a `{table_name}`:")
-        print(traceback.format_exc())
+        log.exception("ERROR al agregar columna `%s` a `%s`", column_name, table_name)
         raise
 
-def main():
-    print("[migrate] Iniciando migrate.py")
-    engine = get_engine()
+# Índices de las consultas calientes (ver app/models.py). create_all no los
+# agrega a tablas que ya existen; acá se crean si faltan.
+INDEXES = [
+    ("ix_students_last_paid_date",    "students",    ["last_paid_date"]),
+    ("ix_enrollments_course_id",      "enrollments", ["course_id"]),
+    ("ix_payments_student_paid_date", "payments",    ["student_id", "paid_date"]),
+    ("ix_payments_paid_date",         "payments",    ["paid_date"]),
+    ("ix_payments_archive_paid_date", "payments_archive", ["paid_date"]),
+]
+
+def ensure_indexes(conn):
+    """
+    CREATE INDEX IF NOT EXISTS para cada índice de INDEXES cuya tabla exista
+    (si no existe, la crea create_all con sus índices). Devuelve los creados.
+    """
+    insp = inspect(conn)
+    created = []
+    for name, table, columns in INDEXES:
+        if not insp.has_table(table):
+            continue
+        if any(ix["name"] == name for ix in insp.get_indexes(table)):
+            continue
+        cols = ", ".join(f'"{c}"' for c in columns)
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({cols})'))
+        log.info("Índice creado: %s", name)
+        created.append(name)
+    return created
+
+# Tablas cuyos ids no se pueden reutilizar: el archivo guarda las filas con su
+# id original (app/services/archive.py); el id de change_log es la versión
+# del feed. En sqlite eso exige AUTOINCREMENT,
+# que create_all sólo pone al crear la tabla; las que ya existen sin él se
+# reconstruyen. tabla -> consultas cuyo resultado es piso de la secuencia.
+AUTOINCREMENT_TABLES = {
+    "students":    ["SELECT MAX(id) FROM students_archive"],
+    "enrollments": ["SELECT MAX(id) FROM enrollments_archive"],
+    "payments":    ["SELECT MAX(id) FROM payments_archive"],
+    "checkouts":   [],
+    # La versión del feed de cambios no puede volver por debajo del piso de
+    # la compactación (app/services/changefeed.py)
+    "change_log":  ["SELECT CAST(value AS INTEGER) FROM job_state WHERE key = 'changes.floor'"],
+}
+
+def _sequence_floor(cur, queries):
+    floor = 0
+    for sql in queries:
+        try:
+            value = cur.execute(sql).fetchone()[0]
+        except Exception:   # la tabla del piso todavía no existe
+            value = None
+        floor = max(floor, int(value or 0))
+    return floor
+
+def ensure_sqlite_autoincrement(engine):
+    """
+    Reconstruye con AUTOINCREMENT las tablas de AUTOINCREMENT_TABLES que no
+    lo tienen (CREATE nueva + INSERT ... SELECT + DROP + RENAME, en una
+    transacción) y sube su secuencia al piso. Sólo sqlite. Devuelve las
+    reconstruidas.
+    """
+    if engine.dialect.name != "sqlite":
+        return []
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    from app.database import Base
+    from app import models  # noqa: F401  (registra las tablas en Base)
+
+    rebuilt = []
+    raw = engine.raw_connection()
+    dbapi = raw.driver_connection
+    isolation = dbapi.isolation_level
+    dbapi.isolation_level = None   # BEGIN / COMMIT explícitos
+    cur = dbapi.cursor()
+    foreign_keys = cur.execute("PRAGMA foreign_keys").fetchone()[0]
     try:
-        print(f"[migrate] Engine URL: {engine.url}")
-    except Exception:
-        print("[migrate] Engine creada (no se pudo mostrar URL).")
+        for table_name, floors in AUTOINCREMENT_TABLES.items():
+            row = cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (table_name,)).fetchone()
+            if not row or "AUTOINCREMENT" in row[0].upper():
+                continue
+            table = Base.metadata.tables[table_name]
+            existing = {r[1] for r in cur.execute(f'PRAGMA table_info("{table_name}")')}
+            extra = existing - set(table.columns.keys())
+            if extra:
+                log.warning("`%s` tiene columnas fuera del modelo (%s); no se reconstruye.",
+                            table_name, sorted(extra))
+                continue
+            if not rebuilt and not backup_sqlite_if_file(engine, force=True):
+                log.warning("Sin backup; no se reconstruye `%s`.", table_name)
+                break
+            cols = ", ".join(f'"{c}"' for c in table.columns.keys() if c in existing)
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect)).strip()
+            ddl = ddl.replace(f"CREATE TABLE {table_name} ", f'CREATE TABLE "{table_name}__new" ', 1)
+
+            cur.execute("PRAGMA foreign_keys = OFF")
+            cur.execute("PRAGMA legacy_alter_table = ON")   # el RENAME no revalida las vistas
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(ddl)
+                cur.execute(f'INSERT INTO "{table_name}__new" ({cols}) SELECT {cols} FROM "{table_name}"')
+                cur.execute(f'DROP TABLE "{table_name}"')
+                cur.execute(f'ALTER TABLE "{table_name}__new" RENAME TO "{table_name}"')
+                for index in table.indexes:
+                    cur.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)))
+                floor = _sequence_floor(cur, floors)
+                seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table_name,)).fetchone()
+                if seq is None and floor:
+                    cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table_name, floor))
+                elif seq is not None and seq[0] < floor:
+                    cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (floor, table_name))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.execute("PRAGMA legacy_alter_table = OFF")
+                cur.execute(f"PRAGMA foreign_keys = {int(foreign_keys)}")
+            log.info("Tabla `%s` reconstruida con AUTOINCREMENT (piso de ids: %s).", table_name, floor)
+            rebuilt.append(table_name)
+    finally:
+        cur.close()
+        dbapi.isolation_level = isolation
+        raw.close()
+    return rebuilt
+
+# Columnas agregadas a tablas que ya existen (create_all no las agrega)
+COLUMNS = [
+    ("payment_links", "revision", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+def ensure_columns(conn):
+    """
+    ALTER TABLE ADD COLUMN para cada columna de COLUMNS que falte en una
+    tabla existente. Devuelve las agregadas.
+    """
+    insp = inspect(conn)
+    added = []
+    for table, column, ddl in COLUMNS:
+        if not insp.has_table(table):
+            continue
+        if column in {c["name"] for c in insp.get_columns(table)}:
+            continue
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}'))
+        log.info("Columna `%s` agregada a `%s`.", column, table)
+        added.append(f"{table}.{column}")
+    return added
+
+def main(engine=None):
+    """
+    `engine`: el de la app cuando main.py corre las migraciones en proceso;
+    si no se pasa, se crea uno desde la configuración.
+    """
+    setup_logging()
+    log.info("Iniciando migrate.py")
+    engine = engine or get_engine()
+    log.info("Engine creada", extra={"driver": engine.url.drivername, "database": engine.url.database})
 
     backup_sqlite_if_file(engine)
 
@@ -91,17 +252,22 @@ def main():
         try:
             added = add_column_if_missing(conn, table, col, column_type_sql="TEXT")
             if added:
-                print(f"[migrate] Migración: la columna `{col}` fue añadida.")
+                log.info("Migración: la columna `%s` fue añadida.", col)
             else:
-                print(f"[migrate] Migración: no hubo cambios para `{col}`.")
+                log.info("Migración: no hubo cambios para `%s`.", col)
         except SQLAlchemyError:
-            print("[migrate] Error SQL al intentar migración (ver arriba).")
+            log.error("Error SQL al intentar migración (ver arriba).")
             raise
         except Exception:
-            print("[migrate] Error inesperado (ver traza):")
-            print(traceback.format_exc())
+            log.exception("Error inesperado")
             raise
-    print("[migrate] Fin.")
+
+    ensure_sqlite_autoincrement(engine)
+
+    with engine.begin() as conn:
+        ensure_columns(conn)
+        ensure_indexes(conn)
+    log.info("Fin.")
 
 if __name__ == "__main__":
     main()
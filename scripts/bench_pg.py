@@ -0,0 +1,138 @@
+# scripts/bench_pg.py
+"""
+Benchmark del camino masivo de Postgres (app/services/pgbulk.py) contra el ORM.
+
+Sobre una base Postgres de prueba VACÍA (se crean y borran las tablas) mide,
+para N alumnos:
+
+  carga:   ORM (add_all + commit)  vs  INSERT executemany  vs  COPY FROM STDIN
+  lectura: ORM (query().all())     vs  cursor del servidor  vs  COPY TO STDOUT
+
+e imprime filas/s y el pico de memoria de Python (tracemalloc) de cada una.
+
+    docker run --rm -e POSTGRES_PASSWORD=pg -p 5432:5432 postgres:16
+    python scripts/bench_pg.py --pg postgresql://postgres:pg@localhost:5432/postgres [--rows 100000]
+
+Sin --pg corre contra un sqlite temporal (sólo ORM vs executemany vs
+cursor: COPY es de Postgres), útil para probar el script.
+"""
+
+import argparse
+import io
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def student_rows(n: int, offset: int = 0):
+    for i in range(offset + 1, offset + n + 1):
+        yield (f"Alumno {i:06d}", f"a{i}@example.com", str(30000000 + i), "activo" if i % 7 else "egresado")
+
+
+COLUMNS = ["name", "email", "dni", "status"]
+
+
+def measure(label: str, n: int, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:28} {elapsed:8.3f} s  {n / elapsed:12,.0f} filas/s  pico {peak / 2**20:8.1f} MiB")
+    return elapsed
+
+
+def run(url: str, n: int):
+    from sqlalchemy import create_engine, insert, text
+    from sqlalchemy.orm import sessionmaker
+
+    from app.database import Base, engine_options
+    from app.models import Student
+    from app.services import pgbulk
+
+    engine = create_engine(url, **engine_options(url))
+    is_pg = engine.dialect.name == "postgresql"
+    Session = sessionmaker(bind=engine, autoflush=False)
+    Base.metadata.create_all(bind=engine)
+
+    def truncate():
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM students"))
+
+    try:
+        print(f"Carga de {n:,} alumnos ({engine.dialect.name})")
+
+        def orm_load():
+            with Session() as db:
+                db.add_all(Student(**dict(zip(COLUMNS, r))) for r in student_rows(n))
+                db.commit()
+
+        def executemany_load():
+            with Session() as db:
+                db.execute(insert(Student), [dict(zip(COLUMNS, r)) for r in student_rows(n)])
+                db.commit()
+
+        def copy_load():
+            with Session() as db:
+                pgbulk.copy_in(db, "students", COLUMNS, student_rows(n))
+
+        results = {}
+        for label, fn in (("ORM add_all", orm_load), ("INSERT executemany", executemany_load),
+                          ("COPY FROM STDIN", copy_load)):
+            if label.startswith("COPY") and not is_pg:
+                continue
+            truncate()
+            results[label] = measure(label, n, fn)
+
+        print(f"Lectura de {n:,} alumnos")
+
+        def orm_read():
+            with Session() as db:
+                rows = db.query(Student).all()
+                sum(len(s.name) for s in rows)
+
+        def cursor_read():
+            with Session() as db:
+                total = 0
+                for rows in pgbulk.stream_rows(db, pgbulk.export_query("students")).partitions():
+                    total += len(rows)
+
+        def copy_read():
+            with Session() as db:
+                pgbulk.copy_out(db, pgbulk.export_query("students"), io.StringIO())
+
+        for label, fn in (("ORM query().all()", orm_read), ("cursor del servidor", cursor_read),
+                          ("COPY TO STDOUT" if is_pg else "csv sobre cursor", copy_read)):
+            results[label] = measure(label, n, fn)
+
+        base = results["ORM add_all"]
+        fastest = min(v for k, v in results.items() if k in ("INSERT executemany", "COPY FROM STDIN"))
+        print(f"\nCarga: {base / fastest:.1f}x más rápida que el ORM")
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark COPY / cursores del servidor vs ORM")
+    parser.add_argument("--pg", help="URL de una base Postgres de prueba (vacía)")
+    parser.add_argument("--rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # app.database arma su engine al importarse: que no toque la DB real
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmpdir}/app.db")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ.setdefault("AUDIT_ENABLED", "0")
+        run(args.pg or f"sqlite:///{tmpdir}/bench.db", args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# scripts/check_importtime.py
+"""
+Presupuesto de tiempo de import de la app (arranque en frío / spawn de workers).
+
+Importa app.main en un intérprete nuevo con `python -X importtime`, contra una
+DB sqlite temporal y sin migraciones, y falla (exit 1) si:
+  - el import acumulado de app.main supera el presupuesto (--budget-ms o
+    IMPORT_BUDGET_MS), tomando la mejor de --runs corridas, o
+  - se cargó alguna dependencia pesada que debe ser lazy (SDK de Mercado
+    Pago, requests, jinja2, aiosmtplib, numpy, multiprocessing).
+
+    python scripts/check_importtime.py [--budget-ms 1500] [--runs 3] [--top 15]
+"""
+
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Se cargan recién al primer uso (ver payments.get_sdk, mp_api._http,
+# deps.LazyTemplates, reminders._env, receipts.get_pool, roster)
+MUST_BE_LAZY = ("mercadopago", "requests", "jinja2", "aiosmtplib", "numpy", "multiprocessing")
+
+
+def measure(tmpdir: str):
+    """
+    Devuelve {módulo: (self_us, cumulative_us)} de un import de app.main.
+    """
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{tmpdir}/importtime.db",
+        "MIGRATE_ON_STARTUP": "0",
+        "BACKUP_INTERVAL_HOURS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit("No se pudo importar app.main")
+    mods = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        mods[name.strip()] = (int(self_us), int(cum_us))
+    return mods
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de import de app.main")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    best = None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for _ in range(args.runs):
+            mods = measure(tmpdir)
+            if best is None or mods["app.main"][1] < best["app.main"][1]:
+                best = mods
+
+    total_ms = best["app.main"][1] / 1000
+    print(f"app.main: {total_ms:.1f} ms acumulado (presupuesto {args.budget_ms:.0f} ms)")
+    print(f"\nTop {args.top} por tiempo propio:")
+    for name, (self_us, cum_us) in sorted(best.items(), key=lambda kv: -kv[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {cum_us / 1000:8.1f} ms  {name}")
+
+    eager = [m for m in MUST_BE_LAZY if m in best]
+    ok = total_ms <= args.budget_ms and not eager
+    if eager:
+        print(f"\nFALLA: se importan al arrancar (deben ser lazy): {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        print(f"\nFALLA: {total_ms:.1f} ms > {args.budget_ms:.0f} ms")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
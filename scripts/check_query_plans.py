@@ -0,0 +1,241 @@
+# scripts/check_query_plans.py
+"""
+Chequeo de planes de consulta: ninguna consulta caliente de crud debe caer
+en un recorrido completo de tabla.
+
+1) Crea una DB con datos generados (sqlite temporal, o --pg URL apuntando a
+   una base de prueba VACÍA: se crean y borran las tablas).
+2) Corre cada caso (funciones de crud y servicios) capturando el SQL real que
+   emite SQLAlchemy.
+3) Hace EXPLAIN QUERY PLAN (sqlite) / EXPLAIN (FORMAT JSON) con
+   enable_seqscan=off (Postgres) de cada sentencia y falla (exit 1) si
+   alguna recorre completa una tabla grande fuera de las permitidas del caso.
+
+    python scripts/check_query_plans.py [--students 3000] [--pg postgresql://...] [-v]
+
+La tabla courses es chica por diseño (decenas de filas): recorrerla está
+permitido en todos los casos.
+"""
+
+import argparse
+import datetime
+import os
+import pathlib
+import sys
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Tablas que se pueden recorrer siempre (chicas por diseño)
+ALWAYS_OK = {"courses", "data_versions", "job_state"}
+
+
+def build_dataset(engine, n_students: int):
+    from sqlalchemy import insert, text
+    from sqlalchemy.orm import Session
+
+    from app.database import Base
+    from app.models import Checkout, Course, Enrollment, Payment, PaymentLink, Student
+    from app.services import propagation
+    from app.services.archive import ensure_views
+
+    Base.metadata.create_all(bind=engine)
+    ensure_views(engine)
+    today = datetime.date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Course), [{"id": i, "title": f"Taller {i}", "monthly_fee": 10000 + i * 500}
+                                      for i in range(1, 21)])
+        conn.execute(insert(Student), [
+            {"id": i, "name": f"Alumno {i:05d}", "email": f"a{i}@example.com", "dni": str(30000000 + i),
+             "status": "activo" if i % 7 else "egresado",
+             "last_paid_date": today - datetime.timedelta(days=i % 90) if i % 3 else None}
+            for i in range(1, n_students + 1)
+        ])
+        conn.execute(insert(Enrollment), [
+            {"student_id": i, "course_id": (i + k * 7) % 20 + 1, "status": "activo"}
+            for i in range(1, n_students + 1) for k in range(2)
+        ])
+        conn.execute(insert(Payment), [
+            {"student_id": i, "amount": 15000.0, "paid_date": today - datetime.timedelta(days=30 * m + i % 28)}
+            for i in range(1, n_students + 1) for m in range(12) if (i + m) % 4
+        ])
+        conn.execute(insert(Checkout), [
+            {"student_id": i, "external_reference": f"{i}-ref", "amount": 15000.0,
+             "created_at": datetime.datetime.utcnow(), "status": "pending" if i % 10 == 0 else "approved"}
+            for i in range(1, n_students + 1)
+        ])
+        conn.execute(insert(PaymentLink), [
+            {"period": f"{today.year:04d}-{today.month:02d}", "student_id": i, "amount": 15000.0,
+             "external_reference": f"{i}-link", "status": "ready", "init_point": f"http://mp/{i}",
+             "created_at": datetime.datetime.utcnow()}
+            for i in range(1, n_students + 1)
+        ])
+    with Session(bind=engine) as db:
+        propagation.rebuild(db)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def cases(n: int):
+    """
+    (nombre, función(db), tablas que ese caso puede recorrer completas)
+    """
+    from app import crud, schemas
+    from app.services import changefeed, paylinks, receipts, rollups
+
+    today = datetime.date.today()
+    period = rollups.period_of(today)
+    sid = n // 2
+    return [
+        ("get_student",                   lambda db: crud.get_student(db, sid), set()),
+        ("get_courses_for_student",       lambda db: crud.get_courses_for_student(db, sid), set()),
+        ("calculate_due_for_student",     lambda db: crud.calculate_due_for_student(db, sid), set()),
+        ("get_payments_summary",          lambda db: crud.get_payments_summary(db), set()),
+        ("get_payments_summary(course)",  lambda db: crud.get_payments_summary(db, 3), set()),
+        ("search_students(course)",       lambda db: crud.search_students(db, course_id=3), set()),
+        ("search_students(paid=False)",   lambda db: crud.search_students(db, paid=False), set()),
+        ("search_students(course, paid)", lambda db: crud.search_students(db, course_id=3, paid=True), set()),
+        # ILIKE '%x%' no puede usar un índice b-tree: recorrido esperado
+        ("search_students(name)",         lambda db: crud.search_students(db, name="0012"), {"students"}),
+        ("select_student_ids(course)",    lambda db: db.execute(crud.select_student_ids(db, None, None, 3, None)).all(), set()),
+        ("get_checkout_by_reference",     lambda db: crud.get_checkout_by_reference(db, f"{sid}-ref"), set()),
+        ("list_pending_checkouts",        lambda db: crud.list_pending_checkouts(db), set()),
+        ("create_payment",                lambda db: crud.create_payment(db, schemas.PaymentCreate(
+                                              student_id=sid, amount=15000.0, paid_date=today)), set()),
+        ("record_checkout_payments",      lambda db: crud.record_checkout_payments(db, [{
+                                              "external_reference": f"{n // 10 * 10}-ref", "gateway_payment_id": "1",
+                                              "amount": 15000.0, "paid_date": today}]), set()),
+        ("bulk_mark_paid(course)",        lambda db: crud.bulk_mark_paid(
+                                              db, crud.select_student_ids(db, None, None, 5, None), today), set()),
+        ("receipts.statement_data",       lambda db: receipts.statement_data(db, sid, period), set()),
+        ("receipts.month_receipts_data",  lambda db: receipts.month_receipts_data(db, period), set()),
+        ("rollups.time_series",           lambda db: rollups.time_series(db), {"revenue_rollups"}),
+        ("changefeed.changes_since",      lambda db: changefeed.changes_since(db, 0), set()),
+        ("paylinks.ready_link",           lambda db: paylinks.ready_link(db, sid, period), set()),
+        # Propagación (services/propagation.py): sólo los alumnos afectados
+        ("update_course (propagación)",   lambda db: crud.update_course(db, schemas.CourseUpdate(
+                                              id=4, title="Taller 4", monthly_fee=12500.0)), set()),
+        ("create_enrollment (propagación)", lambda db: crud.create_enrollment(db, schemas.EnrollmentCreate(
+                                              student_id=sid, course_id=9)), set()),
+    ]
+
+
+def sqlite_scans(conn, statement, params):
+    from app.database import Base
+    from app.services.archive import views
+
+    real = set(Base.metadata.tables) | set(views.tables)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+    bad = []
+    for row in rows:
+        detail = row[-1]
+        if not detail.startswith("SCAN "):
+            continue
+        if "USING INDEX" in detail or "USING COVERING INDEX" in detail or "USING INTEGER PRIMARY KEY" in detail:
+            continue
+        table = detail.split()[1]
+        if table not in real:   # subconsultas / CTEs materializadas (anon_1, ...)
+            continue
+        bad.append((table, detail))
+    return bad
+
+
+def pg_scans(conn, statement, params):
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, params).scalar()
+    if isinstance(plan, str):
+        import json
+        plan = json.loads(plan)
+    bad = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            bad.append((node.get("Relation Name"), f"Seq Scan on {node.get('Relation Name')}"))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return bad
+
+
+def run(url: str, n: int, verbose: bool) -> int:
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+
+    from app.database import Base, engine_options
+
+    engine = create_engine(url, **engine_options(url))
+    is_pg = engine.dialect.name == "postgresql"
+    if is_pg:
+        @event.listens_for(engine, "connect")
+        def _no_seqscan(dbapi_conn, _):
+            cur = dbapi_conn.cursor()
+            cur.execute("SET enable_seqscan = off")
+            cur.close()
+
+    build_dataset(engine, n)
+    captured = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters))
+
+    Session = sessionmaker(bind=engine, autoflush=False)
+    failures = 0
+    try:
+        for name, fn, allowed in cases(n):
+            captured.clear()
+            db = Session()
+            try:
+                fn(db)
+            finally:
+                db.close()
+            statements = [(s, p) for s, p in captured
+                          if s.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "WITH", "INSERT")
+                          and ("SELECT" in s.upper() or "WHERE" in s.upper())]
+            problems = []
+            with engine.connect() as conn:
+                for statement, params in statements:
+                    scans = pg_scans(conn, statement, params) if is_pg else sqlite_scans(conn, statement, params)
+                    for table, detail in scans:
+                        if table not in ALWAYS_OK and table not in allowed:
+                            problems.append((detail, statement))
+            status = "FALLA" if problems else "ok"
+            print(f"[{status:5}] {name}  ({len(statements)} sentencias)")
+            for detail, statement in problems:
+                failures += 1
+                print(f"        {detail}\n        {' '.join(statement.split())[:200]}")
+            if verbose and not problems:
+                for statement, _ in statements:
+                    print(f"        {' '.join(statement.split())[:160]}")
+    finally:
+        if is_pg:
+            from sqlalchemy import text
+            with engine.begin() as conn:
+                conn.execute(text("DROP VIEW IF EXISTS payments_all, students_all"))
+            Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica que las consultas calientes usen índices")
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--pg", help="URL de una base Postgres de prueba (vacía)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        url = args.pg or f"sqlite:///{tmpdir}/plans.db"
+        # app.database arma su engine al importarse: que no toque la DB real
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmpdir}/app.db")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ.setdefault("AUDIT_ENABLED", "0")   # el audit log escribe fuera del caso medido
+        failures = run(url, args.students, args.verbose)
+    print(f"\n{'FALLA' if failures else 'OK'}: {failures} recorridos completos no permitidos")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()